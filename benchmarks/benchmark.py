@@ -0,0 +1,271 @@
+"""
+Offline benchmarks of the service.
+
+The benchmarks run on a synthetic qlib data directory and an in-process stand-in of MongoDB, so they need neither the real
+dataset nor a database server. There is no trained model either, so the model is replaced by a synthetic linear one.
+The timings of predicting cover the feature pipeline and the prediction store, but not the inference of LightGBM.
+
+Usage:
+    python benchmarks/benchmark.py [--stocks 300] [--days 250] [--predict-days 20] [--repeat 5] [--save-baseline]
+
+The results are compared with the baseline saved in benchmarks/baseline.json, which is overwritten with --save-baseline.
+"""
+import argparse
+import json
+import numpy as np
+import os
+import pandas as pd
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+import context
+import constants
+from fake_mongo import FakeMongoClient
+from synthetic_data import generate_qlib_data
+
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+
+# Script measuring the time from importing the app till the first request is served, in a fresh interpreter.
+FIRST_REQUEST_SCRIPT = """
+import time
+started_at = time.perf_counter()
+import sys
+from pathlib import Path
+sys.path.insert(0, {source_path!r})
+import constants
+constants.SNAPSHOT_PATH = Path({snapshot_path!r})
+import app
+app.app.test_client().get('/stock/list')
+print(time.perf_counter() - started_at)
+"""
+
+
+class SyntheticModel:
+    """
+    A linear model with fixed random weights, which stands in for the trained model.
+    """
+
+    def __init__(self, seed: int = 0) -> None:
+        self.random = np.random.default_rng(seed)
+        self.weights = None
+
+    def predict(self, dataset) -> pd.Series:
+        features = dataset.prepare('test', col_set='feature')
+        if self.weights is None:
+            self.weights = self.random.normal(0.0, 0.01, features.shape[1])
+        return pd.Series(np.nan_to_num(features.to_numpy()) @ self.weights, index=features.index)
+
+
+class SyntheticRecorder:
+    """
+    A recorder which stands in for the mlflow recorder of the trained model.
+    """
+
+    id = 'synthetic'
+
+    def load_object(self, name: str) -> SyntheticModel:
+        return SyntheticModel()
+
+
+class SyntheticRecorders:
+    """
+    A stand-in of qlib.workflow.R, which only gets the synthetic recorder.
+    """
+
+    def get_recorder(self, experiment_name: str = None, recorder_name: str = None) -> SyntheticRecorder:
+        return SyntheticRecorder()
+
+
+def measure(function: Callable, repeat: int = 1, calls: int = 1, setup: Optional[Callable] = None) -> Dict[str, float]:
+    """
+    Measure the wall time of the function.
+
+    Args:
+        function: The function to measure.
+        repeat: The number of times to run the function.
+        calls: The number of calls made by each run of the function. The timings are divided by it to get the time per call.
+        setup: The function to run before each run, which is not measured.
+
+    Returns:
+        The median and the minimum time per call in milliseconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) / calls * 1000)
+    return {'median_ms': round(statistics.median(durations), 6), 'min_ms': round(min(durations), 6), 'repeat': repeat, 'calls': calls}
+
+
+def time_to_first_request(snapshot_path: Path, repeat: int) -> Dict[str, float]:
+    """
+    Measure the time to first request of the app serving the saved snapshot read-only, as the production server does.
+
+    Each run starts a new interpreter, and the time to start the interpreter is not included.
+    """
+    script = FIRST_REQUEST_SCRIPT.format(source_path=str(Path(context.__file__).resolve().parents[1] / 'stock_predictor'), snapshot_path=str(snapshot_path))
+    durations = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', script],
+            env={**os.environ, 'STOCK_PREDICTOR_READ_ONLY': '1'},
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        durations.append(float(output.strip().splitlines()[-1]) * 1000)
+    return {'median_ms': round(statistics.median(durations), 6), 'min_ms': round(min(durations), 6), 'repeat': repeat, 'calls': 1}
+
+
+def run_database_benchmarks(directory: Path, stocks: List, predict_dates: List[str], repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Compare the database backends on the operations used by the service and the tools.
+
+    MongoDB is replaced by its in-process stand-in, so its timings don't include the network and the server.
+    The stocks are written with the predictions of the given dates, as the stocks kept in the database before the prediction store.
+    """
+    import dataclasses
+    import database
+    from service import RESULT_FIELDS
+
+    constants.STOCK_DATABASE = directory / 'stock.json'
+    constants.SQLITE_DATABASE = directory / 'stock.sqlite3'
+    constants.MONGODB_DATABASE_NAME = 'benchmark_database'
+    stocks = [dataclasses.replace(stock, predict={date: 0.01 for date in predict_dates}) for stock in stocks]
+    ids = [stock.id for stock in stocks]
+    delisted_ids = ids[::100]
+
+    results = {}
+    for name in ['mongo', 'sqlite', 'tiny']:
+        db = database.open_database(name)
+        results[f'{name}: upsert_many'] = measure(lambda: db.upsert_many(stocks), repeat)
+        results[f'{name}: all'] = measure(lambda: db.all(fields=RESULT_FIELDS), repeat)
+        results[f'{name}: all (with predictions)'] = measure(lambda: db.all(), repeat)
+        results[f'{name}: all (listed qlib ids)'] = measure(lambda: db.all(fields=['qlib_id'], where={'delisted': False}), repeat)
+        results[f'{name}: search'] = measure(lambda: [db.search(id) for id in ids], repeat, len(ids))
+        results[f'{name}: mark_delisted'] = measure(lambda: db.mark_delisted(delisted_ids, '2022-09-09'), repeat)
+        db.close()
+    return results
+
+
+def run_benchmarks(directory: Path, n_stocks: int, n_days: int, predict_days: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Generate the synthetic data in the given directory and run the benchmarks on it.
+    """
+    stocks, dates = generate_qlib_data(directory / 'cn_data', n_stocks, n_days)
+
+    # Point the data paths into the directory. This must be done before importing the modules which use them as default arguments.
+    constants.QLIB_DATA_PATH = str(directory / 'cn_data')
+    constants.PREDICTION_STORE_PATH = directory / 'predictions'
+    constants.FEATURE_CACHE_PATH = directory / 'features'
+    constants.SNAPSHOT_PATH = directory / 'snapshots'
+    constants.PREDICT_RUN_PATH = directory / 'predict_run.json'
+    constants.START_PREDICTING_DATE = dates[-predict_days]
+    from database import MongoDatabase
+    import predict
+    from service import Service
+
+    results = {}
+    with mock.patch('pymongo.MongoClient', FakeMongoClient), mock.patch.object(predict, 'R', SyntheticRecorders()):
+        MongoDatabase().upsert_many(stocks)
+        service = Service(serve=False)
+
+        results['predict_all (cold feature cache)'] = measure(lambda: service.predict_all(overwrite=True))
+        results['predict_all (warm feature cache)'] = measure(lambda: service.predict_all(overwrite=True), repeat)
+
+        # Remove 1% of the predictions before each run of fixing them.
+        def remove_predictions():
+            store = service.prediction_store
+            values = np.array(store.values)
+            values[np.random.default_rng(0).random(values.shape) < 0.01] = np.nan
+            store.values = values
+            store.save()
+        results['fix_mising_prediction'] = measure(service.fix_mising_prediction, repeat, setup=remove_predictions)
+
+        results['Service.__init__'] = measure(Service, repeat)
+
+        # Start from the saved snapshot. The reconciliation in background is not measured, but waited before the next run.
+        service.snapshot = service.load_snapshot()
+        service.save_snapshot()
+        warm_services = []
+        def wait_reconciliation():
+            for warm_service in warm_services:
+                with warm_service.refresh_lock:
+                    pass
+        results['Service.__init__ (warm start)'] = measure(
+            lambda: warm_services.append(Service(warm_start=True)), repeat, setup=wait_reconciliation
+        )
+        wait_reconciliation()
+        results['time to first request (read-only)'] = time_to_first_request(constants.SNAPSHOT_PATH, repeat)
+
+        results.update(run_database_benchmarks(directory, stocks, dates[-60:], repeat))
+
+        service = Service()
+        ids = [stock.id for stock in stocks]
+        today = pd.Timestamp.today().strftime('%Y-%m-%d')
+        results['get_stock_list'] = measure(lambda: [service.get_stock_list() for _ in range(1000)], repeat, 1000)
+        results['get_history_and_predict_result (today)'] = measure(
+            lambda: [service.get_history_and_predict_result(id, today) for id in ids], repeat, len(ids)
+        )
+        results['get_history_and_predict_result (past date)'] = measure(
+            lambda: [service.get_history_and_predict_result(id, dates[-predict_days // 2]) for id in ids], repeat, len(ids)
+        )
+        results['get_topN'] = measure(lambda: [service.get_topN(5) for _ in range(100)], repeat, 100)
+        results['get_topN (window 5)'] = measure(lambda: [service.get_topN(20, dates[-2], 5) for _ in range(100)], repeat, 100)
+    return results
+
+
+def compare(results: Dict, baseline: Optional[Dict]) -> None:
+    """
+    Print the results side by side with the baseline.
+    """
+    print(f'{"benchmark":<48}{"median ms":>14}{"baseline ms":>14}{"ratio":>10}')
+    for name, result in results['results'].items():
+        baseline_result = (baseline or {}).get('results', {}).get(name)
+        if baseline_result is None:
+            print(f'{name:<48}{result["median_ms"]:>14.4f}{"-":>14}{"-":>10}')
+        else:
+            ratio = result['median_ms'] / baseline_result['median_ms'] if baseline_result['median_ms'] > 0 else float('inf')
+            print(f'{name:<48}{result["median_ms"]:>14.4f}{baseline_result["median_ms"]:>14.4f}{ratio:>10.2f}')
+    if baseline is not None and baseline['config'] != results['config']:
+        print(f'Warning: the baseline is measured with a different config {baseline["config"]}.')
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Offline benchmarks of stock predictor.')
+    argparser.add_argument('--stocks', type=int, default=300, help='The number of synthetic stocks. Default 300.')
+    argparser.add_argument('--days', type=int, default=250, help='The number of trading days of the synthetic data. Default 250.')
+    argparser.add_argument('--predict-days', type=int, default=20, help='The number of recent trading days to predict. Default 20.')
+    argparser.add_argument('--repeat', type=int, default=5, help='The number of times to run each benchmark. Default 5.')
+    argparser.add_argument('--output', type=str, help='The path to write the results as JSON.')
+    argparser.add_argument('--save-baseline', action='store_true', help='Save the results as the new baseline.')
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            'config': {'stocks': args.stocks, 'days': args.days, 'predict_days': args.predict_days},
+            'python': sys.version.split()[0],
+            'results': run_benchmarks(Path(directory), args.stocks, args.days, args.predict_days, args.repeat),
+        }
+
+    baseline = None
+    if BASELINE_PATH.exists():
+        with open(BASELINE_PATH, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+    compare(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=4)
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+        print(f'Saved the baseline to {BASELINE_PATH}.')
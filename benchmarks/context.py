@@ -0,0 +1,5 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from stock_predictor import *
\ No newline at end of file
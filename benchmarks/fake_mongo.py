@@ -0,0 +1,115 @@
+import copy
+from typing import Dict, Iterator, List, Optional
+
+
+def _match(row: Dict, filter: Optional[Dict]) -> bool:
+    """
+    Check if the row matches the filter. Only equality and $in conditions are supported.
+    """
+    for key, condition in (filter or {}).items():
+        if isinstance(condition, dict) and '$in' in condition:
+            if row.get(key) not in condition['$in']:
+                return False
+        elif row.get(key) != condition:
+            return False
+    return True
+
+
+def _project(row: Dict, projection: Optional[Dict]) -> Dict:
+    """
+    Select the fields of the row in the projection. Only inclusive projections are supported.
+    """
+    if projection is None:
+        return copy.deepcopy(row)
+    return {key: copy.deepcopy(value) for key, value in row.items() if projection.get(key)}
+
+
+class FakeCollection:
+    """
+    In-process stand-in of a MongoDB collection, which supports the operations used by MongoDatabase.
+
+    Rows are kept in insertion order and indexed by the id field, so lookups by id don't scan the collection.
+    """
+
+    def __init__(self) -> None:
+        self.rows: List[Dict] = []
+        self.id_index: Dict[str, Dict] = {}
+
+    def _find_rows(self, filter: Optional[Dict]) -> Iterator[Dict]:
+        if filter is not None and isinstance(filter.get('id'), str):
+            row = self.id_index.get(filter['id'])
+            if row is not None and _match(row, filter):
+                yield row
+            return
+        for row in self.rows:
+            if _match(row, filter):
+                yield row
+
+    def find(self, filter: Optional[Dict] = None, projection: Optional[Dict] = None) -> Iterator[Dict]:
+        return (_project(row, projection) for row in list(self._find_rows(filter)))
+
+    def find_one(self, filter: Optional[Dict] = None, projection: Optional[Dict] = None) -> Optional[Dict]:
+        return next(self.find(filter, projection), None)
+
+    def insert_one(self, document: Dict) -> None:
+        row = copy.deepcopy(document)
+        self.rows.append(row)
+        if 'id' in row:
+            self.id_index[row['id']] = row
+
+    def insert_many(self, documents: List[Dict]) -> None:
+        for document in documents:
+            self.insert_one(document)
+
+    def update_one(self, filter: Dict, update: Dict, upsert: bool = False) -> None:
+        row = next(self._find_rows(filter), None)
+        if row is not None:
+            row.update(copy.deepcopy(update.get('$set', {})))
+        elif upsert:
+            document = {key: value for key, value in filter.items() if not isinstance(value, dict)}
+            document.update(update.get('$set', {}))
+            self.insert_one(document)
+
+    def update_many(self, filter: Dict, update: Dict) -> None:
+        for row in list(self._find_rows(filter)):
+            row.update(copy.deepcopy(update.get('$set', {})))
+
+    def bulk_write(self, operations: List, ordered: bool = True) -> None:
+        # Only UpdateOne operations are used by MongoDatabase.
+        for operation in operations:
+            self.update_one(operation._filter, operation._doc, upsert=bool(operation._upsert))
+
+    def delete_many(self, filter: Optional[Dict] = None) -> None:
+        self.rows = [row for row in self.rows if not _match(row, filter)]
+        self.id_index = {row['id']: row for row in self.rows if 'id' in row}
+
+
+class FakeDatabase:
+    """
+    In-process stand-in of a MongoDB database.
+    """
+
+    def __init__(self) -> None:
+        self.collections: Dict[str, FakeCollection] = {}
+
+    def get_collection(self, name: str) -> FakeCollection:
+        return self.collections.setdefault(name, FakeCollection())
+
+
+class FakeMongoClient:
+    """
+    In-process stand-in of pymongo.MongoClient.
+
+    All the clients share the same databases, as if they connected to the same server.
+    """
+
+    databases: Dict[str, FakeDatabase] = {}
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    def get_database(self, name: str) -> FakeDatabase:
+        return self.databases.setdefault(name, FakeDatabase())
+
+    def close(self) -> None:
+        pass
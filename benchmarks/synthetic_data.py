@@ -0,0 +1,70 @@
+import numpy as np
+import os
+import pandas as pd
+from pathlib import Path
+from typing import List, Tuple
+
+import context
+from search_index import pinyin_initials
+from stock import Stock
+
+
+# The characters used to make up the Chinese names of the synthetic stocks.
+NAME_CHARACTERS = '平安银行浦发万科国农科技华夏中信招商民生东方电子新能源医药汽车'
+
+
+def generate_qlib_data(path: Path, n_stocks: int = 300, n_days: int = 250, seed: int = 0) -> Tuple[List[Stock], List[str]]:
+    """
+    Generate a synthetic qlib `cn_data` directory with daily prices of random walks.
+
+    The calendar ends today, and the stocks are split between Shanghai and Shenzhen stock exchanges.
+    Each stock has the fields used by the feature handler and the price matrix: open, close, high, low, volume, vwap and factor.
+
+    Args:
+        path: The directory to generate the data in, which is used as the provider uri of qlib.
+        n_stocks: The number of stocks.
+        n_days: The number of trading days in the calendar.
+        seed: The seed of the random numbers.
+
+    Returns:
+        The stocks, and the trading days in format 'YYYY-mm-dd'.
+    """
+    path = Path(path)
+    random = np.random.default_rng(seed)
+    dates = [date.strftime('%Y-%m-%d') for date in pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_days)]
+    os.makedirs(path / 'calendars', exist_ok=True)
+    with open(path / 'calendars' / 'day.txt', 'w') as calendar_file:
+        calendar_file.write('\n'.join(dates) + '\n')
+
+    stocks = []
+    for index in range(n_stocks):
+        if index % 2 == 0:
+            id, qlib_id = f'{600000 + index // 2:06d}', f'SH{600000 + index // 2:06d}'
+        else:
+            id, qlib_id = f'{index // 2 + 1:06d}', f'SZ{index // 2 + 1:06d}'
+        name = ''.join(random.choice(list(NAME_CHARACTERS), size=4))
+        stocks.append(Stock(id=id, pinyin=pinyin_initials(name), name=name, qlib_id=qlib_id, delisted=False, listing_date=dates[0]))
+
+    os.makedirs(path / 'instruments', exist_ok=True)
+    with open(path / 'instruments' / 'all.txt', 'w') as instruments_file:
+        for stock in stocks:
+            instruments_file.write(f'{stock.qlib_id}\t{dates[0]}\t{dates[-1]}\n')
+
+    for stock in stocks:
+        close = 10.0 * np.exp(np.cumsum(random.normal(0.0, 0.02, n_days)))
+        open_prices = close * np.exp(random.normal(0.0, 0.005, n_days))
+        fields = {
+            'open': open_prices,
+            'close': close,
+            'high': np.maximum(open_prices, close) * (1.0 + random.uniform(0.0, 0.01, n_days)),
+            'low': np.minimum(open_prices, close) * (1.0 - random.uniform(0.0, 0.01, n_days)),
+            'volume': random.uniform(1e5, 1e7, n_days),
+            'vwap': (open_prices + close) / 2.0,
+            'factor': np.ones(n_days),
+        }
+        feature_path = path / 'features' / stock.qlib_id.lower()
+        os.makedirs(feature_path, exist_ok=True)
+        for field, values in fields.items():
+            # Qlib binary format: the index of the first day in the calendar followed by the values, all in little-endian float32.
+            np.concatenate([[0.0], values]).astype('<f4').tofile(feature_path / f'{field}.day.bin')
+    return stocks, dates
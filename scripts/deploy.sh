@@ -1,7 +1,7 @@
 # Run service in tmux app session
 tmux new -s app -d
 tmux send-keys -t app 'conda activate py38' Enter
-tmux send-keys -t app 'cd ~/projects/StockPredictor && python stock_predictor/app.py' Enter
+tmux send-keys -t app 'cd ~/projects/StockPredictor && python stock_predictor/tools.py build_snapshot && gunicorn -c stock_predictor/gunicorn.conf.py' Enter
 
 # Run web app in tmux webapp session
 tmux new -s webapp -d
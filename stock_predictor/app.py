@@ -1,13 +1,85 @@
+import time
+# The time when the app starts importing, from which the time to first request is measured.
+STARTED_AT = time.perf_counter()
+
 import datetime
-from flask import Flask, request
+from flask import Flask, request, Response
 from flask_cors import CORS
+import json
 import logging
+import os
+import threading
 
+from metrics import metrics, REQUEST_SECONDS, STAGE_SECONDS
+from ranking_index import RankingIndex
+from response_cache import CachedResponse
 from service import Service
 
 
 app = Flask(__name__)
-service = Service()
+# Enable cross-origin sharing.
+CORS(app, resources=r'/*')
+IMPORTED_AT = time.perf_counter()
+# The worker processes of the production server serve the saved snapshot read-only. See gunicorn.conf.py.
+# Otherwise the snapshot saved last time is served while the data is reloaded in background, if there is one.
+service = Service(read_only=os.environ.get('STOCK_PREDICTOR_READ_ONLY', '0') == '1', warm_start=True)
+INITIALIZED_AT = time.perf_counter()
+metrics.observe(STAGE_SECONDS, IMPORTED_AT - STARTED_AT, stage='import_app')
+metrics.observe(STAGE_SECONDS, INITIALIZED_AT - IMPORTED_AT, stage='init_service')
+# Whether the first request is served. The lock makes sure the time to first request is recorded only once.
+first_request_lock = threading.Lock()
+first_request_served = False
+
+
+@app.before_request
+def start_timer():
+    """
+    Record the start time of the request.
+    """
+    request.environ['stock_predictor.start_time'] = time.perf_counter()
+
+
+@app.after_request
+def record_latency(response: Response) -> Response:
+    """
+    Record the latency of the request, labeled by the route rule so that the ids and dates in the URLs don't split the histograms.
+    """
+    global first_request_served
+    start_time = request.environ.get('stock_predictor.start_time')
+    if start_time is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unknown'
+        metrics.observe(REQUEST_SECONDS, time.perf_counter() - start_time, endpoint=endpoint, status=str(response.status_code))
+    if not first_request_served:
+        with first_request_lock:
+            if not first_request_served:
+                first_request_served = True
+                time_to_first_request = time.perf_counter() - STARTED_AT
+                metrics.observe(STAGE_SECONDS, time_to_first_request, stage='time_to_first_request')
+                app.logger.info(
+                    f'Served the first request {time_to_first_request:.3f}s after start, '
+                    f'including {IMPORTED_AT - STARTED_AT:.3f}s importing and {INITIALIZED_AT - IMPORTED_AT:.3f}s initializing the service.'
+                )
+    return response
+
+
+def make_cached_response(cached_response: CachedResponse) -> Response:
+    """
+    Make the response from the cached response according to the request headers.
+
+    A request with matching If-None-Match header gets 304 without body. Otherwise the body is sent in the best encoding the client accepts.
+    """
+    if request.if_none_match.contains_weak(cached_response.etag):
+        response = Response(status=304)
+    else:
+        encoding = max(cached_response.encodings, key=lambda encoding: request.accept_encodings[encoding])
+        if request.accept_encodings[encoding] > 0:
+            response = Response(cached_response.encodings[encoding], mimetype=cached_response.mimetype)
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = Response(cached_response.body, mimetype=cached_response.mimetype)
+    response.set_etag(cached_response.etag)
+    response.vary.add('Accept-Encoding')
+    return response
 
 
 @app.route('/')
@@ -18,8 +90,12 @@ def home():
     return 'This is the homepage of stock prediction service.<p>' \
         'Usages:<br>' \
         '&emsp;<b>Get stock list:</b>&emsp;/stock/list<br>' \
+        '&emsp;<b>Search stocks:</b>&emsp;/stock/search?q=&lt;prefix&gt;&amp;limit=&lt;limit&gt;<br>' \
         '&emsp;<b>Predict:</b>&emsp;/stock/&lt;id&gt;<br>' \
-        '&emsp;<b>Predict in date:</b>&emsp;/stock/&lt;id&gt;/&lt;yyyy-mm-dd&gt;'
+        '&emsp;<b>Predict in date:</b>&emsp;/stock/&lt;id&gt;/&lt;yyyy-mm-dd&gt;<br>' \
+        '&emsp;<b>Predict in batch:</b>&emsp;/stock/batch?ids=&lt;id&gt;,&lt;id&gt;&amp;date=&lt;yyyy-mm-dd&gt;<br>' \
+        '&emsp;<b>Top N recommendation:</b>&emsp;/stock/top?n=&lt;n&gt;&amp;date=&lt;yyyy-mm-dd&gt;&amp;window=&lt;window&gt;<br>' \
+        '&emsp;<b>Metrics:</b>&emsp;/metrics'
 
 
 @app.route('/stock/list')
@@ -52,7 +128,79 @@ def get_stock_list():
     Returns:
         A JSON string including all the stocks in the market.
     """
-    return service.get_stock_list()
+    return make_cached_response(service.get_stock_list_response())
+
+@app.route('/stock/search')
+def search():
+    """
+    Search the stocks whose id, pinyin or name starts with the query.
+
+    The query parameters are:
+        q: The prefix to search.
+        limit: The max number of stocks returned. Default 10, at most 50.
+
+    The format of the returned JSON is the same as the stock list.
+    """
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', '10')
+
+    # Check the input parameters.
+    if not limit.isdigit() or not 1 <= int(limit) <= 50:
+        return f'Error parameter: {limit} is not a valid limit.'
+
+    return service.search_stocks(query, int(limit))
+
+@app.route('/stock/batch', methods=['GET', 'POST'])
+def predict_in_batch():
+    """
+    Predict the stock prices after 2 weeks for many stocks at once.
+
+    The parameters could be sent as the query string of GET, or as the JSON body of POST:
+        ids: The ids of the stocks, separated by commas in the query string or as a list in the JSON body. At most 100 ids.
+        date: The date when the predict request is sent in format 'YYYY-mm-dd'. Default today.
+
+    The format of the returned JSON should look like:
+    {
+        "600000": {
+            "id": "600000",
+            ...
+            "history": [...],
+            "predict": {
+                "2022-09-23": 7.36
+            }
+        },
+        "000000": null
+    }
+    Stocks which are invalid or not supported yet are null.
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get('ids'), list):
+            return 'Error parameter: The body should be a JSON object with a list of ids.'
+        ids = [str(id) for id in body['ids']]
+        date = body.get('date')
+    else:
+        ids = [id for id in request.args.get('ids', '').split(',') if id]
+        date = request.args.get('date')
+    app.logger.info(f'Request {len(ids)} stocks in batch from {request.remote_addr}.')
+
+    # Check the input ids and date.
+    if not 1 <= len(ids) <= 100:
+        return f'Error parameter: {len(ids)} is not a valid number of stocks.'
+    for id in ids:
+        if not id.isdigit() or len(id) != 6:
+            return f'Error parameter: {id} is not a valid stock id.'
+    if date is None:
+        date = datetime.date.today().strftime('%Y-%m-%d')
+    else:
+        try:
+            date_obj = datetime.datetime.strptime(date, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            return f'Error parameter: {date} is not a valid date.'
+        if date_obj > datetime.datetime.now():
+            return f'Error parameter: Future date {date} is not supported.'
+
+    return Response(service.get_batch_history_and_predict_results(ids, date), mimetype='application/json')
 
 @app.route('/stock/<id>')
 def predict(id: str):
@@ -171,20 +319,74 @@ def get_top5():
 
     The top 5 recommended stocks are generated according to recent predictions.
     """
-    return service.get_topN(5)
+    return make_cached_response(service.get_topN_response(5))
+
+@app.route('/stock/top')
+def get_top():
+    """
+    Get the top N recommended stocks in the specified date.
+
+    The query parameters are:
+        n: The number of stocks. Default 5, at most 100.
+        date: The date of the recommendation in format 'YYYY-mm-dd'. Default yesterday.
+        window: The number of recent predictions the recommended stocks should be consistent in. Default 3, at most 5.
+    """
+    n = request.args.get('n', '5')
+    date = request.args.get('date')
+    window = request.args.get('window', '3')
+
+    # Check the input parameters.
+    if not n.isdigit() or not 1 <= int(n) <= 100:
+        return f'Error parameter: {n} is not a valid number of stocks.'
+    if not window.isdigit() or not 1 <= int(window) <= RankingIndex.MAX_WINDOW:
+        return f'Error parameter: {window} is not a valid window.'
+    if date is not None:
+        try:
+            datetime.datetime.strptime(date, '%Y-%m-%d')
+        except ValueError:
+            return f'Error parameter: {date} is not a valid date.'
+
+    return make_cached_response(service.get_topN_response(int(n), date, int(window)))
 
 @app.route('/stock/update')
 def update():
     """
     Notify the backend service that the data has been updated.
+
+    The data is refreshed in background, and the requests are served with the current data till the refresh is done.
+    The returned JSON contains whether the refresh is started and the status of the latest refresh, which looks like:
+    {
+        "started": true,
+        "status": "running",
+        "stage": "loading prices",
+        "progress": 0.1,
+        "started_at": "2022-09-09T20:30:00",
+        "finished_at": null,
+        "error": null
+    }
+    A refresh is not started if another one is running, and 409 is returned in that case.
     """
-    service.refresh_data()
-    return 'Data updated.'
+    started = service.start_refresh()
+    result = {'started': started, **service.get_refresh_status()}
+    return Response(json.dumps(result), status=202 if started else 409, mimetype='application/json')
 
-if __name__ == '__main__':
-    # Enable cross-origin sharing.
-    CORS(app, resources=r'/*')
+@app.route('/stock/update/status')
+def update_status():
+    """
+    Get the status of the latest refresh of the data, in the same format as /stock/update without the "started" field.
+    """
+    return service.get_refresh_status()
 
+@app.route('/metrics')
+def get_metrics():
+    """
+    Get the latency histograms and the counters of this process in Prometheus text exposition format.
+
+    Each worker process of the production server records its own metrics, so a scrape reports the worker which serves it.
+    """
+    return Response(metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+if __name__ == '__main__':
     # Add file handler to the logger.
     file_handler = logging.FileHandler(f'{app.name}.log')
     file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s: %(message)s"))
@@ -192,4 +394,8 @@ if __name__ == '__main__':
     app.logger.setLevel(logging.INFO)
 
     # Start app.
-    app.run(host='0.0.0.0')
\ No newline at end of file
+    app.run(host='0.0.0.0')
+elif logging.getLogger('gunicorn.error').handlers:
+    # Write the logs into the error log of gunicorn when running in the production server.
+    app.logger.handlers = logging.getLogger('gunicorn.error').handlers
+    app.logger.setLevel(logging.INFO)
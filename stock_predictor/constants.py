@@ -1,9 +1,30 @@
 from pathlib import Path
 
 
+# The database backend of the stocks, one of 'mongo', 'sqlite' and 'tiny'.
+DATABASE = 'mongo'
+
 # Path of TinyDB database.
 STOCK_DATABASE = Path('~/.stock/stock.json').expanduser()
 
+# Path of SQLite database.
+SQLITE_DATABASE = Path('~/.stock/stock.sqlite3').expanduser()
+
+# Directory of the prediction store.
+PREDICTION_STORE_PATH = Path('~/.stock/predictions').expanduser()
+
+# Directory of the feature cache.
+FEATURE_CACHE_PATH = Path('~/.stock/features').expanduser()
+
+# Path of the manifest of the latest run of predicting all the stocks.
+PREDICT_RUN_PATH = Path('~/.stock/predict_run.json').expanduser()
+
+# Directory of the snapshots served by the worker processes in production serving mode.
+SNAPSHOT_PATH = Path('~/.stock/snapshots').expanduser()
+
+# Directory of the metrics summaries written by the tools, one file per tool.
+METRICS_PATH = Path('~/.stock/metrics').expanduser()
+
 # MongoDB connection string
 MONGODB_CONNECTION_STRING = 'mongodb://localhost:27017'
 # MongoDB database name
@@ -19,6 +40,12 @@ SZ_STOCK_LIST_PATH = Path('~/.stock/sz_stock_list.xls').expanduser()
 SHANGHAI_STOCK_EXCHANGE_URL = 'http://www.sse.com.cn/assortment/stock/list/share/'
 # URL of Shenzhen stock list webpage.
 SHENZHEN_STOCK_EXCHANGE_URL = 'http://www.szse.cn/market/product/stock/list/index.html'
+# URL of the export endpoint behind the download button of Shanghai stock list webpage.
+SHANGHAI_STOCK_LIST_EXPORT_URL = 'https://query.sse.com.cn/sseQuery/commonExcelDd.do?sqlId=COMMON_SSE_CP_GPJCTPZ_GPLB_GP_L&type=inParams&CSRC_CODE=&STOCK_CODE=&REG_PROVINCE=&STOCK_TYPE=1&COMPANY_STATUS=2,4,5,7,8'
+# URL of the export endpoint behind the download button of Shenzhen stock list webpage.
+SHENZHEN_STOCK_LIST_EXPORT_URL = 'https://www.szse.cn/api/report/ShowReport?SHOWTYPE=xlsx&CATALOGID=1110&TABKEY=tab1'
+# Path of the content hashes of the stock list files loaded into database last time.
+STOCK_LIST_HASH_PATH = Path('~/.stock/stock_list_hash.json').expanduser()
 
 # The date we start to support predicting.
 START_PREDICTING_DATE = '2022-01-01'
@@ -1,8 +1,26 @@
-from playwright.sync_api import sync_playwright
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+from pathlib import Path
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional, Type
 
 import constants
 
 
+# Excel files start with the signature of zip archive (.xlsx) or OLE2 compound document (.xls).
+EXCEL_SIGNATURES = (b'PK\x03\x04', b'\xd0\xcf\x11\xe0')
+
+
+def file_hash(path: Path) -> str:
+    """
+    Compute the SHA1 hash of the file content.
+    """
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
 class Crawler:
     """
     Web crawler for stock list.
@@ -14,6 +32,8 @@ class Crawler:
         """
         Initialize the Playwright engine and do some prerequisite works.
         """
+        # Playwright is imported here since it's heavy and only needed when the browser is launched.
+        from playwright.sync_api import sync_playwright
         self.playwright = sync_playwright().start()
         self.browser = self.playwright.chromium.launch(headless=True)
         self.context = self.browser.new_context()
@@ -84,4 +104,122 @@ class Crawler:
         with page.expect_download() as download_info:
             page.click('.btn-default-excel')
         download_info.value.save_as(save_path)
-        page.close()
\ No newline at end of file
+        page.close()
+
+    def crawl_stock_list(self, exchange: str, save_path: Path):
+        """
+        Crawl the stock list Excel file from the given stock exchange, which is 'SH' or 'SZ'.
+        """
+        if exchange == 'SH':
+            self.crawl_shanghai_stock_list(save_path)
+        else:
+            self.crawl_shenzhen_stock_list(save_path)
+
+
+class HttpCrawler:
+    """
+    Lightweight web crawler for stock list.
+
+    Download the stock list Excel files from the export endpoints behind the download buttons of the stock exchange websites
+    with plain HTTP requests, which avoids launching a browser. The stock exchanges are downloaded concurrently through a
+    pooled session. If an export endpoint fails or doesn't return an Excel file, e.g. it's changed by the website, the stock
+    list of that stock exchange is crawled with the browser instead.
+    """
+
+    def __init__(
+        self,
+        urls: Optional[Dict[str, str]] = None,
+        fallback_crawler_class: Optional[Type[Crawler]] = Crawler,
+        timeout: float = 30
+    ) -> None:
+        """
+        Initialize the HTTP session.
+
+        Args:
+            urls: The export endpoints keyed by stock exchange 'SH' and 'SZ'. Default None means the official ones.
+            fallback_crawler_class: The crawler used when the export endpoint fails. None means no fallback and the failure is raised.
+            timeout: The timeout of each HTTP request in seconds.
+        """
+        self.urls = urls or {
+            'SH': constants.SHANGHAI_STOCK_LIST_EXPORT_URL,
+            'SZ': constants.SHENZHEN_STOCK_LIST_EXPORT_URL,
+        }
+        self.fallback_crawler_class = fallback_crawler_class
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.urls), pool_maxsize=len(self.urls), max_retries=2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36'
+        # The export endpoint of Shanghai Stock Exchange rejects the requests not referred by its website.
+        self.referers = {
+            'SH': constants.SHANGHAI_STOCK_EXCHANGE_URL,
+            'SZ': constants.SHENZHEN_STOCK_EXCHANGE_URL,
+        }
+
+    def __enter__(self):
+        """
+        Do nothing when entering the crawler context.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """
+        Close the resources when exiting from the crawler context.
+        """
+        self.close()
+
+    def close(self):
+        """
+        Close the HTTP session.
+        """
+        self.session.close()
+
+    def download(self, exchange: str, save_path: Path) -> None:
+        """
+        Download the stock list Excel file of the given stock exchange from its export endpoint.
+
+        The file is written to a temporary path first and then renamed, so an existing file is never left half-written.
+
+        Raises:
+            requests.RequestException: If the request fails.
+            ValueError: If the response is not an Excel file.
+        """
+        response = self.session.get(self.urls[exchange], headers={'Referer': self.referers.get(exchange, '')}, timeout=self.timeout)
+        response.raise_for_status()
+        if not response.content.startswith(EXCEL_SIGNATURES):
+            raise ValueError(f'The response of {self.urls[exchange]} is not an Excel file.')
+        save_path = Path(save_path)
+        os.makedirs(save_path.parent, exist_ok=True)
+        temporary_path = save_path.with_name(f'{save_path.name}.tmp')
+        with open(temporary_path, 'wb') as file:
+            file.write(response.content)
+        os.replace(temporary_path, save_path)
+
+    def crawl_stock_lists(self, save_paths: Dict[str, Path]) -> Dict[str, str]:
+        """
+        Crawl the stock list Excel files of the given stock exchanges concurrently.
+
+        Args:
+            save_paths: The paths to save the files keyed by stock exchange 'SH' and 'SZ'.
+
+        Returns:
+            The SHA1 hashes of the file contents keyed by stock exchange.
+        """
+        with ThreadPoolExecutor(max_workers=len(save_paths)) as executor:
+            futures = {exchange: executor.submit(self.download, exchange, save_path) for exchange, save_path in save_paths.items()}
+        failed_exchanges = []
+        for exchange, future in futures.items():
+            error = future.exception()
+            if error is not None:
+                if self.fallback_crawler_class is None:
+                    raise error
+                print(f'Failed to download the stock list of {exchange} with HTTP request: {error!r}. Crawl it with browser instead.')
+                failed_exchanges.append(exchange)
+
+        # The browser is launched only when it's needed.
+        if failed_exchanges:
+            with self.fallback_crawler_class() as crawler:
+                for exchange in failed_exchanges:
+                    crawler.crawl_stock_list(exchange, save_paths[exchange])
+        return {exchange: file_hash(save_path) for exchange, save_path in save_paths.items()}
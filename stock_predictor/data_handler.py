@@ -1,3 +1,5 @@
+import hashlib
+import json
 from qlib.contrib.data.handler import Alpha158
 
 
@@ -11,4 +13,13 @@ class Alpha158TwoWeeks(Alpha158):
         Override the get_label_config method in Alpha158.
         This will build a data handler that labels the items with price increase in next 10 trading days.
         """
-        return (["Ref($close, -10)/Ref($close, -1) - 1"], ["LABEL0"])
\ No newline at end of file
+        return (["Ref($close, -10)/Ref($close, -1) - 1"], ["LABEL0"])
+
+    @classmethod
+    def config_hash(cls) -> str:
+        """
+        Get the hash of the feature config, which identifies the features produced by this data handler.
+        """
+        # The feature config doesn't depend on the handler instance, so it could be computed without loading any data.
+        fields, names = cls.get_feature_config(cls)
+        return hashlib.sha1(json.dumps([cls.__name__, fields, names]).encode('utf-8')).hexdigest()[:16]
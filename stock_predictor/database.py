@@ -1,13 +1,49 @@
 from abc import ABC, abstractmethod
+import json
 import os
 import pymongo
-from typing import List, Optional
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
 from tinydb import TinyDB, Query
 
 import constants
+from metrics import metrics, ROWS_READ, ROWS_WRITTEN
 from stock import Stock
 
 
+def _to_stock(row: Dict, fields: Optional[List[str]] = None) -> Stock:
+    """
+    Convert a database row to the stock.
+
+    If fields is given, only those fields are taken from the row. The others are set to their default values or None.
+    """
+    if fields is None:
+        return Stock.from_row(row)
+    return Stock.from_row({field: row[field] for field in fields if field in row})
+
+
+def _to_row(stock: Stock) -> Dict:
+    """
+    Convert the stock to a database row. Fields with None value are not included, so they won't overwrite existing values.
+    """
+    return {key: value for key, value in stock.as_dict().items() if value is not None}
+
+
+def _delisted_fields(delisted_date: Optional[str]) -> Dict:
+    """
+    Get the fields to update when stocks are delisted.
+    """
+    fields = {'delisted': True}
+    if delisted_date is not None:
+        fields['delisted_date'] = delisted_date
+    return fields
+
+
+# The fields to update when delisted stocks are listed again.
+RELISTED_FIELDS = {'delisted': False, 'delisted_date': None}
+
+
 class Database(ABC):
     """
     The universal database interface for stock predictor.
@@ -23,16 +59,24 @@ class Database(ABC):
         pass
 
     @abstractmethod
-    def all(self) -> List[Stock]:
+    def all(self, fields: Optional[List[str]] = None, where: Optional[Dict] = None) -> List[Stock]:
         """
         Get all the stocks in the database.
+
+        Args:
+            fields: The fields to fetch. Default None means all the fields. Fields not fetched are left as default values.
+            where: Only fetch the stocks whose fields equal to the given values, e.g. {'delisted': False}. Default None means no filter.
         """
         pass
 
     @abstractmethod
-    def search(self, id: str) -> Optional[Stock]:
+    def search(self, id: str, fields: Optional[List[str]] = None) -> Optional[Stock]:
         """
         Search a stock with given id.
+
+        Args:
+            id: The id of the stock.
+            fields: The fields to fetch. Default None means all the fields. Fields not fetched are left as default values.
         """
         pass
 
@@ -45,6 +89,36 @@ class Database(ABC):
         """
         pass
 
+    @abstractmethod
+    def upsert_many(self, stocks: List[Stock]) -> None:
+        """
+        Update or insert a batch of stocks into database in bulk.
+
+        The id field of each stock will be used for lookup in the database.
+        """
+        pass
+
+    @abstractmethod
+    def mark_delisted(self, ids: Iterable[str], delisted_date: Optional[str] = None) -> None:
+        """
+        Mark the stocks with given ids as delisted in bulk.
+
+        Args:
+            ids: The ids of the stocks.
+            delisted_date: The delisted date of the stocks. Default None means not setting the delisted date.
+        """
+        pass
+
+    @abstractmethod
+    def mark_relisted(self, ids: Iterable[str]) -> None:
+        """
+        Mark the stocks with given ids as listed in bulk, and clear their delisted dates.
+
+        Args:
+            ids: The ids of the stocks.
+        """
+        pass
+
     @abstractmethod
     def refresh(self) -> None:
         """
@@ -52,6 +126,14 @@ class Database(ABC):
         """
         pass
 
+    def release_thread(self) -> None:
+        """
+        Release the resources held for current thread, e.g. before a short-lived thread exits. The database is still usable.
+
+        Nothing is held per thread by default.
+        """
+        pass
+
     @abstractmethod
     def close(self) -> None:
         """
@@ -73,19 +155,26 @@ class TinyDatabase(Database):
         self.database = TinyDB(constants.STOCK_DATABASE)
         self.query = Query()
 
-    def all(self) -> List[Stock]:
+    def all(self, fields: Optional[List[str]] = None, where: Optional[Dict] = None) -> List[Stock]:
         """
         Get all the stocks in the database.
+
+        TinyDB has no projection, so the fields are selected after the rows are read.
         """
-        return [Stock.from_dict(row) for row in self.database.all()]
+        with metrics.timer('database_all', database='tiny'):
+            rows = self.database.all() if where is None else self.database.search(self.query.fragment(where))
+            stocks = [_to_stock(row, fields) for row in rows]
+        metrics.increment(ROWS_READ, len(stocks), source='database')
+        return stocks
 
-    def search(self, id: str) -> Optional[Stock]:
+    def search(self, id: str, fields: Optional[List[str]] = None) -> Optional[Stock]:
         """
         Search a stock with given id.
         """
-        matched_rows = self.database.search(Query().id == id)
+        with metrics.timer('database_search', database='tiny'):
+            matched_rows = self.database.search(Query().id == id)
         if len(matched_rows) == 1:
-            return Stock.from_dict(matched_rows[0])
+            return _to_stock(matched_rows[0], fields)
         elif len(matched_rows) > 1:
             raise ValueError(f'Multiple rows with the same id {id}')
         else:
@@ -97,8 +186,44 @@ class TinyDatabase(Database):
 
         The id field of stock will be used for lookup in the database.
         """
-        stock_dict = {key: value for key, value in stock.to_dict().items() if value is not None}
-        self.database.upsert(stock_dict, self.query.id == stock.id)
+        self.database.upsert(_to_row(stock), self.query.id == stock.id)
+
+    def upsert_many(self, stocks: List[Stock]) -> None:
+        """
+        Update or insert a batch of stocks into database in bulk.
+
+        TinyDB rewrites the whole file on each write, so existing rows are updated in one pass and new rows are inserted together.
+        This costs at most two writes no matter how many stocks are given.
+        """
+        rows = {stock.id: _to_row(stock) for stock in stocks}
+        with metrics.timer('database_upsert_many', database='tiny'):
+            existing_ids = {row['id'] for row in self.database.all()}.intersection(rows)
+            if existing_ids:
+                self.database.update(lambda row: row.update(rows[row['id']]), self.query.id.one_of(existing_ids))
+            new_rows = [row for id, row in rows.items() if id not in existing_ids]
+            if new_rows:
+                self.database.insert_multiple(new_rows)
+        metrics.increment(ROWS_WRITTEN, len(rows), target='database')
+
+    def mark_delisted(self, ids: Iterable[str], delisted_date: Optional[str] = None) -> None:
+        """
+        Mark the stocks with given ids as delisted in bulk.
+        """
+        ids = set(ids)
+        if ids:
+            with metrics.timer('database_mark_delisted', database='tiny'):
+                self.database.update(_delisted_fields(delisted_date), self.query.id.one_of(ids))
+            metrics.increment(ROWS_WRITTEN, len(ids), target='database')
+
+    def mark_relisted(self, ids: Iterable[str]) -> None:
+        """
+        Mark the stocks with given ids as listed in bulk, and clear their delisted dates.
+        """
+        ids = set(ids)
+        if ids:
+            with metrics.timer('database_mark_relisted', database='tiny'):
+                self.database.update(RELISTED_FIELDS, self.query.id.one_of(ids))
+            metrics.increment(ROWS_WRITTEN, len(ids), target='database')
 
     def refresh(self) -> None:
         """
@@ -129,36 +254,81 @@ class MongoDatabase(Database):
         self.database = self.client.get_database(constants.MONGODB_DATABASE_NAME)
         self.collection = self.database.get_collection(constants.MONGODB_COLLECTION_NAME)
 
-    def all(self) -> List[Stock]:
+    def all(self, fields: Optional[List[str]] = None, where: Optional[Dict] = None) -> List[Stock]:
         """
         Get all the stocks in the database.
+
+        The fields and the filter are pushed down to MongoDB server as projection and query.
         """
-        rows = self.collection.find()
-        return [Stock.from_dict(row) for row in rows]
+        with metrics.timer('database_all', database='mongo'):
+            rows = self.collection.find(where or {}, self._projection(fields))
+            stocks = [_to_stock(row, fields) for row in rows]
+        metrics.increment(ROWS_READ, len(stocks), source='database')
+        return stocks
 
-    def search(self, id: str) -> Optional[Stock]:
+    def search(self, id: str, fields: Optional[List[str]] = None) -> Optional[Stock]:
         """
         Search a stock with given id.
         """
-        matched_row = self.collection.find_one({'id': id})
+        with metrics.timer('database_search', database='mongo'):
+            matched_row = self.collection.find_one({'id': id}, self._projection(fields))
         if matched_row is not None:
-            return Stock.from_dict(matched_row)
+            return _to_stock(matched_row, fields)
         else:
             return None
 
+    def _projection(self, fields: Optional[List[str]]) -> Optional[Dict]:
+        """
+        Build the MongoDB projection for the given fields.
+        """
+        if fields is None:
+            return None
+        projection = {field: 1 for field in fields}
+        projection['_id'] = 0
+        return projection
+
     def upsert(self, stock: Stock) -> None:
         """
         Update or insert the stock into database.
 
         The id field of stock will be used for lookup in the database.
         """
-        stock_dict = {key: value for key, value in stock.to_dict().items() if value is not None}
         self.collection.update_one(
             {'id': stock.id},
-            {'$set': stock_dict},
+            {'$set': _to_row(stock)},
             upsert=True
         )
 
+    def upsert_many(self, stocks: List[Stock]) -> None:
+        """
+        Update or insert a batch of stocks into database with one bulk write.
+        """
+        operations = [pymongo.UpdateOne({'id': stock.id}, {'$set': _to_row(stock)}, upsert=True) for stock in stocks]
+        if operations:
+            with metrics.timer('database_upsert_many', database='mongo'):
+                self.collection.bulk_write(operations, ordered=False)
+            metrics.increment(ROWS_WRITTEN, len(operations), target='database')
+
+    def mark_delisted(self, ids: Iterable[str], delisted_date: Optional[str] = None) -> None:
+        """
+        Mark the stocks with given ids as delisted with one bulk update.
+        """
+        ids = list(ids)
+        if ids:
+            with metrics.timer('database_mark_delisted', database='mongo'):
+                self.collection.update_many({'id': {'$in': ids}}, {'$set': _delisted_fields(delisted_date)})
+            metrics.increment(ROWS_WRITTEN, len(ids), target='database')
+
+    def mark_relisted(self, ids: Iterable[str]) -> None:
+        """
+        Mark the stocks with given ids as listed with one bulk update, and clear their delisted dates.
+        """
+        ids = list(ids)
+        if ids:
+            with metrics.timer('database_mark_relisted', database='mongo'):
+                self.collection.update_many({'id': {'$in': ids}}, {'$set': RELISTED_FIELDS})
+            metrics.increment(ROWS_WRITTEN, len(ids), target='database')
+
     def refresh(self) -> None:
         """
         Do nothing. MongoDB don't need to refresh.
@@ -169,4 +339,242 @@ class MongoDatabase(Database):
         """
         Close the database and release resources.
         """
-        self.client.close()
\ No newline at end of file
+        self.client.close()
+
+
+class SqliteDatabase(Database):
+    """
+    SQLite implementation of database, which needs no database server on single-node deployments.
+
+    The stocks are kept in a table with the id as primary key, and the predictions in a separate table keyed by id and date.
+    The database runs in WAL mode, so readers in other threads and processes are not blocked while the nightly writer runs.
+    SQLite connections can't be shared by threads, so each thread opens its own connection.
+    """
+
+    # The columns of the stocks table. The predictions are kept in the predictions table.
+    COLUMNS = ['id', 'pinyin', 'name', 'qlib_id', 'enname', 'history', 'delisted', 'listing_date', 'delisted_date']
+
+    def __init__(self) -> None:
+        """
+        Open the SQLite database and create the tables if they don't exist.
+        """
+        os.makedirs(os.path.dirname(constants.SQLITE_DATABASE), exist_ok=True)
+        self.path = constants.SQLITE_DATABASE
+        self.local = threading.local()
+        self.connections: List[sqlite3.Connection] = []
+        self.connections_lock = threading.Lock()
+        with self._connection() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS stocks (
+                    id TEXT PRIMARY KEY,
+                    pinyin TEXT,
+                    name TEXT,
+                    qlib_id TEXT,
+                    enname TEXT,
+                    history TEXT,
+                    delisted INTEGER NOT NULL DEFAULT 0,
+                    listing_date TEXT,
+                    delisted_date TEXT
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS predictions (
+                    id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    price REAL NOT NULL,
+                    PRIMARY KEY (id, date)
+                ) WITHOUT ROWID
+            """)
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Get the connection of current thread, and open it if it's not opened yet.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            with self.connections_lock:
+                self.connections.append(connection)
+        return connection
+
+    def _select(self, fields: Optional[List[str]], where: Optional[Dict]) -> List[Stock]:
+        """
+        Select the stocks with the fields pushed down as the columns and the filter pushed down as the WHERE clause.
+        """
+        columns = self.COLUMNS if fields is None else [column for column in self.COLUMNS if column in fields]
+        if 'id' not in columns:
+            columns = ['id'] + columns
+        conditions = []
+        parameters = []
+        for field, value in (where or {}).items():
+            if field not in self.COLUMNS:
+                raise ValueError(f'Unknown field {field}.')
+            conditions.append(f'{field} IS ?')
+            parameters.append(int(value) if isinstance(value, bool) else value)
+        statement = f'SELECT {", ".join(columns)} FROM stocks'
+        if conditions:
+            statement += f' WHERE {" AND ".join(conditions)}'
+
+        connection = self._connection()
+        rows = [self._from_record(record) for record in connection.execute(statement, parameters)]
+        if fields is None or 'predict' in fields:
+            predictions = {}
+            if where is None and len(rows) > 1:
+                records = connection.execute('SELECT id, date, price FROM predictions ORDER BY id, date')
+            else:
+                ids = [row['id'] for row in rows]
+                records = [
+                    record
+                    for start in range(0, len(ids), 500)
+                    for record in connection.execute(
+                        f'SELECT id, date, price FROM predictions WHERE id IN ({", ".join("?" * len(ids[start:start + 500]))}) ORDER BY id, date',
+                        ids[start:start + 500]
+                    )
+                ]
+            for id, date, price in records:
+                predictions.setdefault(id, {})[date] = price
+            for row in rows:
+                if row['id'] in predictions:
+                    row['predict'] = predictions[row['id']]
+        return [_to_stock(row, fields) for row in rows]
+
+    def _from_record(self, record: sqlite3.Row) -> Dict:
+        """
+        Convert a record of the stocks table to a database row. NULL columns are not included.
+        """
+        row = {key: record[key] for key in record.keys() if record[key] is not None}
+        if 'delisted' in row:
+            row['delisted'] = bool(row['delisted'])
+        if 'history' in row:
+            row['history'] = json.loads(row['history'])
+        return row
+
+    def all(self, fields: Optional[List[str]] = None, where: Optional[Dict] = None) -> List[Stock]:
+        """
+        Get all the stocks in the database.
+
+        The fields and the filter are pushed down to SQLite as the columns and the WHERE clause.
+        The predictions are only read if they are requested.
+        """
+        with metrics.timer('database_all', database='sqlite'):
+            stocks = self._select(fields, where)
+        metrics.increment(ROWS_READ, len(stocks), source='database')
+        return stocks
+
+    def search(self, id: str, fields: Optional[List[str]] = None) -> Optional[Stock]:
+        """
+        Search a stock with given id, which is looked up by the primary key.
+        """
+        with metrics.timer('database_search', database='sqlite'):
+            stocks = self._select(fields, {'id': id})
+        return stocks[0] if stocks else None
+
+    def upsert(self, stock: Stock) -> None:
+        """
+        Update or insert the stock into database.
+
+        The id field of stock will be used for lookup in the database.
+        """
+        self.upsert_many([stock])
+
+    def upsert_many(self, stocks: List[Stock]) -> None:
+        """
+        Update or insert a batch of stocks into database in one transaction.
+
+        As the other implementations, fields with None value don't overwrite the existing values,
+        and the predictions of a stock are replaced as a whole if they are given.
+        """
+        rows = {stock.id: _to_row(stock) for stock in stocks}
+        # Group the rows by their columns, so the rows in each group are written with one statement.
+        groups: Dict[tuple, List[list]] = {}
+        for row in rows.values():
+            columns = tuple(column for column in self.COLUMNS if column in row)
+            values = [row[column] for column in columns]
+            values = [json.dumps(value) if column == 'history' else int(value) if column == 'delisted' else value for column, value in zip(columns, values)]
+            groups.setdefault(columns, []).append(values)
+        predictions = {id: row['predict'] for id, row in rows.items() if 'predict' in row}
+
+        with metrics.timer('database_upsert_many', database='sqlite'), self._connection() as connection:
+            for columns, values in groups.items():
+                updates = ', '.join(f'{column} = excluded.{column}' for column in columns if column != 'id')
+                connection.executemany(
+                    f'INSERT INTO stocks ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))}) '
+                    f'ON CONFLICT (id) DO {f"UPDATE SET {updates}" if updates else "NOTHING"}',
+                    values
+                )
+            if predictions:
+                connection.executemany('DELETE FROM predictions WHERE id = ?', [(id,) for id in predictions])
+                connection.executemany(
+                    'INSERT INTO predictions (id, date, price) VALUES (?, ?, ?)',
+                    [(id, date, price) for id, predict in predictions.items() for date, price in predict.items()]
+                )
+        metrics.increment(ROWS_WRITTEN, len(rows), target='database')
+
+    def mark_delisted(self, ids: Iterable[str], delisted_date: Optional[str] = None) -> None:
+        """
+        Mark the stocks with given ids as delisted in one transaction.
+        """
+        ids = list(ids)
+        if ids:
+            fields = _delisted_fields(delisted_date)
+            assignments = ', '.join(f'{field} = ?' for field in fields)
+            values = [int(value) if isinstance(value, bool) else value for value in fields.values()]
+            with metrics.timer('database_mark_delisted', database='sqlite'), self._connection() as connection:
+                connection.executemany(f'UPDATE stocks SET {assignments} WHERE id = ?', [values + [id] for id in ids])
+            metrics.increment(ROWS_WRITTEN, len(ids), target='database')
+
+    def mark_relisted(self, ids: Iterable[str]) -> None:
+        """
+        Mark the stocks with given ids as listed in one transaction, and clear their delisted dates.
+        """
+        ids = list(ids)
+        if ids:
+            with metrics.timer('database_mark_relisted', database='sqlite'), self._connection() as connection:
+                connection.executemany('UPDATE stocks SET delisted = 0, delisted_date = NULL WHERE id = ?', [[id] for id in ids])
+            metrics.increment(ROWS_WRITTEN, len(ids), target='database')
+
+    def refresh(self) -> None:
+        """
+        Do nothing. Each query reads the latest committed data.
+        """
+        pass
+
+    def release_thread(self) -> None:
+        """
+        Close the connection of current thread. It's opened again if the thread uses the database later.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            return
+        self.local.connection = None
+        with self.connections_lock:
+            self.connections.remove(connection)
+        connection.close()
+
+    def close(self) -> None:
+        """
+        Close the connections of all the threads.
+        """
+        with self.connections_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = threading.local()
+
+
+def open_database(name: Optional[str] = None) -> Database:
+    """
+    Open the database of the given backend.
+
+    Args:
+        name: The database backend, one of 'mongo', 'sqlite' and 'tiny'. Default None means the backend in constants.DATABASE.
+    """
+    databases = {'mongo': MongoDatabase, 'sqlite': SqliteDatabase, 'tiny': TinyDatabase}
+    name = constants.DATABASE if name is None else name
+    if name not in databases:
+        raise ValueError(f'Unknown database backend {name}. Choose from {list(databases)}.')
+    return databases[name]()
@@ -0,0 +1,160 @@
+import numpy as np
+import os
+import pandas as pd
+from pathlib import Path
+from qlib.data.dataset.handler import DataHandlerLP
+import shutil
+from typing import List, Optional
+import uuid
+
+import constants
+from data_handler import Alpha158TwoWeeks
+from metrics import CACHE_HITS, CACHE_MISSES, metrics
+from trading_calendar import TradingCalendar
+
+
+class FeatureCache:
+    """
+    Persistent cache of the inference features produced by a data handler.
+
+    Features are keyed by (instrument, trading date, handler config hash). Each config hash has its own directory, in which
+    each trading date has a sub-directory. Every write merges the new features with the chunk files of its date into a new chunk,
+    and then removes the merged chunks, so a date mostly has one chunk. Chunks are never modified once written, so concurrent
+    writers never clobber each other. A chunk removed by another writer is skipped, and its features are computed again.
+    """
+
+    def __init__(self, handler_class=Alpha158TwoWeeks, path: Path = constants.FEATURE_CACHE_PATH) -> None:
+        """
+        Initialize the feature cache.
+
+        Args:
+            handler_class: The data handler class used to compute the features.
+            path: The root directory of the feature cache.
+        """
+        self.handler_class = handler_class
+        self.path = Path(path) / handler_class.config_hash()
+
+    def get(self, instruments: List[str], start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        Get the features of the given instruments in the given date range.
+
+        Only the features not in the cache are computed, and they are appended to the cache.
+
+        Args:
+            instruments: The qlib ids of the stocks.
+            start_date: The beginning of the date range (inclusive).
+            end_date: The end of the date range (inclusive).
+
+        Returns:
+            The features indexed by (datetime, instrument). Instrument and date pairs without any data are not included.
+        """
+        trading_dates = TradingCalendar.shared().between(start_date, end_date)
+        instrument_set = set(instruments)
+
+        # Load the cached features and find the missing ones.
+        frames = []
+        missing_pairs = []
+        for date in trading_dates:
+            cached = self._load(date)
+            cached_instruments = set()
+            if cached is not None:
+                cached = cached[cached.index.get_level_values('instrument').isin(instrument_set)]
+                cached_instruments = set(cached.index.get_level_values('instrument'))
+                frames.append(cached)
+            missing_pairs.extend((pd.Timestamp(date), instrument) for instrument in sorted(instrument_set - cached_instruments))
+        metrics.increment(CACHE_HITS, len(trading_dates) * len(instrument_set) - len(missing_pairs), cache='features')
+        metrics.increment(CACHE_MISSES, len(missing_pairs), cache='features')
+
+        # Compute the missing features with one handler and append them to the cache.
+        if missing_pairs:
+            missing_index = pd.MultiIndex.from_tuples(missing_pairs, names=['datetime', 'instrument'])
+            with metrics.timer('compute_features'):
+                computed = self._compute(
+                    sorted(set(missing_index.get_level_values('instrument'))),
+                    missing_index.get_level_values('datetime').min().strftime('%Y-%m-%d'),
+                    missing_index.get_level_values('datetime').max().strftime('%Y-%m-%d')
+                )
+            # Pairs without any data are not cached, since the data may be filled by a later update.
+            computed = computed.reindex(missing_index)
+            computed = computed[computed.notna().any(axis=1)]
+            for date, features in computed.groupby(level='datetime'):
+                self._append(date.strftime('%Y-%m-%d'), features)
+            frames.append(computed)
+
+        if not frames:
+            return pd.DataFrame(index=pd.MultiIndex.from_tuples([], names=['datetime', 'instrument']))
+        return pd.concat(frames).sort_index()
+
+    def invalidate(self, start_date: str) -> None:
+        """
+        Remove the cached features on and after the given date.
+
+        Features depend on the data in a lookback window, so rewriting the data of a date affects the features of the following dates as well.
+
+        Args:
+            start_date: The first date to invalidate.
+        """
+        if not self.path.exists():
+            return
+        for date_directory in self.path.iterdir():
+            if date_directory.name >= start_date:
+                shutil.rmtree(date_directory, ignore_errors=True)
+
+    def _compute(self, instruments: List[str], start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        Compute the inference features with the data handler.
+        """
+        data_handler = self.handler_class(instruments=instruments, start_time=start_date, end_time=end_date)
+        return data_handler.fetch(col_set='feature', data_key=DataHandlerLP.DK_I).astype(np.float32)
+
+    def _load(self, date: str) -> Optional[pd.DataFrame]:
+        """
+        Load all the chunks cached for the given date. Return None if nothing is cached.
+        """
+        return self._read_chunks(self._chunk_paths(date))
+
+    def _append(self, date: str, features: pd.DataFrame) -> None:
+        """
+        Merge a chunk of features with the cached chunks of the given date, and replace them with the merged chunk.
+        """
+        date_directory = self.path / date
+        os.makedirs(date_directory, exist_ok=True)
+        merged_paths = self._chunk_paths(date)
+        cached = self._read_chunks(merged_paths)
+        if cached is not None:
+            features = pd.concat([cached, features])
+            features = features[~features.index.duplicated(keep='last')]
+
+        chunk_path = date_directory / f'{uuid.uuid4().hex}.pkl'
+        temporary_chunk_path = date_directory / f'{chunk_path.name}.tmp'
+        features.to_pickle(temporary_chunk_path)
+        os.replace(temporary_chunk_path, chunk_path)
+        for merged_path in merged_paths:
+            try:
+                os.remove(merged_path)
+            except FileNotFoundError:
+                pass
+
+    def _chunk_paths(self, date: str) -> List[Path]:
+        """
+        List the chunk files of the given date.
+        """
+        date_directory = self.path / date
+        if not date_directory.exists():
+            return []
+        return sorted(date_directory.glob('*.pkl'))
+
+    def _read_chunks(self, chunk_paths: List[Path]) -> Optional[pd.DataFrame]:
+        """
+        Read and concatenate the given chunks. Chunks removed by another writer meanwhile are skipped.
+        """
+        chunks = []
+        for chunk_path in chunk_paths:
+            try:
+                chunks.append(pd.read_pickle(chunk_path))
+            except FileNotFoundError:
+                pass
+        if not chunks:
+            return None
+        features = pd.concat(chunks)
+        return features[~features.index.duplicated(keep='last')]
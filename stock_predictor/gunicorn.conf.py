@@ -0,0 +1,31 @@
+"""
+Gunicorn config of the production server.
+
+Build the snapshot first and then start the server from the repository root:
+    python stock_predictor/tools.py build_snapshot
+    gunicorn -c stock_predictor/gunicorn.conf.py
+
+Each worker process serves the snapshot read-only. The prices and the predictions in it are memory-mapped,
+so all the workers share one copy of them. After a new snapshot is built, send SIGHUP to the master process
+to replace the workers gracefully:
+    kill -HUP $(cat ~/.stock/gunicorn.pid)
+"""
+import multiprocessing
+from pathlib import Path
+
+
+wsgi_app = 'app:app'
+chdir = str(Path(__file__).resolve().parent)
+bind = '0.0.0.0:5000'
+
+# One worker process per core, and a few threads in each worker to overlap the network IO.
+workers = multiprocessing.cpu_count()
+worker_class = 'gthread'
+threads = 4
+
+# Serve the saved snapshot instead of opening qlib data and the database in each worker.
+raw_env = ['STOCK_PREDICTOR_READ_ONLY=1']
+
+pidfile = str(Path('~/.stock/gunicorn.pid').expanduser())
+accesslog = str(Path('~/.stock/access.log').expanduser())
+errorlog = str(Path('~/.stock/error.log').expanduser())
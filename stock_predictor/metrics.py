@@ -0,0 +1,225 @@
+import bisect
+from contextlib import contextmanager
+import math
+import threading
+import time
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+
+# Names of the metrics recorded by the service.
+STAGE_SECONDS = 'stock_predictor_stage_seconds'
+REQUEST_SECONDS = 'stock_predictor_request_seconds'
+BATCH_SIZE = 'stock_predictor_batch_size'
+CACHE_HITS = 'stock_predictor_cache_hits_total'
+CACHE_MISSES = 'stock_predictor_cache_misses_total'
+ROWS_READ = 'stock_predictor_rows_read_total'
+ROWS_WRITTEN = 'stock_predictor_rows_written_total'
+
+HELP = {
+    STAGE_SECONDS: 'Latency of the stages in seconds.',
+    REQUEST_SECONDS: 'Latency of the requests in seconds.',
+    BATCH_SIZE: 'Number of stocks in each batch.',
+    CACHE_HITS: 'Number of lookups served from the caches.',
+    CACHE_MISSES: 'Number of lookups missing the caches.',
+    ROWS_READ: 'Number of rows read from the storages.',
+    ROWS_WRITTEN: 'Number of rows written into the storages.',
+}
+
+# Upper bounds of the histogram buckets of latencies in seconds.
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0)
+# Upper bounds of the histogram buckets of batch sizes.
+SIZE_BUCKETS = (1, 10, 50, 100, 200, 500, 1000, 5000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Histogram of the observed values, with the count of values in each bucket, their sum and total count.
+    """
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        # The last count is for the values greater than all the bucket upper bounds.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate the quantile by interpolating linearly in the bucket it falls in, like histogram_quantile of Prometheus.
+        """
+        if self.count == 0:
+            return math.nan
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if cumulative + count >= rank and count > 0:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    Registry of the latency histograms and the counters of a process.
+
+    Recording a value takes a lock and a few dict operations, so it's cheap enough to be done on every request.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels: str) -> None:
+        """
+        Observe a value in the histogram with given name and labels.
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histograms = self.histograms.setdefault(name, {})
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Increase the counter with given name and labels.
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counters = self.counters.setdefault(name, {})
+            counters[key] = counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, stage: str, name: str = STAGE_SECONDS, **labels: str) -> Iterator[None]:
+        """
+        Measure the latency of the code in the context as the given stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, stage=stage, **labels)
+
+    def reset(self) -> None:
+        """
+        Remove all the recorded values.
+        """
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def export(self) -> Dict:
+        """
+        Export the raw recorded values, which could be merged into the metrics of another process.
+        """
+        with self.lock:
+            return {
+                'histograms': [
+                    (name, key, histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                    for name, histograms in self.histograms.items() for key, histogram in histograms.items()
+                ],
+                'counters': [(name, key, value) for name, counters in self.counters.items() for key, value in counters.items()],
+            }
+
+    def merge(self, exported: Dict) -> None:
+        """
+        Merge the values exported from the metrics of another process.
+        """
+        with self.lock:
+            for name, key, buckets, counts, sum, count in exported['histograms']:
+                key = tuple(tuple(label) for label in key)
+                histograms = self.histograms.setdefault(name, {})
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = Histogram(buckets)
+                histogram.counts = [mine + theirs for mine, theirs in zip(histogram.counts, counts)]
+                histogram.sum += sum
+                histogram.count += count
+            for name, key, value in exported['counters']:
+                key = tuple(tuple(label) for label in key)
+                counters = self.counters.setdefault(name, {})
+                counters[key] = counters.get(key, 0) + value
+
+    def to_prometheus(self) -> str:
+        """
+        Format the metrics in Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for name, histograms in sorted(self.histograms.items()):
+                lines += self._header(name, 'histogram')
+                for key, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(key + (("le", str(bound)),))} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {histogram.sum}')
+                    lines.append(f'{name}_count{_format_labels(key)} {histogram.count}')
+            for name, counters in sorted(self.counters.items()):
+                lines += self._header(name, 'counter')
+                for key, value in sorted(counters.items()):
+                    lines.append(f'{name}{_format_labels(key)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> Dict:
+        """
+        Summarize the metrics as a JSON serializable dict, with the count, sum, mean and estimated quantiles of each histogram.
+        """
+        with self.lock:
+            return {
+                'histograms': {
+                    name: [
+                        {
+                            'labels': dict(key),
+                            'count': histogram.count,
+                            'sum': round(histogram.sum, 6),
+                            'mean': round(histogram.sum / histogram.count, 6) if histogram.count else None,
+                            'p50': round(histogram.quantile(0.5), 6),
+                            'p95': round(histogram.quantile(0.95), 6),
+                            'p99': round(histogram.quantile(0.99), 6),
+                        }
+                        for key, histogram in sorted(histograms.items())
+                    ]
+                    for name, histograms in sorted(self.histograms.items())
+                },
+                'counters': {
+                    name: [{'labels': dict(key), 'value': value} for key, value in sorted(counters.items())]
+                    for name, counters in sorted(self.counters.items())
+                },
+            }
+
+    def _header(self, name: str, type: str) -> List[str]:
+        header = [f'# HELP {name} {HELP[name]}'] if name in HELP else []
+        return header + [f'# TYPE {name} {type}']
+
+
+def _format_labels(key: Labels) -> str:
+    """
+    Format the labels as {name="value",...}.
+    """
+    if not key:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in key) + '}'
+
+
+def _escape(value: str) -> str:
+    """
+    Escape the label value in Prometheus text exposition format.
+    """
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+# The metrics of current process.
+metrics = Metrics()
@@ -1,44 +1,129 @@
 import pandas as pd
 import qlib
 import qlib.data
-from qlib.data.dataset import DatasetH
 from qlib.workflow import R
+from typing import Dict, Optional, Tuple
 
-from data_handler import Alpha158TwoWeeks
+from feature_cache import FeatureCache
+from metrics import BATCH_SIZE, metrics, SIZE_BUCKETS
+from trading_calendar import TradingCalendar
+
+
+class FeatureDataset:
+    """
+    A dataset which feeds the precomputed features to the model.
+
+    The model only calls prepare() during inference, so this is all we need to replace DatasetH.
+    """
+
+    def __init__(self, features: pd.DataFrame) -> None:
+        self.features = features
+
+    def prepare(self, segments, col_set='feature', data_key=None) -> pd.DataFrame:
+        """
+        Return the features whatever the segments are. They have been selected when computing the features.
+        """
+        return self.features
+
+
+class Predictor:
+    """
+    Predictor which keeps the pre-trained model resident in memory.
+
+    The model is loaded from the recorder only once per process and cached by the recorder id.
+    Inference doesn't start any mlflow run, so no tracking artifact is written.
+    """
+
+    # Models loaded in this process, keyed by recorder id.
+    models = {}
+
+    def __init__(self, experiment_name: str = 'stock_predictor', recorder_name: str = 'two_weeks_model', feature_cache: Optional[FeatureCache] = None) -> None:
+        """
+        Load the model from the given recorder if it's not loaded yet.
+
+        Args:
+            experiment_name: The name of the experiment where the model is trained.
+            recorder_name: The name of the recorder which saves the model.
+            feature_cache: The cache of the features fed to the model. Default None means the default feature cache.
+        """
+        self.feature_cache = feature_cache if feature_cache is not None else FeatureCache()
+        recorder = R.get_recorder(experiment_name=experiment_name, recorder_name=recorder_name)
+        self.recorder_id = recorder.id
+        if self.recorder_id not in Predictor.models:
+            Predictor.models[self.recorder_id] = recorder.load_object("model.pkl")
+        self.model = Predictor.models[self.recorder_id]
+
+    def predict(self, ids='all', start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Predict the after-two-weeks price of the given stock in the specific date range.
+
+        Args:
+            id: The qlib id of the stock. Default 'all' means predicting all the stocks.
+            start_date: The beginning of the requested date range (inclusive).
+            end_date: The end of the requested date range (inclusive).
+        """
+        # Reset the date to the latest trading date
+        latest_trading_date = TradingCalendar.shared().latest(start_date)
+        if latest_trading_date is not None and latest_trading_date < start_date:
+            start_date = latest_trading_date
+        if end_date is None:
+            end_date = start_date
+
+        # Prepare the data used for inference. Only the features not cached yet are computed.
+        if ids == 'all':
+            ids = qlib.data.D.list_instruments(qlib.data.D.instruments('all'), start_time=start_date, end_time=end_date, as_list=True)
+        metrics.observe(BATCH_SIZE, len(ids), buckets=SIZE_BUCKETS, stage='predict')
+        with metrics.timer('features'):
+            features = self.feature_cache.get(ids, start_date, end_date)
+        if features.empty:
+            return pd.Series(index=features.index, dtype='float32')
+
+        # Predict with the resident model.
+        with metrics.timer('model'):
+            return self.model.predict(FeatureDataset(features))
+
+
+# The predictor shared by the whole process. It's created on the first prediction.
+_predictor = None
 
 
 def predict(ids='all', start_date=None, end_date=None) -> pd.DataFrame:
     """
-    Predict the after-two-weeks price of the given stock in the specific date range.
+    Predict the after-two-weeks price of the given stock in the specific date range with the predictor shared by the process.
 
     Args:
         id: The qlib id of the stock. Default 'all' means predicting all the stocks.
         start_date: The beginning of the requested date range (inclusive).
         end_date: The end of the requested date range (inclusive).
     """
-    # Reset the date to the latest trading date
-    latest_trading_date = qlib.data.D.calendar(start_time=(pd.Timestamp(start_date) - pd.Timedelta(days=20)).strftime("%Y-%m-%d"), end_time=start_date)[-1]
-    if latest_trading_date < pd.Timestamp(start_date):
-        start_date = latest_trading_date.strftime("%Y-%m-%d")
-    if end_date is None:
-        end_date = start_date
-
-    # Prepare the data used for inference.    
-    data_handler = Alpha158TwoWeeks(instruments=ids)
-    dataset = DatasetH(
-        handler=data_handler,
-        segments={
-            "test": [start_date, end_date]
-        }
-    )
-
-    # Start predicting with pre-trained model.
-    with R.start(experiment_name="stock_predictor", recorder_name='predict'):
-        model = R.get_recorder(recorder_name='two_weeks_model').load_object("model.pkl")
-        pred = model.predict(dataset)
-
-    # Set the predict recorder to deleted status.
-    recorder_id = R.get_recorder(experiment_name='stock_predictor', recorder_name='predict').id
-    R.get_exp(experiment_name='stock_predictor').delete_recorder(recorder_id=recorder_id)
-
-    return pred
\ No newline at end of file
+    global _predictor
+    if _predictor is None:
+        _predictor = Predictor()
+    return _predictor.predict(ids, start_date=start_date, end_date=end_date)
+
+
+def predict_in_worker(ids='all', start_date=None, end_date=None) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Predict in a worker process of the process pool, and return the metrics recorded by the prediction with the predictions.
+
+    The metrics are reset after exported, so they could be merged into the metrics of the main process without duplication.
+    """
+    predictions = predict(ids, start_date=start_date, end_date=end_date)
+    exported = metrics.export()
+    metrics.reset()
+    return predictions, exported
+
+
+def init_worker(provider_uri: str) -> None:
+    """
+    Initialize a worker process of the process pool for predicting.
+
+    Qlib and the model are initialized only once in each worker. Qlib computes expressions serially in the worker since
+    the parallelism comes from the pool.
+
+    Args:
+        provider_uri: The path of qlib data.
+    """
+    global _predictor
+    qlib.init(provider_uri=provider_uri, kernels=1)
+    _predictor = Predictor()
@@ -0,0 +1,61 @@
+from dataclasses import dataclass, field
+from dataclasses_json import dataclass_json
+import os
+from pathlib import Path
+from typing import List, Optional
+
+
+@dataclass_json()
+@dataclass
+class PredictRun:
+    """Manifest of a run of predicting all the stocks.
+
+    The manifest is saved after each batch is finished, so a run broken by a crash or a reboot could be resumed from it,
+    and only the unfinished batches are predicted again.
+
+    Args:
+        start_date (str): The first date to predict.
+        end_date (str): The last date to predict.
+        batches (List[List[str]]): The qlib ids of the stocks in each batch.
+        finished (List[int]): The indices of the finished batches.
+    """
+    start_date: str
+    end_date: str
+    batches: List[List[str]]
+    finished: List[int] = field(default_factory=list)
+
+    @property
+    def completed(self) -> bool:
+        """
+        Whether all the batches are finished.
+        """
+        return len(set(self.finished)) == len(self.batches)
+
+    def pending(self) -> List[int]:
+        """
+        Get the indices of the unfinished batches.
+        """
+        finished = set(self.finished)
+        return [index for index in range(len(self.batches)) if index not in finished]
+
+    def save(self, path: Path) -> None:
+        """
+        Save the manifest. It's written to a temporary file first and then renamed, so a crash never leaves a broken manifest.
+        """
+        path = Path(path)
+        os.makedirs(path.parent, exist_ok=True)
+        temporary_path = path.with_name(f'{path.name}.tmp')
+        with open(temporary_path, 'w') as manifest_file:
+            manifest_file.write(self.to_json())
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['PredictRun']:
+        """
+        Load the manifest, or return None if there is no manifest.
+        """
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path, 'r') as manifest_file:
+            return cls.from_json(manifest_file.read())
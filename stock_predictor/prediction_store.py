@@ -0,0 +1,201 @@
+import json
+import math
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import List, Optional
+
+import constants
+from metrics import metrics, ROWS_WRITTEN
+from versioned_directory import create_version, current_version, publish_version
+
+
+class PredictionStore:
+    """
+    Columnar store of the predictions of all the stocks.
+
+    The predictions are kept in a dense float32 matrix whose rows are trading dates and columns are qlib ids.
+    Missing predictions are NaN. The matrix is persisted as a .npy file and memory-mapped when loaded,
+    so reading a slice of it doesn't need to load the whole matrix.
+
+    Each save writes the matrix and its index into a new version directory, and then switches the CURRENT file to it,
+    so a reader always loads the matrix and the index of the same version.
+    """
+
+    VALUES_FILE = 'values.npy'
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, path: Path = constants.PREDICTION_STORE_PATH) -> None:
+        """
+        Load the prediction store from the given directory. An empty store is created if nothing is there.
+
+        Args:
+            path: The directory of the prediction store.
+        """
+        self.path = Path(path)
+        self.dates: List[str] = []
+        self.instruments: List[str] = []
+        self.values = np.empty((0, 0), dtype=np.float32)
+
+        # Stores saved before versioning keep their files in the store directory.
+        version_path = current_version(self.path) or self.path
+        if (version_path / self.INDEX_FILE).exists() and (version_path / self.VALUES_FILE).exists():
+            with open(version_path / self.INDEX_FILE, 'r') as index_file:
+                index = json.load(index_file)
+            values = np.load(version_path / self.VALUES_FILE, mmap_mode='r')
+            if values.shape != (len(index['dates']), len(index['instruments'])):
+                raise ValueError(f'Prediction store in {version_path} is corrupted: the shape of values is {values.shape}.')
+            self.dates = index['dates']
+            self.instruments = index['instruments']
+            self.values = values
+        self._build_lookup()
+
+    def _build_lookup(self) -> None:
+        """
+        Build the lookup tables from dates and instruments to matrix positions.
+        """
+        self.date_index = {date: position for position, date in enumerate(self.dates)}
+        self.instrument_index = {instrument: position for position, instrument in enumerate(self.instruments)}
+
+    def get_prediction(self, qlib_id: str, date: str) -> Optional[float]:
+        """
+        Get the prediction of one stock on the given date.
+
+        Args:
+            qlib_id: The qlib id of the stock.
+            date: The date string in format 'YYYY-mm-dd'.
+
+        Returns:
+            The prediction, or None if there is no prediction.
+        """
+        row = self.date_index.get(date)
+        column = self.instrument_index.get(qlib_id)
+        if row is None or column is None:
+            return None
+        prediction = float(self.values[row, column])
+        return None if math.isnan(prediction) else prediction
+
+    def get_stock_predictions(self, qlib_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.Series:
+        """
+        Get the predictions of one stock in the given date range.
+
+        Args:
+            qlib_id: The qlib id of the stock.
+            start_date: The beginning of the date range (inclusive). Default None means from the first date.
+            end_date: The end of the date range (inclusive). Default None means till the last date.
+
+        Returns:
+            A series of predictions indexed by date strings. Dates without prediction are not included.
+        """
+        column = self.instrument_index.get(qlib_id)
+        if column is None:
+            return pd.Series(dtype=np.float32)
+        start = 0 if start_date is None else np.searchsorted(self.dates, start_date, side='left')
+        end = len(self.dates) if end_date is None else np.searchsorted(self.dates, end_date, side='right')
+        predictions = pd.Series(self.values[start:end, column], index=self.dates[start:end])
+        return predictions.dropna()
+
+    def get_date_predictions(self, date: str) -> pd.Series:
+        """
+        Get the predictions of all stocks on the given date.
+
+        Args:
+            date: The date string in format 'YYYY-mm-dd'.
+
+        Returns:
+            A series of predictions indexed by qlib ids. Stocks without prediction on that date are not included.
+        """
+        row = self.date_index.get(date)
+        if row is None:
+            return pd.Series(dtype=np.float32)
+        predictions = pd.Series(self.values[row], index=self.instruments)
+        return predictions.dropna()
+
+    def get_recent_predictions(self, n: int) -> pd.DataFrame:
+        """
+        Get the predictions of all stocks in the last N dates of the store.
+
+        Args:
+            n: The number of dates.
+
+        Returns:
+            A DataFrame indexed by date strings with qlib ids as columns. Missing predictions are NaN.
+        """
+        start = max(len(self.dates) - n, 0)
+        return pd.DataFrame(self.values[start:], index=self.dates[start:], columns=self.instruments)
+
+    def get_dates_predictions(self, dates: List[str]) -> pd.DataFrame:
+        """
+        Get the predictions of all stocks on the given dates.
+
+        Args:
+            dates: The date strings in format 'YYYY-mm-dd'.
+
+        Returns:
+            A DataFrame indexed by the given dates with qlib ids as columns. Missing predictions, including those on dates not in the store, are NaN.
+        """
+        values = np.full((len(dates), len(self.instruments)), np.nan, dtype=np.float32)
+        positions = np.array([self.date_index.get(date, -1) for date in dates], dtype=np.int64)
+        found = positions >= 0
+        values[found] = self.values[positions[found]]
+        return pd.DataFrame(values, index=dates, columns=self.instruments)
+
+    def update(self, predictions: pd.Series) -> None:
+        """
+        Write predictions into the store and persist it.
+
+        Args:
+            predictions: The predictions indexed by (datetime, instrument), which is the format produced by the model.
+        """
+        predictions = predictions.dropna()
+        if predictions.empty:
+            return
+        with metrics.timer('prediction_store_update'):
+            self._update(predictions)
+        metrics.increment(ROWS_WRITTEN, len(predictions), target='prediction_store')
+
+    def _update(self, predictions: pd.Series) -> None:
+        """
+        Write the predictions without NaN into the store and persist it.
+        """
+        dates = predictions.index.get_level_values('datetime').strftime('%Y-%m-%d')
+        instruments = predictions.index.get_level_values('instrument')
+
+        # Grow the matrix if there are new dates or new instruments.
+        new_dates = sorted(set(dates).difference(self.date_index))
+        new_instruments = sorted(set(instruments).difference(self.instrument_index))
+        if new_dates or new_instruments:
+            all_dates = sorted(self.dates + new_dates)
+            all_instruments = self.instruments + new_instruments
+            values = np.full((len(all_dates), len(all_instruments)), np.nan, dtype=np.float32)
+            if len(self.dates) > 0:
+                rows = np.searchsorted(all_dates, self.dates)
+                values[rows, :len(self.instruments)] = self.values
+            self.dates = all_dates
+            self.instruments = all_instruments
+            self._build_lookup()
+        else:
+            values = np.array(self.values)
+
+        rows = [self.date_index[date] for date in dates]
+        columns = [self.instrument_index[instrument] for instrument in instruments]
+        values[rows, columns] = predictions.to_numpy(dtype=np.float32)
+        self.values = values
+        self.save()
+
+    def save(self, path: Optional[Path] = None) -> None:
+        """
+        Persist the store as a new version in its directory, and point the directory to it.
+
+        The CURRENT file is switched after both files of the version are written, so that readers never see
+        a partially written version, nor the values of one version with the index of another.
+
+        Args:
+            path: The directory to save the store. Default None means the directory of the store.
+        """
+        version_path = create_version(self.path if path is None else path)
+        with open(version_path / self.VALUES_FILE, 'wb') as values_file:
+            np.save(values_file, np.ascontiguousarray(self.values, dtype=np.float32))
+        with open(version_path / self.INDEX_FILE, 'w') as index_file:
+            json.dump({'dates': self.dates, 'instruments': self.instruments}, index_file)
+        publish_version(version_path)
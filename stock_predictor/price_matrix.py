@@ -0,0 +1,112 @@
+import bisect
+import json
+import math
+import numpy as np
+import os
+import pandas as pd
+from pathlib import Path
+from typing import List, Tuple
+
+from trading_calendar import TradingCalendar
+
+
+class PriceMatrix:
+    """
+    Adjusted close prices of the stocks kept in a compact float32 matrix.
+
+    The rows are trading days and the columns are qlib ids. Missing prices are NaN.
+    History windows are served as slices of the matrix without touching qlib data.
+    The matrix could be saved as a .npy file, which is memory-mapped when loaded.
+    """
+
+    VALUES_FILE = 'values.npy'
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, dates: List[str], instruments: List[str], values: np.ndarray) -> None:
+        """
+        Initialize the price matrix.
+
+        Args:
+            dates: The trading days in format 'YYYY-mm-dd' in ascending order.
+            instruments: The qlib ids of the stocks.
+            values: The prices with shape (len(dates), len(instruments)).
+        """
+        self.dates = dates
+        self.instruments = instruments
+        self.values = values
+        self.instrument_index = {instrument: position for position, instrument in enumerate(instruments)}
+
+    @classmethod
+    def from_qlib(cls, qlib_ids: List[str], start_date: str, end_date: str, batch_size: int = 500) -> 'PriceMatrix':
+        """
+        Load the adjusted close prices of the given stocks from qlib data.
+
+        Args:
+            qlib_ids: The qlib ids of the stocks.
+            start_date: The first date to load (inclusive).
+            end_date: The last date to load (inclusive).
+            batch_size: The number of stocks loaded in one qlib call.
+        """
+        import qlib.data
+
+        dates = TradingCalendar.shared().between(start_date, end_date)
+        instruments = list(dict.fromkeys(qlib_ids))
+        values = np.full((len(dates), len(instruments)), np.nan, dtype=np.float32)
+        if len(dates) == 0:
+            return cls(dates, instruments, values)
+
+        instrument_index = {instrument: position for position, instrument in enumerate(instruments)}
+        for start in range(0, len(instruments), batch_size):
+            features = qlib.data.D.features(instruments[start:start + batch_size], ['$close/$factor'], start_date, end_date)
+            if len(features.index) == 0:
+                continue
+            prices = features['$close/$factor'].unstack(level='instrument').reindex(pd.DatetimeIndex(dates))
+            columns = [instrument_index[instrument] for instrument in prices.columns]
+            values[:, columns] = prices.to_numpy(dtype=np.float32)
+        return cls(dates, instruments, values)
+
+    @classmethod
+    def from_file(cls, path: Path) -> 'PriceMatrix':
+        """
+        Load the price matrix saved in the given directory. The prices are memory-mapped.
+
+        Args:
+            path: The directory where the price matrix is saved.
+        """
+        path = Path(path)
+        with open(path / cls.INDEX_FILE, 'r') as index_file:
+            index = json.load(index_file)
+        return cls(index['dates'], index['instruments'], np.load(path / cls.VALUES_FILE, mmap_mode='r'))
+
+    def save(self, path: Path) -> None:
+        """
+        Save the price matrix into the given directory.
+
+        Args:
+            path: The directory to save the price matrix.
+        """
+        path = Path(path)
+        os.makedirs(path, exist_ok=True)
+        np.save(path / self.VALUES_FILE, np.ascontiguousarray(self.values, dtype=np.float32))
+        with open(path / self.INDEX_FILE, 'w') as index_file:
+            json.dump({'dates': self.dates, 'instruments': self.instruments}, index_file)
+
+    def get_recent_prices(self, qlib_id: str, date: str, n: int) -> List[Tuple[str, float]]:
+        """
+        Get the prices of the stock in the recent N trading days till the given date.
+
+        Args:
+            qlib_id: The qlib id of the stock.
+            date: The last date of the window (inclusive).
+            n: The number of trading days in the window.
+
+        Returns:
+            The list of date and price pairs in ascending order of date. Days with missing price are not included.
+        """
+        column = self.instrument_index.get(qlib_id)
+        if column is None:
+            return []
+        end = bisect.bisect_right(self.dates, date)
+        start = max(end - n, 0)
+        prices = self.values[start:end, column].tolist()
+        return [(self.dates[start + offset], price) for offset, price in enumerate(prices) if not math.isnan(price)]
@@ -0,0 +1,106 @@
+import bisect
+import numpy as np
+from typing import Dict, Iterator, List, Tuple
+
+from prediction_store import PredictionStore
+
+
+class RankingIndex:
+    """
+    Ranking of the stocks by their consensus scores on each trading day.
+
+    The consensus score of a stock on a trading day is the sum of its predictions in the last K trading days.
+    Stocks without prediction in any of those days are not ranked. A trading day is ranked on demand: the top stocks are
+    selected with a partial sort, and more are selected only when the caller iterates past them, so reading the top N costs
+    about O(M + N log N) for M stocks. The predictions are read from the prediction store without copying, so the memory-mapped
+    pages are shared by the processes serving the same snapshot.
+    """
+
+    # The largest number of trading days the consensus score could sum over.
+    MAX_WINDOW = 5
+    # The number of stocks selected at first when a trading day is ranked. It's doubled each time more stocks are iterated.
+    HEAD_SIZE = 32
+    # The max number of ranked trading days kept in the memo.
+    MAX_MEMO_SIZE = 256
+
+    def __init__(self, prediction_store: PredictionStore, trading_days: List[str], window: int = 3) -> None:
+        """
+        Build the ranking index from the prediction store.
+
+        Args:
+            prediction_store: The prediction store. It must not be updated after the index is built.
+            trading_days: The trading days in format 'YYYY-mm-dd' in ascending order.
+            window: The default number of trading days the consensus score sums over, at most MAX_WINDOW.
+        """
+        if not 1 <= window <= self.MAX_WINDOW:
+            raise ValueError(f'The window {window} is not in range [1, {self.MAX_WINDOW}].')
+        self.trading_days = trading_days
+        self.instruments = prediction_store.instruments
+        self.values = prediction_store.values
+        # The row of each trading day in the prediction store, or -1 if the store has no prediction on that day.
+        self.rows = np.array([prediction_store.date_index.get(trading_day, -1) for trading_day in trading_days], dtype=np.int64)
+        self.window = window
+        # The scores, the number of ranked stocks and the sorted head of the ranking, keyed by trading day position and window.
+        self.memo: Dict[Tuple[int, int], Tuple[np.ndarray, int, np.ndarray]] = {}
+
+    def _scores(self, position: int, window: int) -> np.ndarray:
+        """
+        Compute the consensus scores of the stocks on the trading day at the given position. Stocks not ranked score -inf.
+        """
+        rows = self.rows[max(position - window + 1, 0):position + 1]
+        if len(rows) < window or (rows < 0).any():
+            return np.full(len(self.instruments), -np.inf)
+        predictions = self.values[rows].astype(np.float64)
+        return np.where(np.isnan(predictions).any(axis=0), -np.inf, predictions.sum(axis=0))
+
+    @staticmethod
+    def _head(scores: np.ndarray, n: int) -> np.ndarray:
+        """
+        Select the positions of the top N ranked stocks, sorted by score descending and then by position.
+
+        The stocks tied with the N-th one are all included, so a longer head always starts with a shorter one.
+        """
+        ranked = np.flatnonzero(np.isfinite(scores))
+        if n < len(ranked):
+            threshold = np.partition(scores[ranked], len(ranked) - n)[len(ranked) - n]
+            ranked = ranked[scores[ranked] >= threshold]
+        return ranked[np.lexsort((ranked, -scores[ranked]))]
+
+    def iterate(self, date: str, window: int = None) -> Iterator[Tuple[str, float]]:
+        """
+        Iterate the ranked stocks on the latest trading day till the given date, from the highest score to the lowest.
+
+        Args:
+            date: The date in format 'YYYY-mm-dd'.
+            window: The number of trading days the consensus score sums over, at most MAX_WINDOW. Default None means the default window.
+
+        Returns:
+            An iterator of the qlib id and the prediction on that trading day of each ranked stock.
+        """
+        if window is None:
+            window = self.window
+        if not 1 <= window <= self.MAX_WINDOW:
+            raise ValueError(f'The window {window} is not in range [1, {self.MAX_WINDOW}].')
+        position = bisect.bisect_right(self.trading_days, date) - 1
+        if position < 0:
+            return
+
+        # The memo may be cleared by another request at any time, so the entry is held in local variables.
+        entry = self.memo.get((position, window))
+        if entry is None:
+            scores = self._scores(position, window)
+            entry = (scores, int(np.isfinite(scores).sum()), self._head(scores, self.HEAD_SIZE))
+            if len(self.memo) >= self.MAX_MEMO_SIZE:
+                self.memo.clear()
+            self.memo[(position, window)] = entry
+        scores, count, head = entry
+
+        row = self.rows[position]
+        iterated = 0
+        while True:
+            for column in head[iterated:]:
+                yield self.instruments[column], float(self.values[row, column])
+            iterated = len(head)
+            if iterated >= count:
+                return
+            head = self._head(scores, 2 * iterated)
@@ -0,0 +1,45 @@
+import brotli
+from dataclasses import dataclass
+import gzip
+import hashlib
+from typing import Dict
+
+
+# The compression levels of the responses built on the request path, which trade compression ratio for latency.
+# The responses built along with the snapshot use the highest levels.
+ON_DEMAND_BROTLI_QUALITY = 4
+ON_DEMAND_GZIP_LEVEL = 6
+
+
+@dataclass
+class CachedResponse:
+    """
+    A response body cached together with its compressed encodings and its ETag.
+
+    Args:
+        body (bytes): The uncompressed body.
+        etag (str): The content hash of the body, used as the ETag of the response.
+        encodings (Dict[str, bytes]): The compressed bodies keyed by content coding, e.g. 'br' and 'gzip'.
+        mimetype (str): The mimetype of the body.
+    """
+    body: bytes
+    etag: str
+    encodings: Dict[str, bytes]
+    mimetype: str = 'application/json'
+
+    @classmethod
+    def from_text(cls, text: str, mimetype: str = 'application/json', on_demand: bool = False) -> 'CachedResponse':
+        """
+        Encode the text and compress it in all supported encodings.
+
+        Args:
+            text: The response text.
+            mimetype: The mimetype of the text.
+            on_demand: If True, the response is built on the request path, so it's compressed with the low levels.
+        """
+        body = text.encode('utf-8')
+        encodings = {
+            'br': brotli.compress(body, quality=ON_DEMAND_BROTLI_QUALITY) if on_demand else brotli.compress(body),
+            'gzip': gzip.compress(body, compresslevel=ON_DEMAND_GZIP_LEVEL) if on_demand else gzip.compress(body),
+        }
+        return cls(body, hashlib.sha1(body).hexdigest(), encodings, mimetype)
@@ -0,0 +1,75 @@
+import bisect
+from functools import lru_cache
+from itertools import chain
+from typing import Dict, Iterable, List
+
+from stock import Stock
+
+
+@lru_cache(maxsize=None)
+def pinyin_initials(name: str) -> str:
+    """
+    Translate the Chinese name of the stock to Pinyin and select the first character of each word.
+
+    This will help users look up their stock rapidly. The results are memoized by name.
+    """
+    # Pypinyin loads its large dictionaries when imported, so it's only imported when a name needs translating.
+    import pypinyin
+
+    # TODO: Need to confirm if there are problems of heteronym.
+    pinyin_lists = pypinyin.pinyin(name, style=pypinyin.FIRST_LETTER)
+    return ''.join(list(chain(*pinyin_lists))).upper()
+
+
+class SearchIndex:
+    """
+    Prefix search index over the id, the pinyin initials and the Chinese name of the stocks.
+
+    Each kind of key is kept in a sorted list of (key, position) pairs, and the stocks matching a prefix are found with bisect.
+    """
+
+    def __init__(self, stocks: Iterable[Stock]) -> None:
+        """
+        Build the search index.
+
+        Args:
+            stocks: The stocks to search in.
+        """
+        self.stocks = list(stocks)
+        # Matches on id come first, then on pinyin, and at last on name.
+        self.sorted_keys = [
+            sorted((key.upper(), position) for position, key in enumerate(keys) if key)
+            for keys in (
+                [stock.id for stock in self.stocks],
+                [stock.pinyin for stock in self.stocks],
+                [stock.name for stock in self.stocks],
+            )
+        ]
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, str]]:
+        """
+        Search the stocks whose id, pinyin initials or name starts with the query.
+
+        Args:
+            query: The prefix to search. It's case-insensitive.
+            limit: The max number of stocks returned.
+
+        Returns:
+            The id, pinyin and name of the matched stocks.
+        """
+        query = query.strip().upper()
+        if not query or limit <= 0:
+            return []
+        positions = []
+        for sorted_keys in self.sorted_keys:
+            start = bisect.bisect_left(sorted_keys, (query,))
+            for index in range(start, len(sorted_keys)):
+                key, position = sorted_keys[index]
+                if not key.startswith(query) or len(positions) >= limit:
+                    break
+                if position not in positions:
+                    positions.append(position)
+        return [
+            {'id': self.stocks[position].id, 'pinyin': self.stocks[position].pinyin, 'name': self.stocks[position].name}
+            for position in positions
+        ]
@@ -1,19 +1,83 @@
+import dataclasses
 import datetime
-from itertools import chain
 import json
-import math
+import numpy as np
 import os
 import pandas as pd
-import pypinyin
-import qlib.data
-import tqdm
-from typing import Iterable
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
 
 import constants
-from crawler import Crawler
-from database import MongoDatabase
-import predict
+from metrics import CACHE_HITS, CACHE_MISSES, metrics
+from prediction_store import PredictionStore
+from price_matrix import PriceMatrix
+from response_cache import CachedResponse
+from search_index import pinyin_initials
+from snapshot import Snapshot
 from stock import Stock
+from trading_calendar import TradingCalendar
+
+# The dependencies only used by the tools, e.g. qlib, the models and the crawler, are imported in the methods using them,
+# so that serving the requests doesn't pay for importing them.
+if TYPE_CHECKING:
+    from predict_run import PredictRun
+
+
+# The fields of a stock returned in the history and predict result. History and predictions are filled by the service.
+RESULT_FIELDS = ['id', 'pinyin', 'name', 'qlib_id', 'enname', 'delisted', 'listing_date', 'delisted_date']
+
+# The number of trading days of the history prices in the history and predict result.
+HISTORY_DAYS = 40
+
+# The number of trading days after which the price is predicted. It's the horizon of the label of the model.
+PREDICT_DAYS = 10
+
+# The fields of a stock maintained from the stock lists of the stock exchanges.
+STOCK_LIST_FIELDS = ['id', 'pinyin', 'name', 'qlib_id', 'delisted', 'listing_date']
+
+
+def diff_stock_list(stock_list: pd.DataFrame, stored_stocks: List[Stock]) -> Tuple[List[Stock], List[str], List[str]]:
+    """
+    Compare the latest stock list with the stocks stored in database.
+
+    The pinyin of a stock is reused if its name is not changed, so only the new names need translating.
+
+    Args:
+        stock_list: The latest stock list with columns id, name, qlib_id and listing_date.
+        stored_stocks: The stocks in database with the fields in STOCK_LIST_FIELDS.
+
+    Returns:
+        The stocks which are new or changed, the ids of the listed stocks in database missing from the latest stock list,
+        and the ids of the delisted stocks in database appearing in the latest stock list again.
+    """
+    stored = pd.DataFrame(
+        [[getattr(stock, field) for field in STOCK_LIST_FIELDS] for stock in stored_stocks],
+        columns=STOCK_LIST_FIELDS,
+        dtype=object
+    )
+    stock_list = stock_list[['id', 'name', 'qlib_id', 'listing_date']].drop_duplicates('id', keep='last')
+    merged = stock_list.merge(stored, on='id', how='left', suffixes=('', '_stored')).rename(columns={'pinyin': 'pinyin_stored'})
+
+    # Translate the Chinese names to Pinyin and select the first character of each word, unless the name is not changed.
+    merged['pinyin'] = merged['pinyin_stored'].where(merged['name'] == merged['name_stored'])
+    untranslated = merged['pinyin'].isna()
+    merged.loc[untranslated, 'pinyin'] = merged.loc[untranslated, 'name'].map(pinyin_initials)
+
+    # A stock is written if it's new, relisted or any of its fields is changed.
+    unchanged = merged['delisted'].eq(False)
+    for field in ['pinyin', 'name', 'qlib_id', 'listing_date']:
+        unchanged &= merged[field].fillna('') == merged[f'{field}_stored'].fillna('')
+    changed = merged[~unchanged]
+    stocks = [
+        Stock(id=id, pinyin=pinyin, name=name, qlib_id=qlib_id, delisted=False, listing_date=None if pd.isna(listing_date) else listing_date)
+        for id, pinyin, name, qlib_id, listing_date in zip(changed['id'], changed['pinyin'], changed['name'], changed['qlib_id'], changed['listing_date'])
+    ]
+
+    # A listed stock is delisted if it doesn't appear in the latest stock list.
+    delisted_ids = stored.loc[stored['delisted'].eq(False) & ~stored['id'].isin(stock_list['id']), 'id'].tolist()
+    # A delisted stock is relisted if it appears in the latest stock list again.
+    relisted_ids = merged.loc[merged['delisted'].eq(True), 'id'].tolist()
+    return stocks, delisted_ids, relisted_ids
 
 
 class Service:
@@ -23,74 +87,103 @@ class Service:
     This class provides all the necessary methods for the web app.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, read_only: bool = False, serve: bool = True, warm_start: bool = False) -> None:
         """
         Initialize service.
-        """
-        qlib.init(provider_uri=constants.QLIB_DATA_PATH)
-        self.database = MongoDatabase()
 
-        # Cache the stock list to avoid latency.
-        self.stock_list = None
-        self.stock_list = self.get_stock_list()
+        Args:
+            read_only: If True, serve the latest snapshot saved in the snapshot directory without opening qlib data and the database.
+                This is how the worker processes of the production server run. The tools are not available in this mode.
+            serve: If False, the snapshot for serving the requests is not loaded, which saves the startup time of the tools not needing it.
+            warm_start: If True and a snapshot is saved in the snapshot directory, serve it right away, and open qlib data and
+                the database and rebuild the snapshot from them in background. The rebuilt snapshot is saved for the next start.
+        """
+        self.read_only = read_only
+        self.warm_start = warm_start
+        self.database = None
+
+        # Only one refresh of the data runs at a time. Its status is reported to the web app.
+        self.refresh_lock = threading.Lock()
+        self.refresh_status: Dict[str, Any] = {'status': 'idle'}
+
+        # All the data served to the requests. Requests read it without locking, so it's never modified but replaced as a whole.
+        self.snapshot = None
+        if serve and warm_start and not read_only and Snapshot.exists(constants.SNAPSHOT_PATH):
+            with metrics.timer('load_snapshot'):
+                self.snapshot = Snapshot.load(constants.SNAPSHOT_PATH)
+            # Reconcile the saved snapshot with the database in background.
+            self.start_refresh()
+            return
+
+        if not read_only:
+            self._open_data_sources()
+        if serve:
+            # The results are composed on demand at startup, so that the first request could be served as soon as possible.
+            self.snapshot = self.load_snapshot(cache_results=False)
+
+    def _open_data_sources(self) -> None:
+        """
+        Open or reopen qlib data, the database and the prediction store.
+        """
+        import qlib
+        from database import open_database
 
-        # Cache the topN stocks.
-        self.topN = None
-        self.topN_date = None
+        qlib.init(provider_uri=constants.QLIB_DATA_PATH)
+        TradingCalendar.reload()
+        if self.database is None:
+            self.database = open_database()
+        else:
+            self.database.refresh()
+        self.prediction_store = PredictionStore()
 
     def load_stock_list(self) -> None:
         """
         Load stock list from official stock exchange website and update the database.
         """
+        from crawler import HttpCrawler
+
         # Crawl the stock list files from the official websites of stock exchanges.
-        with Crawler() as cralwer:
-            cralwer.crawl_shanghai_stock_list(constants.SH_STOCK_LIST_PATH)
+        with metrics.timer('crawl_stock_lists'), HttpCrawler() as crawler:
+            hashes = crawler.crawl_stock_lists({'SH': constants.SH_STOCK_LIST_PATH, 'SZ': constants.SZ_STOCK_LIST_PATH})
+
+        # Skip parsing the files if they are the same as the ones loaded into database last time,
+        # and the database still has as many listed stocks as loaded, e.g. it's not replaced or restored meanwhile.
+        if constants.STOCK_LIST_HASH_PATH.exists():
+            with open(constants.STOCK_LIST_HASH_PATH, 'r') as hash_file:
+                loaded = json.load(hash_file)
+            if loaded.get('hashes') == hashes and loaded.get('listed_stocks') == len(self.database.all(fields=['id'], where={'delisted': False})):
+                print('Stock lists are not changed.')
+                return
+        with metrics.timer('parse_stock_lists'):
             shanghai_stock_list = pd.read_excel(constants.SH_STOCK_LIST_PATH, dtype=str)[['A股代码', '证券简称', '上市日期']]
-            cralwer.crawl_shenzhen_stock_list(constants.SZ_STOCK_LIST_PATH)
             shenzhen_stock_list = pd.read_excel(constants.SZ_STOCK_LIST_PATH, dtype=str)[['A股代码', 'A股简称', 'A股上市日期']]
 
-        # Combine two stock lists.
+        # Format the listing dates of Shanghai stock exchange, which are in format 'YYYYmmdd'.
         shanghai_stock_list.columns = ['id', 'name', 'listing_date']
-        shanghai_stock_list['stock_exchange'] = 'SH'
+        shanghai_stock_list['listing_date'] = pd.to_datetime(shanghai_stock_list['listing_date'], format='%Y%m%d').dt.strftime('%Y-%m-%d')
+        shanghai_stock_list['qlib_id'] = 'SH' + shanghai_stock_list['id']
         shenzhen_stock_list.columns = ['id', 'name', 'listing_date']
-        shenzhen_stock_list['stock_exchange'] = 'SZ'
-        stock_list = pd.concat([shanghai_stock_list, shenzhen_stock_list])
-
-        # Load stock list into database.
-        print('Load stock list into database...')
-        stock_list_with_progressbar = tqdm.tqdm(stock_list.iterrows(), total=stock_list.shape[0])
-        for _, row in stock_list_with_progressbar:
-            # Remove spaces in name.
-            name = row['name'].replace(' ', '')
-
-            # We need to translate the Chinese name of the stock to Pinyin and select the first Character of each word.
-            # This will help users look up their stock rapidly.
-            # TODO: Need to confirm if there are problems of heteronym.
-            pinyin_lists = pypinyin.pinyin(name, style=pypinyin.FIRST_LETTER)
-            pinyin = ''.join(list(chain(*pinyin_lists))).upper()
-
-            # Format listing date.
-            listing_date = row['listing_date']
-            if row['stock_exchange'] == 'SH':
-                listing_date = datetime.datetime.strptime(row['listing_date'], '%Y%m%d').strftime('%Y-%m-%d')
-
-            # Update or insert stock.
-            stock = Stock(
-                id=row['id'],
-                pinyin=pinyin,
-                name=name,
-                qlib_id=row['stock_exchange'] + row['id'],
-                delisted=False,
-                listing_date=listing_date
-            )
-            self.database.upsert(stock)
+        shenzhen_stock_list['qlib_id'] = 'SZ' + shenzhen_stock_list['id']
 
-        # Mark a stock as delisted if it doesn't appear in the new stock list.
-        id_set = set(stock_list['id'])
-        for stock in tqdm.tqdm(self.database.all()):
-            if stock.id not in id_set:
-                stock.delisted = True
-                self.database.upsert(stock)
+        # Combine two stock lists.
+        stock_list = pd.concat([shanghai_stock_list, shenzhen_stock_list], ignore_index=True)
+        # Remove spaces in name.
+        stock_list['name'] = stock_list['name'].str.replace(' ', '', regex=False)
+
+        # Only write the stocks which are new or changed, and mark the missing ones as delisted.
+        stored_stocks = self.database.all(fields=STOCK_LIST_FIELDS)
+        with metrics.timer('diff_stock_list'):
+            stocks, delisted_ids, relisted_ids = diff_stock_list(stock_list, stored_stocks)
+        print(f'{len(stock_list)} stocks in the stock list. {len(stocks)} new or changed, {len(delisted_ids)} delisted, {len(relisted_ids)} relisted.')
+        # Relisted stocks are marked first, so their delisted dates are still cleared if the following writes fail.
+        self.database.mark_relisted(relisted_ids)
+        self.database.upsert_many(stocks)
+        self.database.mark_delisted(delisted_ids, delisted_date=datetime.date.today().strftime('%Y-%m-%d'))
+
+        # Record the hashes only after the database is updated, so the files are loaded again if anything fails.
+        # All the stocks in the stock list are listed in database now, and the others are delisted.
+        with open(constants.STOCK_LIST_HASH_PATH, 'w') as hash_file:
+            json.dump({'hashes': hashes, 'listed_stocks': int(stock_list['id'].nunique())}, hash_file)
 
     def batch(self, iterable, n=1) -> Iterable:
         """
@@ -105,64 +198,177 @@ class Service:
         for ndx in range(0, l, n):
             yield iterable[ndx:min(ndx + n, l)]
 
-    def predict_all(self, date=None) -> None:
+    def predict_all(self, date=None, workers=1, resume=False, overwrite=False, batch_size=200) -> None:
         """
-        Predict for all stocks in given date. If no date is given, predict for all the dates.
+        Predict for all stocks from given date till today. If no date is given, predict for all the dates.
+
+        The progress is checkpointed in a run manifest after each batch is written into the prediction store,
+        so a broken run could be resumed later without predicting the finished batches again.
 
         Args:
-            date: The date to predict.
+            date: The first date to predict.
+            workers: The number of worker processes. Default 1 means predicting in current process.
+            resume: If True, resume the unfinished batches of the last run, if any, with its dates. The date argument is ignored in that case.
+            overwrite: If True, also predict the stocks whose predictions already cover all the trading days to predict.
+            batch_size: The number of stocks predicted in one forward pass.
         """
+        from predict_run import PredictRun
+        import tqdm
+
+        run = PredictRun.load(constants.PREDICT_RUN_PATH) if resume else None
+        if run is None or run.completed:
+            if resume:
+                print('No unfinished run to resume. Start a new run.')
+            run = self.plan_predict_run(date, overwrite, batch_size)
+            run.save(constants.PREDICT_RUN_PATH)
+        else:
+            print(f'Resume the run from {run.start_date} to {run.end_date}. {len(run.finished)} of {len(run.batches)} batches are finished.')
+
+        pending = run.pending()
+        with tqdm.tqdm(total=sum(len(run.batches[index]) for index in pending)) as progress_bar:
+            for index, predictions in self._predict_batches(run, pending, workers):
+                # Write the predictions into the store before marking the batch as finished, so no batch is lost by a crash between them.
+                self.prediction_store.update(predictions)
+                run.finished.append(index)
+                run.save(constants.PREDICT_RUN_PATH)
+                progress_bar.update(len(run.batches[index]))
+
+    def plan_predict_run(self, date: Optional[str] = None, overwrite: bool = False, batch_size: int = 200) -> 'PredictRun':
+        """
+        Plan a run of predicting all the stocks from the given date till today.
+
+        Args:
+            date: The first date to predict. Default None means the date we start to support predicting.
+            overwrite: If False, the stocks whose predictions already cover all the trading days to predict are skipped.
+            batch_size: The number of stocks in one batch.
+        """
+        from predict_run import PredictRun
+
         if date is None:
             date = constants.START_PREDICTING_DATE
+        end_date = datetime.date.today().strftime('%Y-%m-%d')
+
+        qlib_ids = list(dict.fromkeys(stock.qlib_id for stock in self.database.all(fields=['qlib_id'])))
+        if not overwrite:
+            trading_days = TradingCalendar.shared().between(date, end_date)
+            predicted = ~np.isnan(self.prediction_store.get_dates_predictions(trading_days).to_numpy())
+            covered = {qlib_id for qlib_id, all_predicted in zip(self.prediction_store.instruments, predicted.all(axis=0)) if all_predicted}
+            qlib_ids = [qlib_id for qlib_id in qlib_ids if qlib_id not in covered]
+        return PredictRun(date, end_date, list(self.batch(qlib_ids, batch_size)))
+
+    def _predict_batches(self, run: 'PredictRun', indices: List[int], workers: int) -> Iterator[Tuple[int, pd.Series]]:
+        """
+        Predict the given batches of the run, and yield the index and the predictions of each batch once it's finished.
+        """
+        from concurrent.futures import as_completed, ProcessPoolExecutor
+        import multiprocessing
+        import predict
 
-        all_stocks_in_database = self.database.all()
-        with tqdm.tqdm(total=len(all_stocks_in_database)) as progress_bar:
-            for stocks in self.batch(all_stocks_in_database, 200):
+        if workers <= 1 or len(indices) <= 1:
+            for index in indices:
                 # Predict a batch of stocks in one forward pass.
-                predictions = predict.predict([stock.qlib_id for stock in stocks], start_date=date, end_date=datetime.date.today().strftime('%Y-%m-%d'))
-                if not predictions.empty:
-                    for stock in stocks:
-                        # Check if the result for current stock exists.
-                        if not predictions.index.isin([stock.qlib_id], level='instrument').any():
-                            continue
-                        # Select the prediction for current stock.
-                        prediction = predictions.loc[(slice(None), stock.qlib_id),].droplevel('instrument')
-                        prediction.index = prediction.index.map(lambda timestamp: timestamp.strftime('%Y-%m-%d'))
-                        # Update the stock with the prediction.
-                        if stock.predict is None:
-                            stock.predict = prediction.to_dict()
-                        else:
-                            stock.predict.update(prediction.to_dict())
-                        self.database.upsert(stock)
-                progress_bar.update(len(stocks))
+                with metrics.timer('predict_batch'):
+                    predictions = predict.predict(run.batches[index], start_date=run.start_date, end_date=run.end_date)
+                yield index, predictions
+            return
+
+        # Shard the batches across a process pool. Each worker initializes qlib and the model only once.
+        # Spawned workers don't inherit the database connection and qlib states of current process.
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=predict.init_worker,
+            initargs=(constants.QLIB_DATA_PATH,)
+        ) as executor:
+            futures = {
+                executor.submit(predict.predict_in_worker, run.batches[index], start_date=run.start_date, end_date=run.end_date): index
+                for index in indices
+            }
+            for future in as_completed(futures):
+                # The metrics recorded in the workers are merged into the metrics of current process.
+                predictions, worker_metrics = future.result()
+                metrics.merge(worker_metrics)
+                yield futures[future], predictions
+
+    def load_snapshot(self, cache_results: bool = True) -> Snapshot:
+        """
+        Load the snapshot of the data served to the requests.
+
+        In read-only mode, the latest snapshot saved in the snapshot directory is loaded. Otherwise it's built from qlib data,
+        the database and the prediction store.
+
+        Args:
+            cache_results: If True, the history and predict results of all the supported stocks at the snapshot date are cached
+                in the snapshot to avoid latency. Otherwise they are cached when they are requested for the first time.
+        """
+        if self.read_only:
+            self._report_progress('loading snapshot', 0.0)
+            with metrics.timer('load_snapshot'):
+                snapshot = Snapshot.load(constants.SNAPSHOT_PATH)
+        else:
+            self._report_progress('loading stocks', 0.0)
+            stocks = self.database.all(fields=RESULT_FIELDS)
+            self._report_progress('loading prices', 0.1)
+            with metrics.timer('load_prices'):
+                prices = self.load_prices([stock.qlib_id for stock in stocks])
+            self._report_progress('building indices', 0.6)
+            # The snapshot owns a separate prediction store, so that updating the predictions never affects the requests.
+            with metrics.timer('build_snapshot'):
+                snapshot = Snapshot(datetime.date.today().strftime('%Y-%m-%d'), stocks, prices, PredictionStore(self.prediction_store.path))
+        if not cache_results:
+            return snapshot
+        listed_stocks = list(snapshot.listed_stocks.values())
+        with metrics.timer('cache_results'):
+            for count, stock in enumerate(listed_stocks):
+                if count % 500 == 0:
+                    self._report_progress('caching results', 0.7 + 0.3 * count / len(listed_stocks))
+                try:
+                    snapshot.responses[stock.id] = self._compose_result(snapshot, stock, snapshot.date)
+                except LookupError:
+                    continue
+        return snapshot
+
+    def save_snapshot(self) -> None:
+        """
+        Save the current snapshot into the snapshot directory, where the worker processes of the production server load it from.
+        """
+        self.snapshot.save(constants.SNAPSHOT_PATH)
 
     def get_stock_list(self) -> str:
         """
-        Get the stock list from database.
+        Get the stock list of the listed stocks.
 
         Returns:
             The JSON string of the stock list.
         """
-        # Return the cached stock list if it exsits.
-        if self.stock_list is not None:
-            return self.stock_list
+        return self.snapshot.stock_list
+
+    def get_stock_list_response(self) -> CachedResponse:
+        """
+        Get the cached stock list with its compressed encodings and ETag.
+        """
+        return self.snapshot.stock_list_response
 
-        stocks = []
-        for stock in self.database.all():
-            # Don't return delisted stock.
-            if stock.delisted:
-                continue
+    def search_stocks(self, query: str, limit: int = 10) -> str:
+        """
+        Search the listed stocks whose id, pinyin or name starts with the query.
+
+        Args:
+            query: The prefix to search.
+            limit: The max number of stocks returned.
 
-            # Only return following 3 fields for the request.
-            keep = ['id', 'pinyin', 'name']
-            filtered_stock_json = {key: value for key, value in stock.to_dict().items() if key in keep}
-            stocks.append(filtered_stock_json)
-        return json.dumps(stocks, ensure_ascii=False)
+        Returns:
+            The JSON string of the matched stocks, in the same format as the stock list.
+        """
+        with metrics.timer('search'):
+            return json.dumps(self.snapshot.search_index.search(query, limit), ensure_ascii=False)
 
     def get_history_and_predict_result(self, id: str, date: str) -> str:
         """
         Get the history prices and the predicted price of the stock.
 
+        The results of dates since the snapshot is built are served from the cached results directly.
+
         Args:
             id: The id of the stock, which is a 6-digit number.
             date: The date when the request is sent. This will be used to infer the predicting date.
@@ -170,116 +376,215 @@ class Service:
         Returns:
             A JSON string containing the history prices and the predicted price of the stock.
         """
-        # Retrieve the stock with given id from the database.
-        stock = self.database.search(id)
+        return self._get_history_and_predict_result(self.snapshot, id, date)
+
+    def get_batch_history_and_predict_results(self, ids: List[str], date: str) -> str:
+        """
+        Get the history prices and the predicted prices of many stocks at once.
+
+        All the results are read from the same snapshot, and the cached results are embedded without parsing them again.
+
+        Args:
+            ids: The ids of the stocks. Duplicated ids are returned once.
+            date: The date when the request is sent. This will be used to infer the predicting date.
+
+        Returns:
+            A JSON string of an object mapping each id to its result, which is null if the stock is invalid or not supported yet.
+        """
+        snapshot = self.snapshot
+        results = []
+        for id in dict.fromkeys(ids):
+            try:
+                result = self._get_history_and_predict_result(snapshot, id, date)
+            except LookupError:
+                result = 'null'
+            results.append(f'{json.dumps(id)}: {result}')
+        return '{' + ', '.join(results) + '}'
+
+    def _get_history_and_predict_result(self, snapshot: Snapshot, id: str, date: str) -> str:
+        """
+        Get the history prices and the predicted price of the stock in the given snapshot.
+
+        The results of dates since the snapshot is built are all the same as the result of the snapshot date, which is cached
+        in the snapshot once it's composed.
+        """
+        response = snapshot.responses.get(id) if date >= snapshot.date else None
+        if response is not None:
+            metrics.increment(CACHE_HITS, cache='results')
+            return response
+        metrics.increment(CACHE_MISSES, cache='results')
+
+        # Predictions are not available before the date we start to support predicting.
+        if date < constants.START_PREDICTING_DATE:
+            raise LookupError(f'Date {date} is not supported.')
+
+        stock = snapshot.stocks.get(id)
         if stock is None:
             raise LookupError(f'No such id in database: {id}')
+        if date >= snapshot.date and not stock.delisted:
+            response = snapshot.responses[id] = self._compose_result(snapshot, stock, snapshot.date)
+            return response
+        return self._compose_result(snapshot, stock, date)
+
+    def load_prices(self, qlib_ids: List[str]) -> PriceMatrix:
+        """
+        Load the adjusted close prices of the stocks since the history window of the date we start to support predicting.
+
+        Args:
+            qlib_ids: The qlib ids of the stocks.
+        """
+        start_date = TradingCalendar.shared().shift(constants.START_PREDICTING_DATE, -HISTORY_DAYS)
+        return PriceMatrix.from_qlib(qlib_ids, start_date, datetime.date.today().strftime('%Y-%m-%d'))
+
+    def _compose_result(self, snapshot: Snapshot, stock: Stock, date: str) -> str:
+        """
+        Compose the JSON result of the stock with the history prices and the predicted price at the given date.
+        """
+        if stock.qlib_id not in snapshot.prediction_store.instrument_index:
+            raise LookupError(f'Stock {stock.id} is not supported yet.')
 
         # Get history prices.
-        recent_40_trading_days = qlib.data.D.calendar(start_time=(pd.Timestamp(date) - pd.Timedelta(days=80)).strftime("%Y-%m-%d"), end_time=date)[-40:]
-        history_data = qlib.data.D.features([stock.qlib_id], ['$close/$factor'], recent_40_trading_days[0].strftime('%Y-%m-%d'), date)
-        history = [{key[1].strftime('%Y-%m-%d'): round(value, 2)} for key, value in history_data.to_dict()['$close/$factor'].items() if not math.isnan(value)]
-
-        # Get predicted price.
-        predicted_trading_date = None
-        predicted_price = None
-        if stock.predict is not None:
-            latest_trading_date = None
-            offset = 0
-            while latest_trading_date not in stock.predict:
-                # Find the latest supported trading date.
-                # Ideally, latest supported trading date should be today (if today's stock market has closed) or yesterday (if today's stock market has not closed).
-                # But if there is any unexpected circumstance that yesterday's data is missing, we need to use former data instead.
-                offset -= 1
-                latest_trading_date = list(history[offset].keys())[0]
-            latest_price = history[offset][latest_trading_date]
-            predicted_trading_date = (pd.Timestamp(latest_trading_date) + pd.Timedelta(days=14)).strftime("%Y-%m-%d")
-            predicted_price = round((1.0 + stock.predict[latest_trading_date]) * latest_price, 2)
-        else:
-            raise LookupError(f'Stock {id} is not supported yet.')
+        with metrics.timer('recent_prices'):
+            recent_prices = snapshot.prices.get_recent_prices(stock.qlib_id, date, HISTORY_DAYS)
+
+        # Find the latest supported trading date.
+        # Ideally, latest supported trading date should be today (if today's stock market has closed) or yesterday (if today's stock market has not closed).
+        # But if there is any unexpected circumstance that yesterday's data is missing, we need to use former data instead.
+        with metrics.timer('prediction_lookup'):
+            for latest_trading_date, latest_price in reversed(recent_prices):
+                prediction = snapshot.prediction_store.get_prediction(stock.qlib_id, latest_trading_date)
+                if prediction is not None:
+                    break
+            else:
+                raise LookupError(f'Stock {stock.id} has no prediction in recent trading days.')
+        predicted_trading_date = snapshot.calendar.shift(latest_trading_date, PREDICT_DAYS)
+        predicted_price = round((1.0 + prediction) * latest_price, 2)
 
         # Return the necessary values of the stock and convert it to json string.
-        stock.history = history
-        stock.predict = {predicted_trading_date: predicted_price}
-        return stock.to_json(ensure_ascii=False)
+        # The stock is copied since it's shared by the concurrent requests.
+        with metrics.timer('to_json'):
+            result = dataclasses.replace(
+                stock,
+                history=[{trading_date: round(price, 2)} for trading_date, price in recent_prices],
+                predict={predicted_trading_date: predicted_price}
+            )
+            return result.as_json()
 
-    def get_topN(self, n: int):
+    def get_topN(self, n: int, date: Optional[str] = None, window: int = 3) -> str:
         """
         Get the most recommended N stocks.
 
         We implemented this method by choosing the top N stocks that have highest increase in the following 2 weeks according to our prediction.
         To make the recommendation more reliable, we choose the stocks that have good consistency in the recent 3 predictions. So the final result may not have the biggest increase, but is more likely to increase.
+
+        Args:
+            n: The number of stocks to recommend.
+            date: The date of the recommendation. Default None means yesterday, whose predictions are all complete.
+            window: The number of recent predictions a stock should be consistent in. Default 3.
+
+        Returns:
+            The JSON string of the recommended stocks.
+        """
+        if date is None:
+            date = (datetime.date.today() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+        return self._get_topN(self.snapshot, n, date, window)
+
+    def _get_topN(self, snapshot: Snapshot, n: int, date: str, window: int) -> str:
         """
-        yesterday_date = pd.Timestamp.now().date() - pd.Timedelta(days=1)
-        recent_3_trading_days = qlib.data.D.calendar(start_time=(yesterday_date - pd.Timedelta(days=12)).strftime("%Y-%m-%d"), end_time=yesterday_date)[-3:]
-        recent_1st_trading_date = recent_3_trading_days[2].strftime("%Y-%m-%d")
-        recent_2nd_trading_date = recent_3_trading_days[1].strftime("%Y-%m-%d")
-        recent_3rd_trading_date = recent_3_trading_days[0].strftime("%Y-%m-%d")
-
-        if self.topN_date is None or self.topN_date < recent_3_trading_days[2]:
-            stocks = [stock for stock in self.database.all() if stock.predict is not None and recent_1st_trading_date in stock.predict.keys() and recent_2nd_trading_date in stock.predict.keys() and recent_3rd_trading_date in stock.predict.keys()]
-            stocks.sort(key=lambda stock: stock.predict[recent_1st_trading_date] + stock.predict[recent_2nd_trading_date] + stock.predict[recent_3rd_trading_date], reverse=True)
-            topN_stocks = [stock for stock in stocks[:n]]
-
-            self.topN = []
-            self.topN_date = recent_3_trading_days[2]
-            for stock in topN_stocks:
-                stock_dict = {
+        Get the most recommended N stocks in the given snapshot by iterating its ranking index.
+        """
+        with metrics.timer('topN'):
+            topN = []
+            for qlib_id, prediction in snapshot.ranking_index.iterate(date, window):
+                if len(topN) >= n:
+                    break
+                # Delisted stocks are not recommended.
+                stock = snapshot.listed_stocks.get(qlib_id)
+                if stock is None:
+                    continue
+                topN.append({
                     'id': stock.id,
                     'name': stock.name,
-                    'increase': round(stock.predict[recent_1st_trading_date], 4)
-                }
-                self.topN.append(stock_dict)
-        return json.dumps(self.topN, ensure_ascii=False)
+                    'increase': round(prediction, 4)
+                })
+            return json.dumps(topN, ensure_ascii=False)
+
+    def get_topN_response(self, n: int, date: Optional[str] = None, window: int = 3) -> CachedResponse:
+        """
+        Get the most recommended N stocks with compressed encodings and ETag.
 
-    def fix_missing_data(self) -> None:
+        The responses are cached until the data is refreshed. At most 256 different requests are cached.
+
+        Args:
+            n: The number of stocks to recommend.
+            date: The date of the recommendation. Default None means yesterday, whose predictions are all complete.
+            window: The number of recent predictions a stock should be consistent in. Default 3.
+        """
+        if date is None:
+            date = (datetime.date.today() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        snapshot = self.snapshot
+        key = (n, date, window)
+        # The cache may be cleared by another request at any time, so the response is held in a local variable.
+        response = snapshot.topN_responses.get(key)
+        metrics.increment(CACHE_MISSES if response is None else CACHE_HITS, cache='topN')
+        if response is None:
+            response = CachedResponse.from_text(self._get_topN(snapshot, n, date, window), on_demand=True)
+            if len(snapshot.topN_responses) >= 256:
+                snapshot.topN_responses.clear()
+            snapshot.topN_responses[key] = response
+        return response
+
+    def fix_missing_data(self, dry_run=False) -> None:
         """
         Fix the missing data by re-downloading them.
+
+        Args:
+            dry_run: If True, only report the durations to be re-downloaded without downloading them.
         """
-        common_missing_dates = None
-        for stock in self.database.all():
-            # Skip the delisted stocks.
-            if stock.delisted:
-                continue
-
-            # Put date with missing data into a set.
-            features = qlib.data.D.features([stock.qlib_id], ['$close'], constants.START_PREDICTING_DATE, datetime.date.today().strftime('%Y-%m-%d'))
-            # Skip the stock if it has no qlib data.
-            if len(features.index) == 0:
-                continue
-            nan_features = features[features.isna().any(axis=1)]
-
-            missing_dates = set()
-            for index in nan_features.index:
-                missing_dates.add(index[1])
-            # Get the common missing dates among all the stocks.
-            if common_missing_dates is None:
-                common_missing_dates = missing_dates
+        import qlib.data
+        from feature_cache import FeatureCache
+
+        # Skip the delisted stocks.
+        qlib_ids = [stock.qlib_id for stock in self.database.all(fields=['qlib_id'], where={'delisted': False})]
+
+        # Load the close prices of a chunk of stocks at once, and build the NaN matrix with dates as rows and stocks as columns.
+        # Stocks without qlib data have no column. Dates without a row for a stock are not regarded as missing for it.
+        nan_matrices = []
+        for batch_ids in self.batch(qlib_ids, 500):
+            features = qlib.data.D.features(batch_ids, ['$close'], constants.START_PREDICTING_DATE, datetime.date.today().strftime('%Y-%m-%d'))
+            if len(features.index) > 0:
+                nan_matrices.append(features['$close'].isna().unstack(level='instrument', fill_value=False))
+        if not nan_matrices:
+            return
+        nan_matrix = pd.concat(nan_matrices, axis=1).fillna(False).astype(bool).sort_index()
+
+        # Get the common missing dates among all the stocks.
+        missing_dates = nan_matrix.index[nan_matrix.all(axis=1).to_numpy()]
+        if len(missing_dates) == 0:
+            print('No missing data.')
+            return
+
+        # Aggregate the missing dates into durations.
+        # Cluster the missing dates into one duration if the interval is less than 5 days.
+        breaks = np.flatnonzero(np.diff(missing_dates.to_numpy()) >= np.timedelta64(5, 'D')) + 1
+        starts = np.concatenate([[0], breaks])
+        ends = np.concatenate([breaks, [len(missing_dates)]]) - 1
+        durations = [(missing_dates[start], missing_dates[end], end - start + 1) for start, end in zip(starts, ends)]
+
+        # Download data for each duration. This will take much time.
+        for start_date, end_date, missing_count in durations:
+            command_line = f'python ~/projects/qlib/scripts/data_collector/yahoo/collector.py update_data_to_bin --qlib_data_1d_dir ~/.qlib/qlib_data/cn_data --trading_date {start_date.strftime("%Y-%m-%d")} --end_date {(end_date + pd.Timedelta(days=1)).strftime("%Y-%m-%d")}'
+            print(f'Missing data of {missing_count} trading days in {nan_matrix.shape[1]} stocks from {start_date.strftime("%Y-%m-%d")} to {end_date.strftime("%Y-%m-%d")}.')
+            if dry_run:
+                print(f'Would run: {command_line}')
             else:
-                common_missing_dates.intersection_update(missing_dates)
-        # Sort the missing dates.
-        sorted_missing_dates = sorted(common_missing_dates)
-
-        if len(sorted_missing_dates) > 0:
-            # Aggregate the missing dates into durations.
-            durations = []
-            start_date = sorted_missing_dates[0]
-            end_date = sorted_missing_dates[0]
-            for missing_date in sorted_missing_dates:
-                # Cluster the missing dates into one duration if the interval is less than 5 days.
-                if (missing_date - end_date).days < 5:
-                    end_date = missing_date
-                else:
-                    durations.append((start_date, end_date))
-                    start_date = missing_date
-                    end_date = missing_date
-            durations.append((start_date, end_date))
-
-            # Download data for each duration. This will take much time.
-            for duration in durations:
-                command_line = f'python ~/projects/qlib/scripts/data_collector/yahoo/collector.py update_data_to_bin --qlib_data_1d_dir ~/.qlib/qlib_data/cn_data --trading_date {duration[0].strftime("%Y-%m-%d")} --end_date {(duration[1] + pd.Timedelta(days=1)).strftime("%Y-%m-%d")}'
                 os.system(command_line)
 
+        # The cached features computed from the rewritten data are stale now.
+        if not dry_run:
+            FeatureCache().invalidate(durations[0][0].strftime('%Y-%m-%d'))
+
     def fix_mising_prediction(self) -> None:
         """
         Fix the missing predictions.
@@ -287,68 +592,107 @@ class Service:
         Due to some special circumstances, the daily prediction may fail or break.
         We could fix those missing predictions by finding them and re-predict them in this method.
         """
-        durations = []
-        for stock in self.database.all():
-            # If no prediction in current stock, it may be not supported by our data source. We just skip it.
-            if stock.predict is None:
-                continue
-
-            # Select the date durations that missing a series of consecutive predictions and save them as a tuple.
-            supported_trading_days = qlib.data.D.calendar(start_time=constants.START_PREDICTING_DATE, end_time=datetime.date.today().strftime('%Y-%m-%d'))
-            start_date = None
-            end_date = None
-            for trading_day in supported_trading_days:
-                date = trading_day.strftime('%Y-%m-%d')
-                if date not in stock.predict:
-                    # Record the start date and the end date of one duration.
-                    if start_date is None:
-                        start_date = date
-                    end_date = date
-                else:
-                    # Complete the duration and reset the start date and the end date.
-                    if start_date is not None and end_date is not None:
-                        durations.append((stock, start_date, end_date))
-                        start_date = None
-                        end_date = None
-            # Don't miss the final duration.
-            if start_date is not None and end_date is not None:
-                durations.append((stock, start_date, end_date))
-
-        # Predict for each stock's each missing duration and update them into database.
-        for duration in tqdm.tqdm(durations):
-            stock = duration[0]
-
-            # Skip the duration if there is no price data in qlib data.
-            # It may because the stock is suspended during this time.
-            features_in_duration = qlib.data.D.features([stock.qlib_id], ['$close'], duration[1], duration[2])
-            if len(features_in_duration.index) == 0:
-                continue
-
-            predictions = predict.predict([stock.qlib_id], start_date=duration[1], end_date=duration[2])
-            if not predictions.empty:
-                # Check if the result exists.
-                if not predictions.index.isin([stock.qlib_id], level='instrument').any():
-                    continue
-                # Select the prediction for this stock.
-                prediction = predictions.loc[(slice(None), stock.qlib_id),].droplevel('instrument')
-                prediction.index = prediction.index.map(lambda timestamp: timestamp.strftime('%Y-%m-%d'))
-                # Update the stock with the prediction.
-                if stock.predict is None:
-                    stock.predict = prediction.to_dict()
-                else:
-                    stock.predict.update(prediction.to_dict())
-                self.database.upsert(stock)
+        import predict
+        import tqdm
+
+        # Stocks never predicted may be not supported by our data source, so only the stocks in the prediction store are checked.
+        qlib_ids = self.prediction_store.instruments
+        trading_days = TradingCalendar.shared().between(constants.START_PREDICTING_DATE, datetime.date.today().strftime('%Y-%m-%d'))
+        if len(qlib_ids) == 0 or len(trading_days) == 0:
+            return
+
+        # Build the mask of missing predictions with trading days as rows and stocks as columns.
+        # Only the days with price data are missing, which skips the days before listing, after delisting and during suspension.
+        has_price = ~np.isnan(PriceMatrix.from_qlib(qlib_ids, trading_days[0], trading_days[-1]).values)
+        missing = np.isnan(self.prediction_store.get_dates_predictions(trading_days).to_numpy()) & has_price
+
+        # Find the durations that missing a series of consecutive predictions, and group the stocks by their durations.
+        # A duration starts where the mask changes from False to True and ends where it changes back.
+        changes = np.diff(np.pad(missing, ((1, 1), (0, 0))).astype(np.int8), axis=0).T
+        starts = np.argwhere(changes == 1)
+        ends = np.argwhere(changes == -1)
+        durations = {}
+        for (column, start), (_, end) in zip(starts, ends):
+            durations.setdefault((trading_days[start], trading_days[end - 1]), []).append(qlib_ids[column])
+
+        # Predict the stocks sharing the same missing duration together and write them into the prediction store.
+        for (start_date, end_date), duration_qlib_ids in tqdm.tqdm(durations.items()):
+            for batch_ids in self.batch(duration_qlib_ids, 200):
+                predictions = predict.predict(batch_ids, start_date=start_date, end_date=end_date)
+                self.prediction_store.update(predictions)
 
     def refresh_data(self) -> None:
         """
         Refresh the underlying data.
 
         This method should be called when the data is updated by external processes.
+        The new snapshot is built aside and then replaces the current one, so the requests in progress are not affected.
+
+        Raises:
+            RuntimeError: If another refresh is running.
         """
-        # Refresh the qlib data.
-        qlib.init(provider_uri=constants.QLIB_DATA_PATH)
-        # Refresh the predictions.
-        self.database.refresh()
-        # Refresh stock list
-        self.stock_list = None
-        self.stock_list = self.get_stock_list()
\ No newline at end of file
+        if not self.refresh_lock.acquire(blocking=False):
+            raise RuntimeError('Another refresh of the data is running.')
+        self._refresh()
+
+    def start_refresh(self) -> bool:
+        """
+        Refresh the underlying data in a background thread. The requests keep being served from the current snapshot till the new one is built.
+
+        Returns:
+            False if another refresh is running, in which case no new refresh is started. True otherwise.
+        """
+        if not self.refresh_lock.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._refresh, name='refresh-data', daemon=True).start()
+        return True
+
+    def get_refresh_status(self) -> Dict[str, Any]:
+        """
+        Get the status of the latest refresh of the data.
+
+        Returns:
+            A dict with the status ('idle', 'running', 'succeeded' or 'failed'), and the stage, the progress between 0 and 1,
+            the start time, the finish time and the error message of the latest refresh.
+        """
+        return dict(self.refresh_status)
+
+    def _refresh(self) -> None:
+        """
+        Refresh the underlying data with the refresh lock held, and release the lock when it's done.
+        """
+        self.refresh_status = {
+            'status': 'running',
+            'stage': 'initializing',
+            'progress': 0.0,
+            'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'finished_at': None,
+            'error': None
+        }
+        try:
+            with metrics.timer('refresh'):
+                if not self.read_only:
+                    # Refresh the qlib data, the stocks and the predictions.
+                    self._open_data_sources()
+                self.snapshot = self.load_snapshot()
+                if self.warm_start and not self.read_only:
+                    # Save the snapshot for the next warm start.
+                    self._report_progress('saving snapshot', 1.0)
+                    self.save_snapshot()
+            self.refresh_status.update(status='succeeded', stage='done', progress=1.0)
+        except Exception as error:
+            self.refresh_status.update(status='failed', error=repr(error))
+            raise
+        finally:
+            # The refresh may run on a short-lived thread, which must not keep its database connection after it exits.
+            if self.database is not None:
+                self.database.release_thread()
+            self.refresh_status['finished_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+            self.refresh_lock.release()
+
+    def _report_progress(self, stage: str, progress: float) -> None:
+        """
+        Report the stage and the progress of the running refresh.
+        """
+        if self.refresh_status.get('status') == 'running':
+            self.refresh_status.update(stage=stage, progress=round(progress, 2))
\ No newline at end of file
@@ -5,10 +5,10 @@ if __name__ == '__main__':
     """
     Setup the environment and initialize the data.
 
-    This script should be executed only once at the deployment stage.
+    This script should be executed only once at the deployment stage. If it's broken, run it again to resume the prediction.
     """
-    service = Service()
+    service = Service(serve=False)
     # Load stock list.
     service.load_stock_list()
-    # Predict for all the stocks in all date range.
-    service.predict_all()
\ No newline at end of file
+    # Predict for all the stocks in all date range. The unfinished batches of the last broken run are resumed.
+    service.predict_all(resume=True)
\ No newline at end of file
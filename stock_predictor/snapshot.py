@@ -0,0 +1,107 @@
+import json
+from pathlib import Path
+from typing import Dict, List
+
+from prediction_store import PredictionStore
+from price_matrix import PriceMatrix
+from ranking_index import RankingIndex
+from response_cache import CachedResponse
+from search_index import SearchIndex
+from stock import Stock
+from trading_calendar import TradingCalendar
+from versioned_directory import create_version, current_version, publish_version
+
+
+class Snapshot:
+    """
+    Immutable snapshot of all the data served by the web app: the stocks, their prices and their predictions.
+
+    The indices and the cached responses derived from the data are built along with the snapshot.
+    Since a snapshot is never modified once it's published, the service replaces the whole snapshot when the data is refreshed,
+    and a request reading one snapshot always sees consistent data.
+
+    Snapshots could be saved to a directory and loaded by other processes. The prices and the predictions are saved as .npy
+    files and memory-mapped when loaded, so all the processes serving the same snapshot share one copy of them in the page cache.
+    """
+
+    STOCKS_FILE = 'stocks.json'
+    PRICES_DIRECTORY = 'prices'
+    PREDICTIONS_DIRECTORY = 'predictions'
+
+    def __init__(self, date: str, stocks: List[Stock], prices: PriceMatrix, prediction_store: PredictionStore) -> None:
+        """
+        Build the snapshot and the indices on it.
+
+        Args:
+            date: The date when the snapshot is built, in format 'YYYY-mm-dd'.
+            stocks: All the stocks including the delisted ones. History and predictions are not needed.
+            prices: The price matrix of the stocks.
+            prediction_store: The prediction store. It must not be updated after the snapshot is built.
+        """
+        self.date = date
+        self.stocks: Dict[str, Stock] = {stock.id: stock for stock in stocks}
+        self.prices = prices
+        self.prediction_store = prediction_store
+        # The trading days of the prices, which are all the trading days the snapshot serves.
+        self.calendar = TradingCalendar(prices.dates)
+
+        # The listed stocks keyed by qlib id, and the stock list built from them.
+        self.listed_stocks: Dict[str, Stock] = {stock.qlib_id: stock for stock in stocks if not stock.delisted}
+        self.stock_list = json.dumps(
+            [{'id': stock.id, 'pinyin': stock.pinyin, 'name': stock.name} for stock in self.listed_stocks.values()],
+            ensure_ascii=False
+        )
+        self.stock_list_response = CachedResponse.from_text(self.stock_list)
+        self.search_index = SearchIndex(self.listed_stocks.values())
+
+        # Build the ranking index for recommending stocks, and cache the compressed recommendations.
+        self.ranking_index = RankingIndex(prediction_store, prices.dates)
+        self.topN_responses: Dict[tuple, CachedResponse] = {}
+
+        # The history and predict results of the snapshot date keyed by stock id, which are filled by the service.
+        self.responses: Dict[str, str] = {}
+
+    def save(self, path: Path) -> Path:
+        """
+        Save the snapshot as a new version in the given directory, and point the directory to it.
+
+        Args:
+            path: The snapshot directory.
+
+        Returns:
+            The directory of the new version.
+        """
+        version_path = create_version(path)
+        with open(version_path / self.STOCKS_FILE, 'w') as stocks_file:
+            json.dump({'date': self.date, 'stocks': [stock.as_dict() for stock in self.stocks.values()]}, stocks_file, ensure_ascii=False)
+        self.prices.save(version_path / self.PRICES_DIRECTORY)
+        self.prediction_store.save(version_path / self.PREDICTIONS_DIRECTORY)
+        publish_version(version_path)
+        return version_path
+
+    @classmethod
+    def exists(cls, path: Path) -> bool:
+        """
+        Check if any snapshot is saved in the given directory.
+        """
+        return current_version(path) is not None
+
+    @classmethod
+    def load(cls, path: Path) -> 'Snapshot':
+        """
+        Load the latest version of the snapshot saved in the given directory.
+
+        Args:
+            path: The snapshot directory.
+        """
+        version_path = current_version(path)
+        if version_path is None:
+            raise FileNotFoundError(f'No snapshot in {path}. Build one with `python tools.py build_snapshot` first.')
+        with open(version_path / cls.STOCKS_FILE, 'r') as stocks_file:
+            content = json.load(stocks_file)
+        return cls(
+            content['date'],
+            [Stock.from_row(stock) for stock in content['stocks']],
+            PriceMatrix.from_file(version_path / cls.PRICES_DIRECTORY),
+            PredictionStore(version_path / cls.PREDICTIONS_DIRECTORY)
+        )
@@ -1,13 +1,29 @@
+import dataclasses
 from dataclasses import dataclass
 from dataclasses_json import dataclass_json
-from typing import Dict, List, Optional
+import json
+from typing import Any, Dict, List, Optional
+
+
+def _with_slots(cls: type) -> type:
+    """
+    Rebuild the dataclass with __slots__ of its fields, so the instances have no __dict__.
+
+    This is what dataclass(slots=True) does since Python 3.10. The defaults are already bound in the generated __init__,
+    so they are removed from the class attributes, where they would conflict with the slots.
+    """
+    names = tuple(field.name for field in dataclasses.fields(cls))
+    namespace = {key: value for key, value in cls.__dict__.items() if key not in names and key not in ('__dict__', '__weakref__')}
+    namespace['__slots__'] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
 
 
 @dataclass_json()
+@_with_slots
 @dataclass
 class Stock:
     """Stock entity class.
-    
+
     Args:
         id (str): The unique id of the stock in market.
         pinyin (str): The first characters of the pinyin of the stock name.
@@ -29,4 +45,43 @@ class Stock:
     predict: Optional[Dict[str, float]] = None
     delisted: bool = False
     listing_date: Optional[str] = None
-    delisted_date: Optional[str] = None
\ No newline at end of file
+    delisted_date: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'Stock':
+        """
+        Decode the stock from a database row or a dict made by as_dict().
+
+        This is the fast path of from_dict() for bulk reads. The fields are taken as they are without checking their types,
+        and the fields missing in the row are set to their default values. Unknown keys, e.g. _id of MongoDB, are ignored.
+        """
+        get = row.get
+        return cls(
+            get('id'), get('pinyin'), get('name'), get('qlib_id'), get('enname'), get('history'), get('predict'),
+            get('delisted', False), get('listing_date'), get('delisted_date')
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Encode the stock as a dict with the same keys and order as to_dict().
+
+        This is the fast path of to_dict(). The history and the predictions are not copied, so the dict should not be modified.
+        """
+        return {
+            'id': self.id,
+            'pinyin': self.pinyin,
+            'name': self.name,
+            'qlib_id': self.qlib_id,
+            'enname': self.enname,
+            'history': self.history,
+            'predict': self.predict,
+            'delisted': self.delisted,
+            'listing_date': self.listing_date,
+            'delisted_date': self.delisted_date,
+        }
+
+    def as_json(self) -> str:
+        """
+        Encode the stock as the same JSON string as to_json(ensure_ascii=False).
+        """
+        return json.dumps(self.as_dict(), ensure_ascii=False)
@@ -1,6 +1,12 @@
 import argparse
 import datetime
+import json
+import os
+from pathlib import Path
+import time
 
+import constants
+from metrics import metrics
 from service import Service
 
 
@@ -10,22 +16,47 @@ if __name__ == '__main__':
     """
     # Read params from command line.
     argparser = argparse.ArgumentParser(description='Tools of stock predictor.')
-    argparser.add_argument('name', type=str, help='The name of the requested tool. Choose from [predict_all], [update_stock_list], [fix_missing_data] and [fix_missing_prediction].')
+    argparser.add_argument('name', type=str, help='The name of the requested tool. Choose from [predict_all], [update_stock_list], [fix_missing_data], [fix_missing_prediction] and [build_snapshot].')
+    argparser.add_argument('--workers', type=int, default=1, help='The number of worker processes used by [predict_all]. Default 1.')
+    argparser.add_argument('--resume', action='store_true', help='Resume the unfinished batches of the last run of [predict_all].')
+    argparser.add_argument('--overwrite', action='store_true', help='Also predict the stocks already predicted by [predict_all] in the requested dates.')
+    argparser.add_argument('--dry-run', action='store_true', help='Only report the data to be re-downloaded by [fix_missing_data] without downloading them.')
+    argparser.add_argument('--metrics-output', type=str, help='The path to write the metrics summary of the run as JSON. Default ~/.stock/metrics/<name>.json.')
     args = argparser.parse_args()
 
-    service = Service()
+    start_time = time.perf_counter()
+    # Only building the snapshot needs to load the data served to the requests.
+    with metrics.timer('init_service'):
+        service = Service(serve=args.name == 'build_snapshot')
     # Run the tool specified by the name param.
     if args.name == 'predict_all':
         # Do today's prediction for all stocks.
-        service.predict_all(date=datetime.date.today().strftime('%Y-%m-%d'))
+        service.predict_all(date=datetime.date.today().strftime('%Y-%m-%d'), workers=args.workers, resume=args.resume, overwrite=args.overwrite)
     elif args.name == 'update_stock_list':
         # Update stock list according to official stock exchange website.
         service.load_stock_list()
     elif args.name == 'fix_missing_data':
         # Fix the missing data by re-downloading them.
-        service.fix_missing_data()
+        service.fix_missing_data(dry_run=args.dry_run)
     elif args.name == 'fix_missing_prediction':
         # Fix the missing predictions by re-try predicting for the missed dates.
         service.fix_mising_prediction()
+    elif args.name == 'build_snapshot':
+        # Save the snapshot of current data for the production server.
+        service.save_snapshot()
     else:
-        print(f'Not supported tool name: {args.name}')
\ No newline at end of file
+        print(f'Not supported tool name: {args.name}')
+        exit(1)
+
+    # Write the per-stage latencies and the counters of the run, so that slow stages could be found without a profiler.
+    summary = {
+        'tool': args.name,
+        'finished_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'seconds': round(time.perf_counter() - start_time, 3),
+        **metrics.summary()
+    }
+    metrics_path = Path(args.metrics_output) if args.metrics_output else constants.METRICS_PATH / f'{args.name}.json'
+    os.makedirs(metrics_path.parent, exist_ok=True)
+    with open(metrics_path, 'w') as metrics_file:
+        json.dump(summary, metrics_file, indent=4)
+    print(f'Metrics summary is written to {metrics_path}.')
\ No newline at end of file
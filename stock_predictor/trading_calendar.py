@@ -0,0 +1,91 @@
+import bisect
+import datetime
+from typing import List, Optional
+
+
+class TradingCalendar:
+    """
+    Trading days in ascending order, with the trading day arithmetic done by binary search.
+
+    The calendar of qlib data is loaded once and shared by the whole process. It's reloaded when the data is refreshed.
+    Dates are strings in format 'YYYY-mm-dd', which sort in the same order as the dates.
+    """
+
+    # The calendar of qlib data shared by the whole process. It's loaded on the first use.
+    _shared: Optional['TradingCalendar'] = None
+
+    def __init__(self, dates: List[str]) -> None:
+        """
+        Initialize the calendar.
+
+        Args:
+            dates: The trading days in format 'YYYY-mm-dd' in ascending order.
+        """
+        self.dates = dates
+
+    @classmethod
+    def from_qlib(cls) -> 'TradingCalendar':
+        """
+        Load the full calendar of qlib data. Qlib must be initialized.
+        """
+        import qlib.data
+
+        return cls([trading_day.strftime('%Y-%m-%d') for trading_day in qlib.data.D.calendar()])
+
+    @classmethod
+    def shared(cls) -> 'TradingCalendar':
+        """
+        Get the calendar of qlib data shared by the whole process.
+        """
+        if cls._shared is None:
+            cls._shared = cls.from_qlib()
+        return cls._shared
+
+    @classmethod
+    def reload(cls) -> 'TradingCalendar':
+        """
+        Reload the shared calendar after qlib data is updated.
+        """
+        cls._shared = cls.from_qlib()
+        return cls._shared
+
+    def latest(self, date: str) -> Optional[str]:
+        """
+        Get the latest trading day on or before the given date, or None if the date is before the calendar.
+        """
+        position = bisect.bisect_right(self.dates, date) - 1
+        return self.dates[position] if position >= 0 else None
+
+    def shift(self, date: str, n: int) -> str:
+        """
+        Get the trading day N trading days after the latest trading day on or before the given date. Negative N means before.
+
+        Trading days before the calendar are clamped to the first trading day. Trading days after the calendar are not known
+        yet, so weekdays are counted as trading days there.
+
+        Args:
+            date: The date in format 'YYYY-mm-dd'.
+            n: The number of trading days to shift.
+        """
+        if not self.dates:
+            raise LookupError('The trading calendar is empty.')
+        position = max(bisect.bisect_right(self.dates, date) - 1, 0) + n
+        if position < 0:
+            return self.dates[0]
+        if position < len(self.dates):
+            return self.dates[position]
+
+        # Count the weekdays after the last trading day.
+        day = datetime.datetime.strptime(self.dates[-1], '%Y-%m-%d').date()
+        remaining = position - len(self.dates) + 1
+        while remaining > 0:
+            day += datetime.timedelta(days=1)
+            if day.weekday() < 5:
+                remaining -= 1
+        return day.strftime('%Y-%m-%d')
+
+    def between(self, start_date: str, end_date: str) -> List[str]:
+        """
+        Get the trading days in the given date range (inclusive).
+        """
+        return self.dates[bisect.bisect_left(self.dates, start_date):bisect.bisect_right(self.dates, end_date)]
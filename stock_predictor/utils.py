@@ -1,6 +1,8 @@
+import pandas as pd
 import tqdm
 
-from database import MongoDatabase, TinyDatabase
+from database import Database, MongoDatabase, SqliteDatabase, TinyDatabase
+from prediction_store import PredictionStore
 
 
 def tiny2mongo():
@@ -10,5 +12,49 @@ def tiny2mongo():
     tiny_database = TinyDatabase()
     mongo_database = MongoDatabase()
 
-    for stock in tqdm.tqdm(tiny_database.all()):
-        mongo_database.upsert(stock)
\ No newline at end of file
+    mongo_database.upsert_many(tiny_database.all())
+
+
+def tiny2sqlite():
+    """
+    Export data from TinyDB to SQLite.
+    """
+    _copy_stocks(TinyDatabase(), SqliteDatabase())
+
+
+def mongo2sqlite():
+    """
+    Export data from MongoDB to SQLite.
+    """
+    _copy_stocks(MongoDatabase(), SqliteDatabase())
+
+
+def _copy_stocks(source: Database, target: Database, batch_size: int = 1000):
+    """
+    Copy all the stocks from the source database to the target database in batches.
+    """
+    stocks = source.all()
+    for start in tqdm.tqdm(range(0, len(stocks), batch_size)):
+        target.upsert_many(stocks[start:start + batch_size])
+    print(f'Copied {len(stocks)} stocks.')
+    source.close()
+    target.close()
+
+
+def mongo2store():
+    """
+    Export the predictions kept in MongoDB stock documents to the prediction store.
+    """
+    mongo_database = MongoDatabase()
+    prediction_store = PredictionStore()
+
+    predictions = {}
+    for stock in tqdm.tqdm(mongo_database.all(fields=['qlib_id', 'predict'])):
+        if stock.predict is None:
+            continue
+        for date, prediction in stock.predict.items():
+            predictions[(pd.Timestamp(date), stock.qlib_id)] = prediction
+    if not predictions:
+        return
+    index = pd.MultiIndex.from_tuples(predictions.keys(), names=['datetime', 'instrument'])
+    prediction_store.update(pd.Series(list(predictions.values()), index=index, dtype='float32'))
@@ -0,0 +1,61 @@
+import datetime
+import os
+from pathlib import Path
+import shutil
+from typing import Optional
+
+
+# The file in a versioned directory pointing to the latest version.
+CURRENT_FILE = 'CURRENT'
+
+# The number of versions kept in a versioned directory. Older versions may still be loaded or mapped by other processes.
+KEEP_VERSIONS = 2
+
+
+def create_version(path: Path) -> Path:
+    """
+    Create the sub-directory of a new version in the given directory. It's not visible to readers till it's published.
+
+    Args:
+        path: The versioned directory.
+
+    Returns:
+        The directory of the new version.
+    """
+    version_path = Path(path) / datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    os.makedirs(version_path)
+    return version_path
+
+
+def publish_version(version_path: Path) -> None:
+    """
+    Point the versioned directory to the given version atomically, and then remove the outdated versions.
+
+    All the files of the version must be written before it's published, so that readers never see a partially written version.
+
+    Args:
+        version_path: The directory of the version created by create_version().
+    """
+    version_path = Path(version_path)
+    path = version_path.parent
+    temporary_current_path = path / f'{CURRENT_FILE}.tmp'
+    with open(temporary_current_path, 'w') as current_file:
+        current_file.write(version_path.name)
+    os.replace(temporary_current_path, path / CURRENT_FILE)
+    versions = sorted(entry.name for entry in path.iterdir() if entry.is_dir())
+    for outdated_version in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(path / outdated_version, ignore_errors=True)
+
+
+def current_version(path: Path) -> Optional[Path]:
+    """
+    Get the directory of the latest published version in the given directory, or None if no version is published.
+
+    Args:
+        path: The versioned directory.
+    """
+    current_path = Path(path) / CURRENT_FILE
+    if not current_path.exists():
+        return None
+    with open(current_path, 'r') as current_file:
+        return Path(path) / current_file.read().strip()
@@ -0,0 +1,13 @@
+class FakeDatabase:
+    """
+    Fake database holding the given stocks, which are returned by all() as they are.
+    """
+
+    def __init__(self, stocks):
+        self.stocks = stocks
+
+    def all(self, fields=None, where=None):
+        return self.stocks
+
+    def release_thread(self):
+        pass
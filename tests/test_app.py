@@ -0,0 +1,188 @@
+import datetime
+import json
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import context
+import constants
+from prediction_store import PredictionStore
+from price_matrix import PriceMatrix
+from snapshot import Snapshot
+from stock import Stock
+
+
+class TestApp(unittest.TestCase):
+    """
+    Tests for the web app serving a saved snapshot read-only, as the worker processes of the production server do.
+    """
+
+    STOCKS = [
+        Stock(id='600000', pinyin='PFYH', name='浦发银行', qlib_id='SH600000'),
+        Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001'),
+        Stock(id='000002', pinyin='WKA', name='万科A', qlib_id='SZ000002'),
+    ]
+    # The predictions of each version of the snapshot.
+    PREDICTIONS = [0.05, 0.1]
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.snapshot_path = os.path.join(cls.directory.name, 'snapshots')
+        today = datetime.date.today()
+        cls.dates = [date.strftime('%Y-%m-%d') for date in pd.bdate_range(end=today - datetime.timedelta(days=1), periods=60)]
+        cls.snapshots = [cls.build_snapshot(version, today.strftime('%Y-%m-%d')) for version in range(len(cls.PREDICTIONS))]
+        cls.snapshots[0].save(cls.snapshot_path)
+
+        cls.patchers = [
+            mock.patch.object(constants, 'SNAPSHOT_PATH', cls.snapshot_path),
+            mock.patch.dict(os.environ, {'STOCK_PREDICTOR_READ_ONLY': '1'}),
+        ]
+        for patcher in cls.patchers:
+            patcher.start()
+        import app
+        cls.app = app
+
+    @classmethod
+    def build_snapshot(cls, version: int, date: str) -> Snapshot:
+        qlib_ids = [stock.qlib_id for stock in cls.STOCKS]
+        values = np.arange(1, len(cls.dates) + 1, dtype=np.float32)[:, None] * np.array([1.0, 2.0, 3.0], dtype=np.float32) * (version + 1)
+        prices = PriceMatrix(cls.dates, qlib_ids, values)
+        store = PredictionStore(os.path.join(cls.directory.name, f'store-{version}'))
+        index = pd.MultiIndex.from_product([pd.to_datetime(cls.dates), qlib_ids], names=['datetime', 'instrument'])
+        store.update(pd.Series(cls.PREDICTIONS[version], index=index))
+        return Snapshot(date, cls.STOCKS, prices, store)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for patcher in cls.patchers:
+            patcher.stop()
+        cls.directory.cleanup()
+
+    def check_result(self, result: dict, id: str) -> None:
+        """
+        Check the prices and the prediction in the result come from the same snapshot.
+        """
+        self.assertEqual(result['id'], id)
+        self.assertEqual(len(result['history']), 40)
+        # The price of a version is the base price scaled by the version number plus one, as in build_snapshot().
+        column = [stock.id for stock in self.STOCKS].index(id)
+        versions = set()
+        for history in result['history']:
+            [(date, price)] = history.items()
+            versions.add(round(price / ((self.dates.index(date) + 1) * (column + 1))) - 1)
+        self.assertEqual(len(versions), 1)
+        [version] = versions
+        latest_price = list(result['history'][-1].values())[0]
+        predicted_price = list(result['predict'].values())[0]
+        self.assertEqual(predicted_price, round((1.0 + self.PREDICTIONS[version]) * latest_price, 2))
+
+    def test_requests(self):
+        client = self.app.app.test_client()
+        self.check_result(json.loads(client.get('/stock/600000').data), '600000')
+        self.check_result(json.loads(client.get(f'/stock/000001/{self.dates[-5]}').data), '000001')
+        self.assertEqual(client.get('/stock/999999').data.decode(), 'Error parameter: Stock 999999 is invalid or not supported yet.')
+        self.assertEqual(len(json.loads(client.get('/stock/list').data)), 3)
+        self.assertEqual([stock['id'] for stock in json.loads(client.get('/stock/search?q=pa').data)], ['000001'])
+        self.assertEqual([stock['id'] for stock in json.loads(client.get('/stock/top?n=2&window=1').data)], ['600000', '000001'])
+        self.assertEqual(client.get('/stock/top?n=2&window=1000000').data.decode(), 'Error parameter: 1000000 is not a valid window.')
+        self.assertEqual(client.get('/stock/top?n=5000').data.decode(), 'Error parameter: 5000 is not a valid number of stocks.')
+
+    def test_metrics(self):
+        client = self.app.app.test_client()
+        client.get('/stock/600000')
+        client.get(f'/stock/000001/{self.dates[-5]}')
+        response = client.get('/metrics')
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.data.decode()
+        # Requests are labeled by the route rule instead of the URL.
+        self.assertIn('stock_predictor_request_seconds_count{endpoint="/stock/<id>",status="200"}', text)
+        self.assertIn('stock_predictor_request_seconds_count{endpoint="/stock/<id>/<date>",status="200"}', text)
+        self.assertIn('stock_predictor_cache_hits_total{cache="results"}', text)
+        self.assertIn('stock_predictor_stage_seconds_bucket{stage="recent_prices",le="+Inf"}', text)
+
+    def test_batch_requests(self):
+        client = self.app.app.test_client()
+        results = json.loads(client.get(f'/stock/batch?ids=600000,000002,999999,600000&date={self.dates[-3]}').data)
+        self.assertEqual(list(results), ['600000', '000002', '999999'])
+        self.check_result(results['600000'], '600000')
+        self.check_result(results['000002'], '000002')
+        self.assertIsNone(results['999999'])
+        self.assertEqual(results['600000'], json.loads(client.get(f'/stock/600000/{self.dates[-3]}').data))
+
+        results = json.loads(client.post('/stock/batch', json={'ids': ['000001']}).data)
+        self.assertEqual(results['000001'], json.loads(client.get('/stock/000001').data))
+
+        self.assertEqual(client.get('/stock/batch?ids=60000a').data.decode(), 'Error parameter: 60000a is not a valid stock id.')
+        self.assertEqual(client.get('/stock/batch').data.decode(), 'Error parameter: 0 is not a valid number of stocks.')
+        self.assertEqual(client.post('/stock/batch', data='[]').data.decode(), 'Error parameter: The body should be a JSON object with a list of ids.')
+
+    def test_update(self):
+        client = self.app.app.test_client()
+        response = client.get('/stock/update')
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.json['started'])
+        for _ in range(100):
+            status = client.get('/stock/update/status').json
+            if status['status'] != 'running':
+                break
+            time.sleep(0.1)
+        self.assertEqual(status['status'], 'succeeded')
+        self.assertEqual(status['progress'], 1.0)
+
+        # Overlapping refreshes are rejected.
+        with self.app.service.refresh_lock:
+            response = client.get('/stock/update')
+            self.assertEqual(response.status_code, 409)
+            self.assertFalse(response.json['started'])
+            self.assertRaises(RuntimeError, self.app.service.refresh_data)
+        self.check_result(json.loads(client.get('/stock/600000').data), '600000')
+
+    def test_concurrent_requests(self):
+        errors = []
+        stopped = threading.Event()
+
+        def request(client, url):
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return json.loads(response.data)
+
+        def send_requests():
+            client = self.app.app.test_client()
+            try:
+                for _ in range(50):
+                    for stock in self.STOCKS:
+                        self.check_result(request(client, f'/stock/{stock.id}'), stock.id)
+                        self.check_result(request(client, f'/stock/{stock.id}/{self.dates[-10]}'), stock.id)
+                    self.assertEqual(len(request(client, '/stock/list')), 3)
+                    self.assertEqual(len(request(client, '/stock/top?n=3&window=2')), 3)
+            except Exception as error:
+                errors.append(error)
+
+        def refresh():
+            # Publish the versions of the snapshot in turn, and reload them while the requests are in progress.
+            version = 0
+            while not stopped.is_set():
+                version = (version + 1) % len(self.snapshots)
+                self.snapshots[version].save(self.snapshot_path)
+                self.app.service.refresh_data()
+
+        refresher = threading.Thread(target=refresh)
+        refresher.start()
+        senders = [threading.Thread(target=send_requests) for _ in range(8)]
+        for sender in senders:
+            sender.start()
+        for sender in senders:
+            sender.join()
+        stopped.set()
+        refresher.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
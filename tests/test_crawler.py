@@ -0,0 +1,103 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import tempfile
+import threading
+import unittest
+
+import context
+from crawler import file_hash, HttpCrawler
+
+
+# Fake Excel files served by the stand-in server, which only need the right signatures.
+FILES = {
+    '/sh': b'\xd0\xcf\x11\xe0shanghai',
+    '/sz': b'PK\x03\x04shenzhen',
+    '/error': b'<html>Access denied</html>',
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in of the export endpoints of the stock exchanges.
+    """
+
+    def do_GET(self):
+        content = FILES.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        self.server.referers.append(self.headers.get('Referer'))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeCrawler:
+    """
+    Fake of the browser crawler, which records the stock exchanges it crawls.
+    """
+
+    crawled = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def crawl_stock_list(self, exchange, save_path):
+        self.crawled.append(exchange)
+        with open(save_path, 'wb') as file:
+            file.write(b'browser')
+
+
+class TestHttpCrawler(unittest.TestCase):
+    """
+    Tests for the lightweight crawler against a local stand-in server.
+    """
+
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.referers = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.directory = tempfile.TemporaryDirectory()
+        self.save_paths = {exchange: os.path.join(self.directory.name, f'{exchange}.xls') for exchange in ['SH', 'SZ']}
+        FakeCrawler.crawled = []
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def test_download(self):
+        with HttpCrawler({'SH': f'{self.url}/sh', 'SZ': f'{self.url}/sz'}, FakeCrawler) as crawler:
+            hashes = crawler.crawl_stock_lists(self.save_paths)
+        for exchange, path in [('SH', '/sh'), ('SZ', '/sz')]:
+            with open(self.save_paths[exchange], 'rb') as file:
+                self.assertEqual(file.read(), FILES[path])
+            self.assertEqual(hashes[exchange], file_hash(self.save_paths[exchange]))
+        self.assertEqual(FakeCrawler.crawled, [])
+        self.assertEqual(len(self.server.referers), 2)
+
+        # The hashes are the same if the contents are not changed.
+        with HttpCrawler({'SH': f'{self.url}/sh', 'SZ': f'{self.url}/sz'}, FakeCrawler) as crawler:
+            self.assertEqual(crawler.crawl_stock_lists(self.save_paths), hashes)
+
+    def test_fallback(self):
+        with HttpCrawler({'SH': f'{self.url}/error', 'SZ': f'{self.url}/missing'}, FakeCrawler) as crawler:
+            crawler.crawl_stock_lists(self.save_paths)
+        self.assertEqual(FakeCrawler.crawled, ['SH', 'SZ'])
+        with open(self.save_paths['SH'], 'rb') as file:
+            self.assertEqual(file.read(), b'browser')
+
+        with HttpCrawler({'SH': f'{self.url}/sh', 'SZ': f'{self.url}/error'}, None) as crawler:
+            self.assertRaises(ValueError, crawler.crawl_stock_lists, self.save_paths)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import pathlib
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import context
+import constants
+from database import SqliteDatabase, TinyDatabase
+from stock import Stock
+
+
+class TestTinyDatabase(unittest.TestCase):
+    """
+    Tests for the TinyDB implementation of database.
+    """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        with mock.patch.object(constants, 'STOCK_DATABASE', pathlib.Path(self.directory.name) / 'stock.json'):
+            self.database = TinyDatabase()
+        self.database.upsert(Stock(id='600000', pinyin='PFYH', name='浦发银行', qlib_id='SH600000'))
+
+    def tearDown(self) -> None:
+        self.database.close()
+        self.directory.cleanup()
+
+    def test_upsert_many(self):
+        self.database.upsert_many([
+            Stock(id='600000', pinyin='PFYH', name='浦发银行', qlib_id='SH600000', listing_date='1999-11-10'),
+            Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001'),
+        ])
+        stocks = {stock.id: stock for stock in self.database.all()}
+        self.assertEqual(len(stocks), 2)
+        self.assertEqual(stocks['600000'].listing_date, '1999-11-10')
+        self.assertEqual(stocks['000001'].name, '平安银行')
+
+    def test_mark_delisted(self):
+        self.database.upsert(Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001'))
+        self.database.mark_delisted(['000001'])
+        self.assertTrue(self.database.search('000001').delisted)
+        self.assertFalse(self.database.search('600000').delisted)
+        self.assertIsNone(self.database.search('000001').delisted_date)
+        self.database.mark_delisted(['600000'], delisted_date='2022-09-09')
+        self.assertTrue(self.database.search('600000').delisted)
+        self.assertEqual(self.database.search('600000').delisted_date, '2022-09-09')
+
+    def test_mark_relisted(self):
+        self.database.mark_delisted(['600000'], delisted_date='2022-09-09')
+        self.database.mark_relisted(['600000'])
+        stock = self.database.search('600000')
+        self.assertFalse(stock.delisted)
+        self.assertIsNone(stock.delisted_date)
+        self.assertEqual(stock.name, '浦发银行')
+
+    def test_all_with_fields_and_where(self):
+        self.database.upsert(Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001', predict={'2022-09-06': 0.01}))
+        self.database.upsert(Stock(id='000003', pinyin='PTA', name='PT金田A', qlib_id='SZ000003', delisted=True))
+        stocks = self.database.all(fields=['id', 'qlib_id'], where={'delisted': False})
+        self.assertEqual(sorted(stock.id for stock in stocks), ['000001', '600000'])
+        for stock in stocks:
+            self.assertIsNone(stock.name)
+            self.assertIsNone(stock.predict)
+            self.assertFalse(stock.delisted)
+        stock = self.database.search('000001', fields=['id', 'name'])
+        self.assertEqual(stock.name, '平安银行')
+        self.assertIsNone(stock.qlib_id)
+
+
+class TestSqliteDatabase(TestTinyDatabase):
+    """
+    Tests for the SQLite implementation of database, which runs the same tests as TinyDB.
+    """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        with mock.patch.object(constants, 'SQLITE_DATABASE', pathlib.Path(self.directory.name) / 'stock.sqlite3'):
+            self.database = SqliteDatabase()
+        self.database.upsert(Stock(id='600000', pinyin='PFYH', name='浦发银行', qlib_id='SH600000'))
+
+    def test_predictions(self):
+        self.database.upsert(Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001', predict={'2022-09-06': 0.01, '2022-09-07': 0.02}))
+        self.assertEqual(self.database.search('000001').predict, {'2022-09-06': 0.01, '2022-09-07': 0.02})
+        # Updating other fields keeps the predictions, and new predictions replace the old ones as a whole.
+        self.database.upsert(Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001', listing_date='1991-04-03'))
+        self.assertEqual(self.database.search('000001').predict, {'2022-09-06': 0.01, '2022-09-07': 0.02})
+        self.database.upsert(Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001', predict={'2022-09-08': 0.03}))
+        stocks = {stock.id: stock for stock in self.database.all()}
+        self.assertEqual(stocks['000001'].predict, {'2022-09-08': 0.03})
+        self.assertEqual(stocks['000001'].listing_date, '1991-04-03')
+        self.assertIsNone(stocks['600000'].predict)
+
+    def test_read_while_writing(self):
+        # Another connection keeps a write transaction open, which doesn't block the readers in WAL mode.
+        connection = sqlite3.connect(self.database.path, isolation_level=None)
+        self.addCleanup(connection.close)
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute("UPDATE stocks SET name = 'renamed' WHERE id = '600000'")
+        results = []
+        reader = threading.Thread(target=lambda: results.append(self.database.search('600000').name))
+        reader.start()
+        reader.join(5)
+        self.assertEqual(results, ['浦发银行'])
+        connection.execute('COMMIT')
+        self.assertEqual(self.database.search('600000').name, 'renamed')
+
+    def test_release_thread(self):
+        def read():
+            self.database.search('600000')
+            self.database.release_thread()
+
+        for _ in range(3):
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join(5)
+        # Only the connection of the main thread is kept.
+        self.assertEqual(len(self.database.connections), 1)
+        self.database.release_thread()
+        self.assertEqual(self.database.search('600000').name, '浦发银行')
+
+    def test_unknown_field(self):
+        self.assertRaises(ValueError, self.database.all, where={'price': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
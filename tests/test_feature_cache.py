@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import tempfile
+import unittest
+from unittest import mock
+
+import context
+from feature_cache import FeatureCache
+from trading_calendar import TradingCalendar
+
+
+TRADING_DAYS = pd.to_datetime(['2022-09-05', '2022-09-06', '2022-09-07', '2022-09-08'])
+
+
+class FakeHandler:
+    """
+    A data handler producing one feature, which records the requested instruments and date ranges.
+    """
+
+    requests = []
+
+    def __init__(self, instruments, start_time, end_time) -> None:
+        FakeHandler.requests.append((tuple(instruments), start_time, end_time))
+        # SZ000003 has no data at all.
+        dates = TRADING_DAYS[(TRADING_DAYS >= start_time) & (TRADING_DAYS <= end_time)]
+        index = pd.MultiIndex.from_product([dates, [instrument for instrument in instruments if instrument != 'SZ000003']], names=['datetime', 'instrument'])
+        self.features = pd.DataFrame({'KMID': np.arange(len(index), dtype=np.float32)}, index=index)
+
+    def fetch(self, col_set, data_key):
+        return self.features
+
+    @classmethod
+    def config_hash(cls) -> str:
+        return 'fake'
+
+
+class TestFeatureCache(unittest.TestCase):
+    """
+    Tests for the persistent feature cache.
+    """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = FeatureCache(FakeHandler, self.directory.name)
+        FakeHandler.requests = []
+        patcher = mock.patch.object(TradingCalendar, '_shared', TradingCalendar(TRADING_DAYS.strftime('%Y-%m-%d').tolist()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_only_missing_features_are_computed(self):
+        features = self.cache.get(['SH600000', 'SZ000001'], '2022-09-05', '2022-09-07')
+        self.assertEqual(features.shape, (6, 1))
+        self.assertEqual(FakeHandler.requests, [(('SH600000', 'SZ000001'), '2022-09-05', '2022-09-07')])
+
+        # The cached features are reused and only the new day is computed.
+        features = self.cache.get(['SH600000', 'SZ000001'], '2022-09-05', '2022-09-08')
+        self.assertEqual(features.shape, (8, 1))
+        self.assertEqual(FakeHandler.requests[-1], (('SH600000', 'SZ000001'), '2022-09-08', '2022-09-08'))
+
+        # A new instrument is computed alone.
+        features = self.cache.get(['SH600000', 'SZ000002'], '2022-09-08', '2022-09-08')
+        self.assertEqual(list(features.index.get_level_values('instrument')), ['SH600000', 'SZ000002'])
+        self.assertEqual(FakeHandler.requests[-1], (('SZ000002',), '2022-09-08', '2022-09-08'))
+
+    def test_instruments_without_data_are_not_cached(self):
+        features = self.cache.get(['SZ000003'], '2022-09-05', '2022-09-06')
+        self.assertTrue(features.empty)
+        self.assertIsNone(self.cache._load('2022-09-05'))
+        self.cache.get(['SZ000003'], '2022-09-05', '2022-09-06')
+        self.assertEqual(len(FakeHandler.requests), 2)
+
+    def test_chunks_are_merged(self):
+        for instrument in ['SH600000', 'SZ000001', 'SZ000002']:
+            self.cache.get([instrument], '2022-09-05', '2022-09-06')
+        for date in ['2022-09-05', '2022-09-06']:
+            self.assertEqual(len(self.cache._chunk_paths(date)), 1)
+            self.assertEqual(sorted(self.cache._load(date).index.get_level_values('instrument')), ['SH600000', 'SZ000001', 'SZ000002'])
+        self.cache.get(['SH600000', 'SZ000001', 'SZ000002'], '2022-09-05', '2022-09-06')
+        self.assertEqual(len(FakeHandler.requests), 3)
+
+    def test_invalidate(self):
+        self.cache.get(['SH600000'], '2022-09-05', '2022-09-08')
+        self.cache.invalidate('2022-09-07')
+        self.cache.get(['SH600000'], '2022-09-05', '2022-09-08')
+        self.assertEqual(FakeHandler.requests[-1], (('SH600000',), '2022-09-07', '2022-09-08'))
+
+
+if __name__ == '__main__':
+    unittest.main()
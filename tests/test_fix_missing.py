@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+import pathlib
+import qlib.data
+import tempfile
+import unittest
+from unittest import mock
+
+import context
+import constants
+from fakes import FakeDatabase
+from feature_cache import FeatureCache
+import predict
+from prediction_store import PredictionStore
+from service import Service
+from stock import Stock
+from trading_calendar import TradingCalendar
+
+
+DATES = ['2022-01-04', '2022-01-05', '2022-01-06', '2022-01-07', '2022-01-10']
+
+
+def fake_features(closes):
+    """
+    Make a fake of D.features returning the given close prices keyed by qlib id and date. NaN means a row without price.
+    """
+    def features(instruments, fields, start_time, end_time):
+        rows = [
+            ((instrument, pd.Timestamp(date)), price)
+            for instrument in instruments for date, price in closes.get(instrument, {}).items() if start_time <= date <= end_time
+        ]
+        index = pd.MultiIndex.from_tuples([key for key, _ in rows], names=['instrument', 'datetime'])
+        return pd.DataFrame({fields[0]: [price for _, price in rows]}, index=index, dtype=np.float32)
+    return features
+
+
+class TestFixMissingPrediction(unittest.TestCase):
+    """
+    Tests for finding and predicting the missing predictions.
+    """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.service = Service.__new__(Service)
+        self.service.prediction_store = PredictionStore(pathlib.Path(self.directory.name) / 'predictions')
+        self.predicted = []
+        self.patchers = [
+            mock.patch.object(constants, 'START_PREDICTING_DATE', DATES[0]),
+            mock.patch.object(predict, 'predict', side_effect=self.fake_predict),
+            mock.patch.object(TradingCalendar, '_shared', TradingCalendar(DATES)),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self) -> None:
+        for patcher in self.patchers:
+            patcher.stop()
+        self.directory.cleanup()
+
+    def fake_predict(self, ids, start_date, end_date):
+        self.predicted.append((ids, start_date, end_date))
+        index = pd.MultiIndex.from_product([pd.to_datetime([date for date in DATES if start_date <= date <= end_date]), ids], names=['datetime', 'instrument'])
+        return pd.Series(0.01, index=index)
+
+    def store_predictions(self, predicted_dates):
+        items = [((pd.Timestamp(date), qlib_id), 0.02) for qlib_id, dates in predicted_dates.items() for date in dates]
+        index = pd.MultiIndex.from_tuples([key for key, _ in items], names=['datetime', 'instrument'])
+        self.service.prediction_store.update(pd.Series([value for _, value in items], index=index))
+
+    def test_fix_missing_prediction(self):
+        self.store_predictions({
+            'SH600000': ['2022-01-04', '2022-01-05', '2022-01-07', '2022-01-10'],
+            'SZ000001': ['2022-01-04', '2022-01-05', '2022-01-07', '2022-01-10'],
+            # Listed on 2022-01-07.
+            'SH600001': ['2022-01-07', '2022-01-10'],
+            # Delisted after 2022-01-05.
+            'SH600002': ['2022-01-04'],
+            # Suspended on 2022-01-05 and 2022-01-06.
+            'SH600003': ['2022-01-04', '2022-01-07'],
+        })
+        closes = {
+            'SH600000': {date: 10.0 for date in DATES},
+            'SZ000001': {date: 10.0 for date in DATES},
+            'SH600001': {'2022-01-07': 10.0, '2022-01-10': 10.0},
+            'SH600002': {'2022-01-04': 10.0, '2022-01-05': 10.0},
+            'SH600003': {'2022-01-04': 10.0, '2022-01-05': np.nan, '2022-01-06': np.nan, '2022-01-07': 10.0, '2022-01-10': 10.0},
+        }
+        with mock.patch.object(qlib.data, 'D') as D:
+            D.features.side_effect = fake_features(closes)
+            self.service.fix_mising_prediction()
+
+        # Stocks missing the same duration are predicted together. Days without price are not missing.
+        self.assertEqual(sorted(self.predicted), [
+            (['SH600000', 'SZ000001'], '2022-01-06', '2022-01-06'),
+            (['SH600002'], '2022-01-05', '2022-01-05'),
+            (['SH600003'], '2022-01-10', '2022-01-10'),
+        ])
+        self.assertAlmostEqual(self.service.prediction_store.get_prediction('SZ000001', '2022-01-06'), 0.01, places=6)
+
+        # Nothing is predicted again once the predictions are fixed.
+        self.predicted = []
+        with mock.patch.object(qlib.data, 'D') as D:
+            D.features.side_effect = fake_features(closes)
+            self.service.fix_mising_prediction()
+        self.assertEqual(self.predicted, [])
+
+
+class TestFixMissingData(unittest.TestCase):
+    """
+    Tests for finding and re-downloading the missing data.
+    """
+
+    DATES = [date.strftime('%Y-%m-%d') for date in pd.bdate_range('2022-01-04', '2022-01-31')]
+
+    def setUp(self) -> None:
+        self.service = Service.__new__(Service)
+        # SZ000002 has no qlib data at all.
+        self.service.database = FakeDatabase([
+            Stock(id=qlib_id[2:], pinyin=None, name=None, qlib_id=qlib_id) for qlib_id in ['SH600000', 'SZ000001', 'SZ000002']
+        ])
+        self.closes = {qlib_id: {date: 10.0 for date in self.DATES} for qlib_id in ['SH600000', 'SZ000001']}
+        self.patchers = [
+            mock.patch.object(constants, 'START_PREDICTING_DATE', self.DATES[0]),
+            mock.patch.object(qlib.data, 'D'),
+            mock.patch('os.system'),
+            mock.patch.object(FeatureCache, 'invalidate', autospec=True),
+        ]
+        _, D, self.system, self.invalidate = [patcher.start() for patcher in self.patchers]
+        D.features.side_effect = fake_features(self.closes)
+
+    def tearDown(self) -> None:
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def set_missing(self, qlib_ids, dates):
+        for qlib_id in qlib_ids:
+            for date in dates:
+                self.closes[qlib_id][date] = np.nan
+
+    def commands(self):
+        return [call.args[0] for call in self.system.call_args_list]
+
+    def test_fix_missing_data(self):
+        # Missing dates less than 5 days apart are clustered into one duration.
+        self.set_missing(['SH600000', 'SZ000001'], ['2022-01-05', '2022-01-06', '2022-01-10', '2022-01-24'])
+        # Dates missing in only some of the stocks are not re-downloaded.
+        self.set_missing(['SH600000'], ['2022-01-14'])
+        self.service.fix_missing_data()
+        commands = self.commands()
+        self.assertEqual(len(commands), 2)
+        self.assertIn('--trading_date 2022-01-05 --end_date 2022-01-11', commands[0])
+        self.assertIn('--trading_date 2022-01-24 --end_date 2022-01-25', commands[1])
+        # The cached features since the first re-downloaded date are invalidated.
+        self.assertEqual(self.invalidate.call_args.args[1], '2022-01-05')
+
+    def test_dry_run(self):
+        self.set_missing(['SH600000', 'SZ000001'], ['2022-01-05'])
+        with mock.patch('builtins.print') as print:
+            self.service.fix_missing_data(dry_run=True)
+        self.system.assert_not_called()
+        self.invalidate.assert_not_called()
+        self.assertIn('--trading_date 2022-01-05 --end_date 2022-01-06', print.call_args.args[0])
+
+    def test_no_missing_data(self):
+        self.service.fix_missing_data()
+        self.system.assert_not_called()
+        self.invalidate.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import math
+import unittest
+
+import context
+from metrics import CACHE_HITS, Histogram, Metrics, STAGE_SECONDS
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Tests for the latency histograms and the counters.
+    """
+
+    def test_histogram_quantile(self):
+        histogram = Histogram((1.0, 2.0, 4.0))
+        self.assertTrue(math.isnan(histogram.quantile(0.5)))
+        for value in [0.5, 1.5, 1.5, 3.0]:
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 0])
+        self.assertEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(histogram.quantile(1.0), 4.0)
+        # Values above all the buckets are estimated as the largest bucket bound.
+        histogram.observe(10.0)
+        self.assertEqual(histogram.quantile(1.0), 4.0)
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        metrics.observe(STAGE_SECONDS, 0.003, buckets=(0.001, 0.01), stage='features')
+        metrics.increment(CACHE_HITS, 3, cache='features')
+        metrics.increment(CACHE_HITS, cache='features')
+        lines = metrics.to_prometheus().splitlines()
+        self.assertIn('# TYPE stock_predictor_stage_seconds histogram', lines)
+        self.assertIn('stock_predictor_stage_seconds_bucket{stage="features",le="0.001"} 0', lines)
+        self.assertIn('stock_predictor_stage_seconds_bucket{stage="features",le="0.01"} 1', lines)
+        self.assertIn('stock_predictor_stage_seconds_bucket{stage="features",le="+Inf"} 1', lines)
+        self.assertIn('stock_predictor_stage_seconds_count{stage="features"} 1', lines)
+        self.assertIn('# TYPE stock_predictor_cache_hits_total counter', lines)
+        self.assertIn('stock_predictor_cache_hits_total{cache="features"} 4', lines)
+
+    def test_merge_and_summary(self):
+        metrics = Metrics()
+        with metrics.timer('model'):
+            pass
+        worker_metrics = Metrics()
+        with worker_metrics.timer('model'):
+            pass
+        worker_metrics.increment(CACHE_HITS, 2, cache='features')
+        metrics.merge(worker_metrics.export())
+
+        summary = metrics.summary()
+        stage = summary['histograms'][STAGE_SECONDS][0]
+        self.assertEqual(stage['labels'], {'stage': 'model'})
+        self.assertEqual(stage['count'], 2)
+        self.assertLessEqual(stage['p50'], stage['p99'])
+        self.assertEqual(summary['counters'][CACHE_HITS], [{'labels': {'cache': 'features'}, 'value': 2}])
+
+        metrics.reset()
+        self.assertEqual(metrics.summary(), {'histograms': {}, 'counters': {}})
+
+
+if __name__ == '__main__':
+    unittest.main()
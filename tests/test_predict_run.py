@@ -0,0 +1,88 @@
+import pandas as pd
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+import context
+import constants
+from fakes import FakeDatabase
+import predict
+from predict_run import PredictRun
+from prediction_store import PredictionStore
+from service import Service
+from stock import Stock
+from trading_calendar import TradingCalendar
+
+
+class TestPredictRun(unittest.TestCase):
+    """
+    Tests for the checkpointed and resumable run of predicting all the stocks.
+    """
+
+    DATES = ['2022-09-05', '2022-09-06', '2022-09-07']
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.manifest_path = pathlib.Path(self.directory.name) / 'predict_run.json'
+        self.service = Service.__new__(Service)
+        self.service.database = FakeDatabase([Stock(id=f'60000{index}', pinyin=None, name=None, qlib_id=f'SH60000{index}') for index in range(5)])
+        self.service.prediction_store = PredictionStore(pathlib.Path(self.directory.name) / 'predictions')
+        self.predicted = []
+        self.failing_batch = None
+        self.patchers = [
+            mock.patch.object(constants, 'PREDICT_RUN_PATH', self.manifest_path),
+            mock.patch.object(predict, 'predict', side_effect=self.fake_predict),
+            mock.patch.object(TradingCalendar, '_shared', TradingCalendar(self.DATES)),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self) -> None:
+        for patcher in self.patchers:
+            patcher.stop()
+        self.directory.cleanup()
+
+    def fake_predict(self, ids, start_date, end_date):
+        if ids == self.failing_batch:
+            raise RuntimeError('Killed.')
+        self.predicted.append(ids)
+        index = pd.MultiIndex.from_product([pd.to_datetime(self.DATES), ids], names=['datetime', 'instrument'])
+        return pd.Series(0.01, index=index)
+
+    def test_manifest(self):
+        run = PredictRun('2022-09-05', '2022-09-07', [['SH600000'], ['SH600001']], [1])
+        self.assertEqual(run.pending(), [0])
+        self.assertFalse(run.completed)
+        run.save(self.manifest_path)
+        self.assertEqual(PredictRun.load(self.manifest_path), run)
+        self.assertIsNone(PredictRun.load(pathlib.Path(self.directory.name) / 'missing.json'))
+
+    def test_resume(self):
+        self.failing_batch = ['SH600002', 'SH600003']
+        self.assertRaises(RuntimeError, self.service.predict_all, '2022-09-05', batch_size=2)
+        self.assertEqual(self.predicted, [['SH600000', 'SH600001']])
+        self.assertEqual(PredictRun.load(self.manifest_path).finished, [0])
+
+        # Only the unfinished batches are predicted when resuming.
+        self.failing_batch = None
+        self.predicted = []
+        self.service.predict_all(resume=True, batch_size=2)
+        self.assertEqual(self.predicted, [['SH600002', 'SH600003'], ['SH600004']])
+        self.assertTrue(PredictRun.load(self.manifest_path).completed)
+        self.assertEqual(len(self.service.prediction_store.get_date_predictions('2022-09-06')), 5)
+
+    def test_skip_predicted(self):
+        self.service.predict_all('2022-09-05', batch_size=2)
+        # The stocks already predicted in all the dates are skipped unless overwriting.
+        self.predicted = []
+        self.service.database.stocks.append(Stock(id='000001', pinyin=None, name=None, qlib_id='SZ000001'))
+        self.service.predict_all('2022-09-05', batch_size=2)
+        self.assertEqual(self.predicted, [['SZ000001']])
+        self.predicted = []
+        self.service.predict_all('2022-09-05', overwrite=True, batch_size=4)
+        self.assertEqual(len(sum(self.predicted, [])), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
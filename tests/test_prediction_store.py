@@ -0,0 +1,96 @@
+import json
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import unittest
+
+import context
+from prediction_store import PredictionStore
+import versioned_directory
+
+
+def make_predictions(items):
+    index = pd.MultiIndex.from_tuples([(pd.Timestamp(date), instrument) for date, instrument, _ in items], names=['datetime', 'instrument'])
+    return pd.Series([value for _, _, value in items], index=index)
+
+
+class TestPredictionStore(unittest.TestCase):
+    """
+    Tests for the columnar prediction store.
+    """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = PredictionStore(self.directory.name)
+        self.store.update(make_predictions([
+            ('2022-09-07', 'SH600000', 0.01),
+            ('2022-09-06', 'SH600000', 0.02),
+            ('2022-09-06', 'SZ000001', -0.03),
+        ]))
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_update_and_reload(self):
+        self.store.update(make_predictions([
+            ('2022-09-05', 'SZ000002', 0.04),
+            ('2022-09-07', 'SZ000001', 0.05),
+        ]))
+        store = PredictionStore(self.directory.name)
+        self.assertEqual(store.dates, ['2022-09-05', '2022-09-06', '2022-09-07'])
+        self.assertEqual(store.instruments, ['SH600000', 'SZ000001', 'SZ000002'])
+        self.assertEqual(store.values.dtype, np.float32)
+        self.assertAlmostEqual(store.get_stock_predictions('SZ000001')['2022-09-07'], 0.05, places=6)
+        self.assertAlmostEqual(store.get_stock_predictions('SH600000')['2022-09-06'], 0.02, places=6)
+
+    def test_get_prediction(self):
+        self.assertAlmostEqual(self.store.get_prediction('SZ000001', '2022-09-06'), -0.03, places=6)
+        self.assertIsNone(self.store.get_prediction('SZ000001', '2022-09-07'))
+        self.assertIsNone(self.store.get_prediction('SZ000001', '2022-09-08'))
+        self.assertIsNone(self.store.get_prediction('SZ300750', '2022-09-06'))
+
+    def test_get_stock_predictions(self):
+        predictions = self.store.get_stock_predictions('SH600000', start_date='2022-09-07')
+        self.assertEqual(list(predictions.index), ['2022-09-07'])
+        predictions = self.store.get_stock_predictions('SZ000001', end_date='2022-09-30')
+        self.assertEqual(list(predictions.index), ['2022-09-06'])
+        self.assertTrue(self.store.get_stock_predictions('SZ300750').empty)
+
+    def test_get_date_predictions(self):
+        predictions = self.store.get_date_predictions('2022-09-06')
+        self.assertEqual(sorted(predictions.index), ['SH600000', 'SZ000001'])
+        self.assertEqual(list(self.store.get_date_predictions('2022-09-07').index), ['SH600000'])
+        self.assertTrue(self.store.get_date_predictions('2022-09-08').empty)
+
+    def test_get_recent_predictions(self):
+        predictions = self.store.get_recent_predictions(1)
+        self.assertEqual(list(predictions.index), ['2022-09-07'])
+        self.assertTrue(np.isnan(predictions.loc['2022-09-07', 'SZ000001']))
+        self.assertEqual(self.store.get_recent_predictions(10).shape, (2, 2))
+
+    def test_get_dates_predictions(self):
+        predictions = self.store.get_dates_predictions(['2022-09-05', '2022-09-06'])
+        self.assertEqual(predictions.shape, (2, 2))
+        self.assertTrue(predictions.loc['2022-09-05'].isna().all())
+        self.assertAlmostEqual(predictions.loc['2022-09-06', 'SZ000001'], -0.03, places=6)
+
+    def test_versions(self):
+        for value in [0.04, 0.05, 0.06]:
+            self.store.update(make_predictions([('2022-09-07', 'SZ000001', value)]))
+        versions = [entry for entry in os.listdir(self.directory.name) if entry != versioned_directory.CURRENT_FILE]
+        self.assertEqual(len(versions), versioned_directory.KEEP_VERSIONS)
+        with open(os.path.join(self.directory.name, versioned_directory.CURRENT_FILE), 'r') as current_file:
+            self.assertEqual(current_file.read(), max(versions))
+        self.assertAlmostEqual(PredictionStore(self.directory.name).get_prediction('SZ000001', '2022-09-07'), 0.06, places=6)
+
+    def test_load_unversioned(self):
+        with tempfile.TemporaryDirectory() as directory:
+            np.save(os.path.join(directory, PredictionStore.VALUES_FILE), np.array([[0.01]], dtype=np.float32))
+            with open(os.path.join(directory, PredictionStore.INDEX_FILE), 'w') as index_file:
+                json.dump({'dates': ['2022-09-07'], 'instruments': ['SH600000']}, index_file)
+            self.assertAlmostEqual(PredictionStore(directory).get_prediction('SH600000', '2022-09-07'), 0.01, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import numpy as np
+import unittest
+
+import context
+from price_matrix import PriceMatrix
+
+
+class TestPriceMatrix(unittest.TestCase):
+    """
+    Tests for the in-memory price matrix.
+    """
+
+    def setUp(self) -> None:
+        values = np.array([
+            [7.26, 10.5],
+            [7.22, np.nan],
+            [7.24, 10.7],
+            [np.nan, 10.9],
+        ], dtype=np.float32)
+        self.prices = PriceMatrix(['2022-09-06', '2022-09-07', '2022-09-08', '2022-09-09'], ['SH600000', 'SZ000001'], values)
+
+    def test_get_recent_prices(self):
+        recent_prices = self.prices.get_recent_prices('SH600000', '2022-09-08', 2)
+        self.assertEqual([date for date, _ in recent_prices], ['2022-09-07', '2022-09-08'])
+        self.assertAlmostEqual(recent_prices[-1][1], 7.24, places=5)
+
+    def test_missing_prices_are_skipped(self):
+        recent_prices = self.prices.get_recent_prices('SZ000001', '2022-09-30', 40)
+        self.assertEqual([date for date, _ in recent_prices], ['2022-09-06', '2022-09-08', '2022-09-09'])
+
+    def test_out_of_range(self):
+        self.assertEqual(self.prices.get_recent_prices('SH600000', '2022-09-05', 40), [])
+        self.assertEqual(self.prices.get_recent_prices('SZ300750', '2022-09-08', 40), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import tempfile
+import unittest
+from unittest import mock
+
+import context
+from prediction_store import PredictionStore
+from ranking_index import RankingIndex
+
+
+class TestRankingIndex(unittest.TestCase):
+    """
+    Tests for the ranking index of recommended stocks.
+    """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        store = PredictionStore(self.directory.name)
+        predictions = {
+            '2022-09-05': {'SH600000': 0.01, 'SZ000001': 0.05, 'SZ000002': 0.02},
+            '2022-09-06': {'SH600000': 0.03, 'SZ000001': 0.01, 'SZ000002': 0.025},
+            '2022-09-07': {'SH600000': 0.02, 'SZ000001': 0.01},
+            '2022-09-08': {'SH600000': 0.01, 'SZ000001': 0.05, 'SZ000002': 0.09},
+        }
+        items = [((pd.Timestamp(date), instrument), value) for date, values in predictions.items() for instrument, value in values.items()]
+        index = pd.MultiIndex.from_tuples([key for key, _ in items], names=['datetime', 'instrument'])
+        store.update(pd.Series([value for _, value in items], index=index))
+        self.ranking_index = RankingIndex(store, ['2022-09-05', '2022-09-06', '2022-09-07', '2022-09-08', '2022-09-09'])
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_default_window(self):
+        ranked = list(self.ranking_index.iterate('2022-09-07'))
+        self.assertEqual([qlib_id for qlib_id, _ in ranked], ['SZ000001', 'SH600000'])
+        self.assertAlmostEqual(ranked[0][1], 0.01, places=6)
+        # Stocks missing prediction in the window are not ranked.
+        ranked = list(self.ranking_index.iterate('2022-09-08'))
+        self.assertEqual([qlib_id for qlib_id, _ in ranked], ['SZ000001', 'SH600000'])
+
+    def test_other_windows(self):
+        ranked = list(self.ranking_index.iterate('2022-09-08', window=1))
+        self.assertEqual([qlib_id for qlib_id, _ in ranked], ['SZ000002', 'SZ000001', 'SH600000'])
+        ranked = list(self.ranking_index.iterate('2022-09-06', window=2))
+        self.assertEqual([qlib_id for qlib_id, _ in ranked], ['SZ000001', 'SZ000002', 'SH600000'])
+        with self.assertRaises(ValueError):
+            list(self.ranking_index.iterate('2022-09-08', window=RankingIndex.MAX_WINDOW + 1))
+
+    def test_head(self):
+        # More stocks are selected when the iteration goes past the head.
+        ranked = list(self.ranking_index.iterate('2022-09-08', window=1))
+        with mock.patch.object(RankingIndex, 'HEAD_SIZE', 1):
+            self.ranking_index.memo.clear()
+            self.assertEqual(list(self.ranking_index.iterate('2022-09-08', window=1)), ranked)
+        # Only the trading days iterated are ranked, and the memo is bounded.
+        self.assertEqual(sorted(self.ranking_index.memo), [(3, 1)])
+        with mock.patch.object(RankingIndex, 'MAX_MEMO_SIZE', 1):
+            list(self.ranking_index.iterate('2022-09-07', window=1))
+        self.assertEqual(sorted(self.ranking_index.memo), [(2, 1)])
+
+    def test_ties(self):
+        scores = np.array([0.1, 0.2, 0.1, -np.inf, 0.1, 0.3])
+        # Stocks tied with the last one of the head are all included, in the order of their positions.
+        self.assertEqual(RankingIndex._head(scores, 3).tolist(), [5, 1, 0, 2, 4])
+        self.assertEqual(RankingIndex._head(scores, 10).tolist(), [5, 1, 0, 2, 4])
+
+    def test_dates(self):
+        # The latest trading day till the date is used.
+        self.assertEqual(list(self.ranking_index.iterate('2022-09-10', window=1)), [])
+        self.assertEqual(len(list(self.ranking_index.iterate('2022-09-08', window=1))), 3)
+        self.assertEqual(list(self.ranking_index.iterate('2022-09-01')), [])
+        # Not enough trading days for the window.
+        self.assertEqual(list(self.ranking_index.iterate('2022-09-06')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
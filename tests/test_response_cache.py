@@ -0,0 +1,35 @@
+import brotli
+import gzip
+import unittest
+
+import context
+from response_cache import CachedResponse
+
+
+class TestCachedResponse(unittest.TestCase):
+    """
+    Tests for the cached responses.
+    """
+
+    def test_from_text(self):
+        text = '[{"id": "000001", "pinyin": "PAYH", "name": "平安银行"}]'
+        cached_response = CachedResponse.from_text(text)
+        self.assertEqual(cached_response.body.decode('utf-8'), text)
+        self.assertEqual(gzip.decompress(cached_response.encodings['gzip']), cached_response.body)
+        self.assertEqual(brotli.decompress(cached_response.encodings['br']), cached_response.body)
+        self.assertEqual(cached_response.mimetype, 'application/json')
+
+    def test_on_demand(self):
+        text = '[{"id": "000001", "name": "平安银行", "increase": 0.1}]' * 100
+        cached_response = CachedResponse.from_text(text, on_demand=True)
+        self.assertEqual(gzip.decompress(cached_response.encodings['gzip']), cached_response.body)
+        self.assertEqual(brotli.decompress(cached_response.encodings['br']), cached_response.body)
+        self.assertEqual(cached_response.etag, CachedResponse.from_text(text).etag)
+
+    def test_etag(self):
+        self.assertEqual(CachedResponse.from_text('[]').etag, CachedResponse.from_text('[]').etag)
+        self.assertNotEqual(CachedResponse.from_text('[]').etag, CachedResponse.from_text('{}').etag)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+import context
+from search_index import pinyin_initials, SearchIndex
+from stock import Stock
+
+
+class TestSearchIndex(unittest.TestCase):
+    """
+    Tests for the prefix search index of stocks.
+    """
+
+    def setUp(self) -> None:
+        self.search_index = SearchIndex([
+            Stock(id='600000', pinyin='PFYH', name='浦发银行', qlib_id='SH600000'),
+            Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001'),
+            Stock(id='000002', pinyin='WKA', name='万科A', qlib_id='SZ000002'),
+            Stock(id='601318', pinyin='ZGPA', name='中国平安', qlib_id='SH601318'),
+        ])
+
+    def test_search_by_id(self):
+        self.assertEqual([stock['id'] for stock in self.search_index.search('0000')], ['000001', '000002'])
+        self.assertEqual([stock['id'] for stock in self.search_index.search('6', limit=1)], ['600000'])
+
+    def test_search_by_pinyin(self):
+        self.assertEqual([stock['id'] for stock in self.search_index.search('p')], ['000001', '600000'])
+        self.assertEqual(self.search_index.search('payh'), [{'id': '000001', 'pinyin': 'PAYH', 'name': '平安银行'}])
+
+    def test_search_by_name(self):
+        self.assertEqual([stock['id'] for stock in self.search_index.search('平安')], ['000001'])
+        self.assertEqual([stock['id'] for stock in self.search_index.search('万科a')], ['000002'])
+
+    def test_no_match(self):
+        self.assertEqual(self.search_index.search('XYZ'), [])
+        self.assertEqual(self.search_index.search(' '), [])
+
+    def test_pinyin_initials(self):
+        self.assertEqual(pinyin_initials('平安银行'), 'PAYH')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import dataclasses
+import pickle
+import unittest
+
+import context
+from stock import Stock
+
+
+class TestStock(unittest.TestCase):
+    """
+    Tests for the fast encoding and decoding of the stock, which must keep the JSON contract of dataclass_json.
+    """
+
+    def setUp(self) -> None:
+        self.stock = Stock(
+            id='600000', pinyin='PFYH', name='浦发银行', qlib_id='SH600000', enname='Shanghai Pudong Development Bank Co.,Ltd.',
+            history=[{'2022-09-08': 7.24}, {'2022-09-09': 7.31}], predict={'2022-09-23': 7.36}, listing_date='1999-11-10'
+        )
+
+    def test_encode(self):
+        self.assertEqual(self.stock.as_dict(), self.stock.to_dict())
+        self.assertEqual(self.stock.as_json(), self.stock.to_json(ensure_ascii=False))
+        stock = Stock(id='000001', pinyin=None, name=None, qlib_id='SZ000001', delisted=True)
+        self.assertEqual(stock.as_json(), stock.to_json(ensure_ascii=False))
+
+    def test_decode(self):
+        row = {'_id': 'ignored', **self.stock.to_dict()}
+        self.assertEqual(Stock.from_row(row), Stock.from_dict(row))
+        self.assertEqual(Stock.from_row(row), self.stock)
+        # Missing fields are set to their default values.
+        self.assertEqual(Stock.from_row({'id': '000001', 'qlib_id': 'SZ000001'}), Stock(id='000001', pinyin=None, name=None, qlib_id='SZ000001'))
+
+    def test_slots(self):
+        self.assertFalse(hasattr(self.stock, '__dict__'))
+        self.assertEqual(dataclasses.replace(self.stock, predict=None).predict, None)
+        self.assertEqual(pickle.loads(pickle.dumps(self.stock)), self.stock)
+        self.assertEqual(Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001').delisted, False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import pandas as pd
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+import context
+import constants
+from database import TinyDatabase
+from service import diff_stock_list, Service
+from stock import Stock
+
+
+class TestStockList(unittest.TestCase):
+    """
+    Tests for comparing the latest stock list with the stocks in database.
+    """
+
+    def setUp(self) -> None:
+        self.stored_stocks = [
+            Stock(id='600000', pinyin='PFYH', name='浦发银行', qlib_id='SH600000', delisted=False, listing_date='1999-11-10'),
+            Stock(id='000001', pinyin='XXXX', name='平安银行', qlib_id='SZ000001', delisted=False, listing_date='1991-04-03'),
+            Stock(id='000002', pinyin='WKA', name='万科A', qlib_id='SZ000002', delisted=False, listing_date='1991-01-29'),
+            Stock(id='000003', pinyin='PTJTA', name='PT金田A', qlib_id='SZ000003', delisted=True, listing_date='1991-07-03'),
+        ]
+
+    def test_diff(self):
+        stock_list = pd.DataFrame([
+            ['600000', '浦发银行', 'SH600000', '1999-11-10'],
+            ['000001', '平安银行', 'SZ000001', '1991-04-03'],
+            ['000003', 'PT金田A', 'SZ000003', '1991-07-03'],
+            ['000004', '国华网安', 'SZ000004', '1991-01-14'],
+        ], columns=['id', 'name', 'qlib_id', 'listing_date'])
+        stocks, delisted_ids, relisted_ids = diff_stock_list(stock_list, self.stored_stocks)
+        stocks = {stock.id: stock for stock in stocks}
+        # Unchanged stocks are not written. The pinyin of unchanged names are reused, so 000001 is unchanged.
+        self.assertEqual(sorted(stocks), ['000003', '000004'])
+        # The new names are translated.
+        self.assertEqual(stocks['000004'].pinyin, 'GHWA')
+        # Relisted stocks are written.
+        self.assertFalse(stocks['000003'].delisted)
+        self.assertEqual(relisted_ids, ['000003'])
+        self.assertEqual(delisted_ids, ['000002'])
+
+    def test_renamed(self):
+        stock_list = pd.DataFrame([['000001', '平安银行A', 'SZ000001', None]], columns=['id', 'name', 'qlib_id', 'listing_date'])
+        stocks, delisted_ids, relisted_ids = diff_stock_list(stock_list, self.stored_stocks[:2])
+        self.assertEqual(stocks, [Stock(id='000001', pinyin='PAYHA', name='平安银行A', qlib_id='SZ000001', delisted=False)])
+        self.assertEqual(delisted_ids, ['600000'])
+        self.assertEqual(relisted_ids, [])
+
+    def test_empty_database(self):
+        stock_list = pd.DataFrame([['600000', '浦发银行', 'SH600000', '1999-11-10']], columns=['id', 'name', 'qlib_id', 'listing_date'])
+        stocks, delisted_ids, relisted_ids = diff_stock_list(stock_list, [])
+        self.assertEqual(stocks, [Stock(id='600000', pinyin='PFYH', name='浦发银行', qlib_id='SH600000', delisted=False, listing_date='1999-11-10')])
+        self.assertEqual(delisted_ids, [])
+        self.assertEqual(relisted_ids, [])
+
+
+class TestLoadStockList(unittest.TestCase):
+    """
+    Tests for loading the stock lists into database.
+    """
+
+    HASHES = {'SH': 'sh-hash', 'SZ': 'sz-hash'}
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        path = pathlib.Path(self.directory.name)
+        patchers = [
+            mock.patch.object(constants, 'STOCK_DATABASE', path / 'stock.json'),
+            mock.patch.object(constants, 'STOCK_LIST_HASH_PATH', path / 'stock_list_hash.json'),
+            mock.patch('pandas.read_excel', side_effect=self.read_excel),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # The crawled files are always the same.
+        crawler_patcher = mock.patch('crawler.HttpCrawler')
+        crawler_class = crawler_patcher.start()
+        self.addCleanup(crawler_patcher.stop)
+        crawler_class.return_value.__enter__.return_value.crawl_stock_lists.return_value = self.HASHES
+        self.read_files = 0
+        self.service = Service(read_only=True, serve=False)
+        self.service.database = TinyDatabase()
+        self.service.database.upsert_many([
+            Stock(id='600000', pinyin='PFYH', name='浦发银行', qlib_id='SH600000', listing_date='1999-11-10'),
+            Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001', delisted=True, delisted_date='2022-09-09'),
+        ])
+
+    def tearDown(self) -> None:
+        self.service.database.close()
+        self.directory.cleanup()
+
+    def read_excel(self, path, dtype):
+        self.read_files += 1
+        if path == constants.SH_STOCK_LIST_PATH:
+            return pd.DataFrame([['600000', '浦发银行', '19991110']], columns=['A股代码', '证券简称', '上市日期'])
+        return pd.DataFrame([['000001', '平安银行', '1991-04-03']], columns=['A股代码', 'A股简称', 'A股上市日期'])
+
+    def test_relisted(self):
+        self.service.load_stock_list()
+        stock = self.service.database.search('000001')
+        self.assertFalse(stock.delisted)
+        self.assertIsNone(stock.delisted_date)
+
+    def test_skip_unchanged(self):
+        self.service.load_stock_list()
+        self.assertEqual(self.read_files, 2)
+        self.service.load_stock_list()
+        self.assertEqual(self.read_files, 2)
+
+        # The files are loaded again if the database doesn't match them, though the files are not changed.
+        self.service.database.mark_delisted(['600000'])
+        self.service.load_stock_list()
+        self.assertEqual(self.read_files, 4)
+        self.assertFalse(self.service.database.search('600000').delisted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+import context
+from trading_calendar import TradingCalendar
+
+
+class TestTradingCalendar(unittest.TestCase):
+    """
+    Tests for the trading day arithmetic.
+    """
+
+    def setUp(self) -> None:
+        # 2022-09-12 is the Mid-Autumn Festival, and 2022-09-10 and 2022-09-11 are weekend.
+        self.calendar = TradingCalendar(['2022-09-06', '2022-09-07', '2022-09-08', '2022-09-09', '2022-09-13', '2022-09-14'])
+
+    def test_latest(self):
+        self.assertEqual(self.calendar.latest('2022-09-09'), '2022-09-09')
+        self.assertEqual(self.calendar.latest('2022-09-12'), '2022-09-09')
+        self.assertEqual(self.calendar.latest('2022-12-31'), '2022-09-14')
+        self.assertIsNone(self.calendar.latest('2022-09-05'))
+
+    def test_shift(self):
+        self.assertEqual(self.calendar.shift('2022-09-09', 1), '2022-09-13')
+        self.assertEqual(self.calendar.shift('2022-09-12', -2), '2022-09-07')
+        self.assertEqual(self.calendar.shift('2022-09-08', 0), '2022-09-08')
+        # Clamped to the first trading day.
+        self.assertEqual(self.calendar.shift('2022-09-07', -5), '2022-09-06')
+        # Weekdays are counted as trading days after the calendar.
+        self.assertEqual(self.calendar.shift('2022-09-13', 3), '2022-09-16')
+        self.assertEqual(self.calendar.shift('2022-09-14', 10), '2022-09-28')
+
+    def test_between(self):
+        self.assertEqual(self.calendar.between('2022-09-08', '2022-09-13'), ['2022-09-08', '2022-09-09', '2022-09-13'])
+        self.assertEqual(self.calendar.between('2022-09-10', '2022-09-12'), [])
+        self.assertEqual(self.calendar.between('2022-01-01', '2022-09-06'), ['2022-09-06'])
+
+
+if __name__ == '__main__':
+    unittest.main()
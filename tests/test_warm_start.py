@@ -0,0 +1,89 @@
+import datetime
+import json
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import context
+import constants
+from fakes import FakeDatabase
+from prediction_store import PredictionStore
+from price_matrix import PriceMatrix
+from service import Service
+from snapshot import Snapshot
+from stock import Stock
+
+
+class TestWarmStart(unittest.TestCase):
+    """
+    Tests for starting the service from the saved snapshot.
+    """
+
+    STOCKS = [
+        Stock(id='600000', pinyin='PFYH', name='浦发银行', qlib_id='SH600000'),
+        Stock(id='000001', pinyin='PAYH', name='平安银行', qlib_id='SZ000001'),
+    ]
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.directory.name, 'snapshots')
+        today = datetime.date.today()
+        self.dates = [date.strftime('%Y-%m-%d') for date in pd.bdate_range(end=today - datetime.timedelta(days=1), periods=60)]
+        self.stores = [self.build_store(version, prediction) for version, prediction in enumerate([0.05, 0.1])]
+        self.prices = PriceMatrix(self.dates, [stock.qlib_id for stock in self.STOCKS], np.ones((len(self.dates), 2), dtype=np.float32))
+        Snapshot((today - datetime.timedelta(days=1)).strftime('%Y-%m-%d'), self.STOCKS, self.prices, self.stores[0]).save(self.snapshot_path)
+
+        self.opened = threading.Event()
+        patcher = mock.patch.object(constants, 'SNAPSHOT_PATH', self.snapshot_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def build_store(self, version: int, prediction: float) -> PredictionStore:
+        store = PredictionStore(os.path.join(self.directory.name, f'store-{version}'))
+        index = pd.MultiIndex.from_product([pd.to_datetime(self.dates), [stock.qlib_id for stock in self.STOCKS]], names=['datetime', 'instrument'])
+        store.update(pd.Series(prediction, index=index))
+        return store
+
+    def open_data_sources(self, service: Service) -> None:
+        # Hold the refresh till the saved snapshot is checked.
+        self.opened.wait(10)
+        service.database = FakeDatabase(self.STOCKS)
+        service.prediction_store = self.stores[1]
+
+    def test_warm_start(self):
+        with mock.patch.object(Service, '_open_data_sources', autospec=True, side_effect=self.open_data_sources), \
+                mock.patch.object(Service, 'load_prices', return_value=self.prices):
+            service = Service(warm_start=True)
+            # The saved snapshot is served while the data is reloaded in background.
+            self.assertEqual(service.get_refresh_status()['status'], 'running')
+            self.assertEqual(list(json.loads(service.get_history_and_predict_result('600000', self.dates[-1]))['predict'].values()), [1.05])
+            self.opened.set()
+            with service.refresh_lock:
+                pass
+
+        self.assertEqual(service.get_refresh_status()['status'], 'succeeded')
+        self.assertEqual(list(json.loads(service.get_history_and_predict_result('600000', self.dates[-1]))['predict'].values()), [1.1])
+        # The reconciled snapshot is saved for the next start.
+        self.assertEqual(Snapshot.load(self.snapshot_path).date, service.snapshot.date)
+
+    def test_results_cached_on_demand(self):
+        service = Service(read_only=True)
+        self.assertEqual(service.snapshot.responses, {})
+        today = datetime.date.today().strftime('%Y-%m-%d')
+        result = service.get_history_and_predict_result('000001', today)
+        self.assertEqual(service.snapshot.responses, {'000001': result})
+        self.assertEqual(service.get_history_and_predict_result('000001', today), result)
+        # Results of past dates are not cached.
+        service.get_history_and_predict_result('600000', self.dates[-10])
+        self.assertNotIn('600000', service.snapshot.responses)
+
+
+if __name__ == '__main__':
+    unittest.main()